@@ -0,0 +1,145 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+The cook of a backtest as a graph of stages, each of which keeps its
+outputs keyed by a fingerprint of its inputs, so that a stage is only
+recomputed when something it depends on has changed:
+{{{
+feed + recipe config  -> ingredients   oRecipe.dMakeIngredients
+ingredients           -> dishes        oRecipe.dApplyRecipe
+dishes + chef         -> oven          OTBackTest.oMakeOven
+}}}
+The feed is known by the fingerprint of the file that it was read from,
+as in the IngredientCache, which is a lookup by the memory of its arrays,
+not a pass over them; a feed that was not read from a file is hashed.
+The recipe config is fingerprinted by its values, all but the [sweep]
+section, which only back sweep reads. The servings and the summary are then cached in
+the ChefsOven that the oven stage keeps.
+
+Going back to parameters that were cooked before takes nothing but a
+lookup: each stage keeps its last iCookCacheEntries outputs, from the
+[backtest] section of OTCmd2.ini. The outputs that are written to the
+omlette are rewritten when a kept output replaces another one there.
+"""
+
+import sys
+import hashlib
+from collections import OrderedDict
+
+from OpenTrader.IngredientCache import oINGREDIENT_CACHE
+
+lSTAGES = ['ingredients', 'dishes', 'oven']
+
+def gNormalize(gParams):
+    """
+    gParams as nested tuples, with the items of dictionaries sorted,
+    so that equal parameters have the same repr.
+    """
+    if isinstance(gParams, dict):
+        return tuple([(sKey, gNormalize(gParams[sKey])) for sKey in sorted(gParams.keys())])
+    if isinstance(gParams, (list, tuple,)):
+        return tuple([gNormalize(gElt) for gElt in gParams])
+    return gParams
+
+def sParamsFingerprint(gParams):
+    return hashlib.md5(repr(gNormalize(gParams))).hexdigest()
+
+class CookGraph(object):
+    """
+    The outputs of each of lSTAGES, by their keys, in the order of least
+    recently used; there is one graph for all of the omlettes, oCOOK_GRAPH.
+    """
+
+    def __init__(self, iEntries=8):
+        self.iEntries = iEntries
+        self._dStages = OrderedDict([(sStage, OrderedDict()) for sStage in lSTAGES])
+        self.dHits = OrderedDict([(sStage, 0) for sStage in lSTAGES])
+        self.dMisses = OrderedDict([(sStage, 0) for sStage in lSTAGES])
+
+    def sStageKey(self, sStage, lInputs):
+        return "%s-%s" % (sStage, sParamsFingerprint([sStage] + list(lInputs)),)
+
+    def tGet(self, sStage, sKey, oMake):
+        """
+        The output of sStage for sKey, which is oMake() if it is not kept,
+        and whether it was kept, as (gOutput, bKept). An error message
+        string from oMake is returned but not kept, so it is made again.
+        """
+        dOutputs = self._dStages[sStage]
+        if sKey in dOutputs:
+            self.dHits[sStage] += 1
+            gOutput = dOutputs.pop(sKey)
+            dOutputs[sKey] = gOutput
+            return (gOutput, True,)
+        self.dMisses[sStage] += 1
+        gOutput = oMake()
+        if isinstance(gOutput, basestring):
+            return (gOutput, False,)
+        dOutputs[sKey] = gOutput
+        while len(dOutputs) > max(1, self.iEntries):
+            dOutputs.popitem(last=False)
+        return (gOutput, False,)
+
+    def sIngredientsKey(self, mFeedOhlc, oRecipe):
+        oConfigObj = oRecipe.oConfig()
+        dConfig = dict([(sSect, oConfigObj[sSect]) for sSect in oConfigObj.keys()
+                        if sSect != 'sweep'])
+        return self.sStageKey('ingredients', [oINGREDIENT_CACHE.sFingerprint(mFeedOhlc),
+                                              oRecipe.sName, dConfig])
+
+    def tIngredients(self, dFeeds, oRecipe, oOm):
+        """
+        Make the ingredients of the recipe from the feeds, as
+        oRecipe.dMakeIngredients does; returns (dIngredients, sKey).
+        """
+        sKey = self.sIngredientsKey(dFeeds['mFeedOhlc'], oRecipe)
+        dIngredients, bKept = self.tGet('ingredients', sKey,
+                                        lambda: oRecipe.dMakeIngredients(dFeeds))
+        oRecipe.dIngredients = dIngredients
+        if bKept and oOm.dStageKeys.get('ingredients') != sKey:
+            # dMakeIngredients writes the ingredients that the dishes are made from
+            for sName in getattr(oRecipe, 'lRequiredDishesParams', []):
+                if sName in dIngredients:
+                    oOm.vAppendHdf('recipe/ingredients/' +sName, dIngredients[sName])
+        oOm.dStageKeys['ingredients'] = sKey
+        return (dIngredients, sKey,)
+
+    def tDishes(self, dFeeds, oRecipe, oOm):
+        """
+        Apply the recipe to its ingredients, as oRecipe.dApplyRecipe does;
+        returns (dDishes, sKey).
+        """
+        dIngredients, sIngredientsKey = self.tIngredients(dFeeds, oRecipe, oOm)
+        sKey = self.sStageKey('dishes', [sIngredientsKey])
+        dDishes, bKept = self.tGet('dishes', sKey, oRecipe.dApplyRecipe)
+        return (dDishes, sKey,)
+
+    def oCook(self, dFeeds, oRecipe, oChefModule, oOm, oFd=sys.stdout):
+        """
+        Cook the recipe by the chef as OTBackTest.oPyBacktestCook does,
+        from the stages that have changed. Returns an error message string
+        on failure; a ChefsOven on success.
+        """
+        from OpenTrader.OTBackTest import oMakeOven, vAppendDishesHdf
+        dDishes, sDishesKey = self.tDishes(dFeeds, oRecipe, oOm)
+        sKey = self.sStageKey('oven', [sDishesKey, oChefModule.sChef])
+        oBt, bKept = self.tGet('oven', sKey,
+                               lambda: oMakeOven(dDishes, oRecipe, oChefModule, oOm, oFd=oFd))
+        if isinstance(oBt, basestring):
+            return oBt
+        if oOm.dStageKeys.get('oven') != sKey:
+            vAppendDishesHdf(dDishes, oChefModule, oOm)
+        oOm.dStageKeys['oven'] = sKey
+        return oBt
+
+    def vClear(self):
+        for dOutputs in self._dStages.values():
+            dOutputs.clear()
+
+    def dStats(self):
+        return OrderedDict([(sStage, OrderedDict([('iKept', len(self._dStages[sStage])),
+                                                  ('iHits', self.dHits[sStage]),
+                                                  ('iMisses', self.dMisses[sStage])]))
+                            for sStage in lSTAGES])
+
+oCOOK_GRAPH = CookGraph()
@@ -0,0 +1,457 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+One shared cache for all of the feeds that are kept in memory:
+pandas DataFrames and Series, numpy arrays, or dictionaries of them.
+
+The cache has a budget in bytes, and when the entries in it add up
+to more than that, the least recently used entries are evicted.
+The module dictionaries that used to hold feeds are now views of it,
+each with its own namespace of keys:
+{{{
+PandasMt4.dDF_OHLC           - ohlc
+oFEED_REGISTRY               - registry
+PandasMt4.dDF_RAW1MIN        - raw1min
+OTPpnAmgc.dOHLC_CACHE_DF     - plot
+backtester.dFEED_CACHE       - feed
+oINGREDIENT_CACHE            - ingredients
+}}}
+The budget is set by iFeedCacheMb in the [feed] section of OTCmd2.ini.
+The same DataFrame is often held under more than one key, say as a feed
+and in the registry, so the bytes of each array are only counted once,
+and only freed when the last entry that holds them is evicted. The
+current feed of the backtester is pinned, so that it is never evicted.
+
+The feeds read from files are registered by the fingerprint of the
+file contents in oFEED_REGISTRY, so that a file is only read once,
+whatever symbol, timeframe or year it is asked for under, and two
+files are never confused because they were given the same names.
+The registered feeds are made read-only, and are known by the memory
+of their arrays, so that the IngredientCache and the CookGraph can key
+them by the fingerprint of their file without hashing them.
+"""
+
+import sys
+import os
+import hashlib
+import weakref
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+def _aRootOf(aArray):
+    # the array that owns the memory of aArray, of which it may be a view
+    while isinstance(aArray.base, numpy.ndarray):
+        aArray = aArray.base
+    return aArray
+
+def dArraysOf(gVal, dArrays=None):
+    """
+    The arrays that hold the data in gVal, as {id(aArray): (aArray, iBytes)},
+    each counted once however many views of it gVal holds: memory-mapped
+    data counts at its full size, even if it has not been paged in.
+    """
+    if dArrays is None:
+        dArrays = dict()
+    if isinstance(gVal, pandas.DataFrame):
+        dArraysOf(gVal.index.values, dArrays)
+        for sColumn in gVal.columns:
+            dArraysOf(gVal[sColumn].values, dArrays)
+    elif isinstance(gVal, pandas.Series):
+        dArraysOf(gVal.index.values, dArrays)
+        dArraysOf(gVal.values, dArrays)
+    elif isinstance(gVal, numpy.ndarray):
+        aRoot = _aRootOf(gVal)
+        dArrays[id(aRoot)] = (aRoot, aRoot.nbytes,)
+    elif isinstance(gVal, dict):
+        for gElt in gVal.values():
+            dArraysOf(gElt, dArrays)
+    elif isinstance(gVal, (list, tuple,)):
+        for gElt in gVal:
+            dArraysOf(gElt, dArrays)
+    return dArrays
+
+def iSizeOf(gVal):
+    """
+    The size in bytes of the data in gVal, as dArraysOf counts it.
+    """
+    return sum([iBytes for aArray, iBytes in dArraysOf(gVal).values()])
+
+def tArrayKey(aArray):
+    """
+    The memory that aArray views: the id of the array that owns it,
+    and the address, shape and strides of aArray in it.
+    """
+    return (id(_aRootOf(aArray)), aArray.__array_interface__['data'][0],
+            aArray.shape, aArray.strides,)
+
+def lFeedArrays(mFeed, lColumns=None):
+    """
+    The arrays of the index and of the columns lColumns (default all)
+    of the DataFrame mFeed, or of the index and values of the Series mFeed.
+    """
+    if isinstance(mFeed, pandas.Series):
+        return [mFeed.index.values, mFeed.values]
+    if lColumns is None:
+        lColumns = list(mFeed.columns)
+    return [mFeed.index.values] + [mFeed[sColumn].values for sColumn in lColumns]
+
+def _lChainOf(aArray):
+    # aArray, the arrays that it is a view of, and the array that owns the memory
+    lChain = [aArray]
+    while isinstance(lChain[-1].base, numpy.ndarray):
+        lChain.append(lChain[-1].base)
+    return lChain
+
+def bReadOnly(lArrays):
+    """
+    True if none of lArrays from lFeedArrays, or the arrays that they are
+    views of, can be written: all but the first, that of the index,
+    which pandas does not change in place.
+    """
+    for aArray in lArrays[1:]:
+        for aElt in _lChainOf(aArray):
+            if aElt.flags.writeable:
+                return False
+    return True
+
+def vMakeReadOnly(mFeed):
+    """
+    Make the arrays of the values of the DataFrame or Series mFeed read-only,
+    so that it cannot be changed in place: it is shared by reference, and
+    it is known by its arrays in an ArrayMemo. Its index is immutable.
+    """
+    for aArray in lFeedArrays(mFeed)[1:]:
+        # from the owner down, as the views of a read-only array are read-only
+        for aElt in reversed(_lChainOf(aArray)):
+            aElt.flags.writeable = False
+
+class ArrayMemo(object):
+    """
+    Values memoized by the memory of a list of arrays, as tArrayKey gives it.
+    They are forgotten when an array that owns that memory is freed,
+    so that other arrays that come to be at the same address are not
+    mistaken for it.
+    """
+
+    def __init__(self):
+        # (tArrayKey, ...) -> gVal
+        self._dValues = dict()
+        # id(aRoot) -> weakref to aRoot
+        self._dRefs = dict()
+
+    def get(self, lArrays, gDefault=None):
+        return self._dValues.get(tuple([tArrayKey(aArray) for aArray in lArrays]),
+                                 gDefault)
+
+    def __setitem__(self, lArrays, gVal):
+        tKey = tuple([tArrayKey(aArray) for aArray in lArrays])
+        for aArray, tArray in zip(lArrays, tKey):
+            iId = tArray[0]
+            if iId not in self._dRefs:
+                self._dRefs[iId] = weakref.ref(_aRootOf(aArray),
+                                               lambda oRef, iId=iId: self._vForget(iId))
+        self._dValues[tKey] = gVal
+
+    def _vForget(self, iId):
+        self._dRefs.pop(iId, None)
+        for tKey in self._dValues.keys():
+            if iId in [tArray[0] for tArray in tKey]:
+                del self._dValues[tKey]
+
+    def __len__(self):
+        return len(self._dValues)
+
+    def vClear(self):
+        self._dValues.clear()
+        self._dRefs.clear()
+
+class FeedCache(object):
+    """
+    A least recently used cache with a budget in bytes: 0 is unlimited.
+    The entry most recently added, and the pinned entries, are never
+    evicted, even if they are bigger than the budget on their own.
+    The hits and misses are counted by get, which is how the feed
+    readers check if they need to read a feed; the ``in`` test does
+    not count.
+    """
+
+    def __init__(self, iMaxBytes=0):
+        self.iMaxBytes = iMaxBytes
+        # key -> (gVal, lArrayIds, iBytes) in the order of least recently used
+        self._dEntries = OrderedDict()
+        # id(aArray) -> [iEntries, iBytes, aArray] of the arrays that the
+        # entries hold: aArray is kept so that its id is not reused
+        self._dArrays = dict()
+        self._setPinned = set()
+        self.iBytes = 0
+        self.iHits = 0
+        self.iMisses = 0
+        self.iEvictions = 0
+
+    def vSetBudget(self, iMaxBytes):
+        self.iMaxBytes = int(iMaxBytes)
+        self.vEvict()
+
+    def __contains__(self, gKey):
+        return gKey in self._dEntries
+
+    def __getitem__(self, gKey):
+        tEntry = self._dEntries.pop(gKey)
+        self._dEntries[gKey] = tEntry
+        return tEntry[0]
+
+    def get(self, gKey, gDefault=None):
+        if gKey not in self._dEntries:
+            self.iMisses += 1
+            return gDefault
+        self.iHits += 1
+        return self[gKey]
+
+    def __setitem__(self, gKey, gVal):
+        if gKey in self._dEntries:
+            self._vRemove(gKey)
+        dArrays = dArraysOf(gVal)
+        for iId, (aArray, iBytes) in dArrays.items():
+            lCount = self._dArrays.get(iId)
+            if lCount is None:
+                self._dArrays[iId] = [1, iBytes, aArray]
+                self.iBytes += iBytes
+            else:
+                lCount[0] += 1
+        self._dEntries[gKey] = (gVal, dArrays.keys(),
+                                sum([iBytes for aArray, iBytes in dArrays.values()]),)
+        self.vEvict()
+
+    def _vRemove(self, gKey):
+        gVal, lIds, iBytes = self._dEntries.pop(gKey)
+        for iId in lIds:
+            lCount = self._dArrays[iId]
+            lCount[0] -= 1
+            if lCount[0] == 0:
+                del self._dArrays[iId]
+                self.iBytes -= lCount[1]
+
+    def __delitem__(self, gKey):
+        self._vRemove(gKey)
+        self._setPinned.discard(gKey)
+
+    def __len__(self):
+        return len(self._dEntries)
+
+    def __iter__(self):
+        return iter(self._dEntries.keys())
+
+    def keys(self):
+        return self._dEntries.keys()
+
+    def vPin(self, gKey):
+        """Never evict gKey, until it is unpinned or deleted."""
+        self._setPinned.add(gKey)
+
+    def vUnpin(self, gKey):
+        self._setPinned.discard(gKey)
+        self.vEvict()
+
+    def vEvict(self):
+        if self.iMaxBytes <= 0 or not self._dEntries:
+            return
+        gNewest = next(reversed(self._dEntries))
+        for gKey in self._dEntries.keys():
+            if self.iBytes <= self.iMaxBytes:
+                break
+            if gKey == gNewest or gKey in self._setPinned:
+                continue
+            self._vRemove(gKey)
+            self.iEvictions += 1
+
+    def vClear(self, sNamespace=None):
+        if sNamespace is None:
+            self._dEntries.clear()
+            self._dArrays.clear()
+            self._setPinned.clear()
+            self.iBytes = 0
+            return
+        for gKey in self._dEntries.keys():
+            if gKey[0] == sNamespace:
+                self.__delitem__(gKey)
+
+    def dStats(self):
+        # the bytes of a namespace are those of its entries, which may be
+        # shared with the entries of another namespace
+        dNamespaces = OrderedDict()
+        for gKey, (gVal, lIds, iBytes) in self._dEntries.items():
+            sNamespace = gKey[0] if isinstance(gKey, tuple) else ''
+            iEntries, iTotal = dNamespaces.get(sNamespace, (0, 0,))
+            dNamespaces[sNamespace] = (iEntries + 1, iTotal + iBytes,)
+        return OrderedDict([('iEntries', len(self._dEntries)),
+                            ('iBytes', self.iBytes),
+                            ('iMaxBytes', self.iMaxBytes),
+                            ('iPinned', len(self._setPinned)),
+                            ('iHits', self.iHits),
+                            ('iMisses', self.iMisses),
+                            ('iEvictions', self.iEvictions),
+                            ('dNamespaces', dNamespaces)])
+
+    def oView(self, sNamespace):
+        return FeedCacheView(self, sNamespace)
+
+class FeedCacheView(object):
+    """
+    A dictionary-like view of the entries of a FeedCache in one namespace.
+    """
+
+    def __init__(self, oCache, sNamespace):
+        self.oCache = oCache
+        self.sNamespace = sNamespace
+
+    def __contains__(self, sKey):
+        return (self.sNamespace, sKey,) in self.oCache
+
+    def __getitem__(self, sKey):
+        return self.oCache[(self.sNamespace, sKey,)]
+
+    def get(self, sKey, gDefault=None):
+        return self.oCache.get((self.sNamespace, sKey,), gDefault)
+
+    def __setitem__(self, sKey, gVal):
+        self.oCache[(self.sNamespace, sKey,)] = gVal
+
+    def __delitem__(self, sKey):
+        del self.oCache[(self.sNamespace, sKey,)]
+
+    def keys(self):
+        return [gKey[1] for gKey in self.oCache.keys()
+                if gKey[0] == self.sNamespace]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def clear(self):
+        self.oCache.vClear(self.sNamespace)
+
+    def vPin(self, sKey):
+        self.oCache.vPin((self.sNamespace, sKey,))
+
+    def vUnpin(self, sKey):
+        self.oCache.vUnpin((self.sNamespace, sKey,))
+
+def sFileFingerprint(sFile, iSamples=16, iSampleBytes=4096):
+    """
+    A fingerprint of the contents of sFile: its size and mtime, and a hash
+    of iSamples blocks of iSampleBytes spread evenly through the file.
+    Small files are hashed entirely.
+    """
+    oStat = os.stat(sFile)
+    iSize = oStat.st_size
+    oHash = hashlib.md5()
+    with open(sFile, 'rb') as oFd:
+        if iSize <= iSamples * iSampleBytes:
+            oHash.update(oFd.read())
+        else:
+            iStep = (iSize - iSampleBytes) // (iSamples - 1)
+            for i in range(iSamples):
+                oFd.seek(i * iStep)
+                oHash.update(oFd.read(iSampleBytes))
+    return "%d-%d-%s" % (iSize, int(oStat.st_mtime * 1000), oHash.hexdigest(),)
+
+class FeedRegistry(object):
+    """
+    The feeds read from files, keyed by the fingerprint of the file
+    contents; the symbol, timeframe and year that a feed was asked for
+    under, and the files it was read from, are kept as metadata.
+    The feeds themselves are held in the namespace sNamespace of a
+    FeedCache, so they are evicted like any other feed, and the same
+    DataFrame is shared by reference by everyone who reads the file.
+    As it is shared, it is made read-only, and the fingerprints of it and
+    of each of its columns are kept in oMemo, by the memory of its arrays.
+    """
+
+    def __init__(self, oCache, sNamespace='registry'):
+        self.oFeeds = oCache.oView(sNamespace)
+        self.oMemo = ArrayMemo()
+        # sFingerprint -> OrderedDict(lFiles=[], lNames=[(sSymbol, sTimeFrame, sYear)])
+        self.dMetadata = OrderedDict()
+        # sFile -> (iSize, fMtime, sFingerprint) so unchanged files are not rehashed
+        self._dFingerprints = dict()
+
+    def sFingerprint(self, sFile):
+        sFile = os.path.abspath(sFile)
+        oStat = os.stat(sFile)
+        tStamp = self._dFingerprints.get(sFile)
+        if tStamp and tStamp[:2] == (oStat.st_size, oStat.st_mtime,):
+            return tStamp[2]
+        sFingerprint = sFileFingerprint(sFile)
+        self._dFingerprints[sFile] = (oStat.st_size, oStat.st_mtime, sFingerprint,)
+        return sFingerprint
+
+    def get(self, sFile, gDefault=None):
+        """
+        The feed read from a file with the same contents as sFile, or gDefault.
+        """
+        return self.oFeeds.get(self.sFingerprint(sFile), gDefault)
+
+    def vRegister(self, sFile, gVal, sSymbol="", sTimeFrame="", sYear="",
+                  bReplace=False):
+        """
+        Register gVal as the feed read from sFile, unless there is one
+        already: bReplace to replace it, say by a copy in another dtype.
+        """
+        sFingerprint = self.sFingerprint(sFile)
+        if bReplace or sFingerprint not in self.oFeeds:
+            self.oFeeds[sFingerprint] = gVal
+            if isinstance(gVal, pandas.DataFrame):
+                self.vMemoFeed(sFingerprint, gVal)
+        self.vAddMetadata(sFingerprint, sFile, sSymbol, sTimeFrame, sYear)
+
+    def vMemoFeed(self, sFingerprint, mFeed):
+        """
+        Make the DataFrame mFeed read from the file with the fingerprint
+        sFingerprint read-only, and keep the fingerprints of it and of
+        its columns, which are in the dtype that it was registered in.
+        """
+        vMakeReadOnly(mFeed)
+        lDtypes = [str(mFeed[sColumn].dtype) for sColumn in mFeed.columns]
+        self.oMemo[lFeedArrays(mFeed)] = "%s-%s" % (sFingerprint, ','.join(lDtypes),)
+        for sColumn, sDtype in zip(mFeed.columns, lDtypes):
+            self.oMemo[lFeedArrays(mFeed, [sColumn])] = "%s-%s-%s" % (sFingerprint, sColumn,
+                                                                     sDtype,)
+
+    def vAddMetadata(self, sFingerprint, sFile, sSymbol="", sTimeFrame="", sYear=""):
+        dMeta = self.dMetadata.setdefault(sFingerprint,
+                                          OrderedDict([('lFiles', []), ('lNames', [])]))
+        sFile = os.path.abspath(sFile)
+        if sFile not in dMeta['lFiles']:
+            dMeta['lFiles'].append(sFile)
+        tName = (sSymbol, sTimeFrame, sYear,)
+        if tName not in dMeta['lNames']:
+            dMeta['lNames'].append(tName)
+
+    def lFind(self, sSymbol=None, sTimeFrame=None, sYear=None):
+        """
+        The fingerprints of the feeds registered under the given names:
+        the names that are None match anything.
+        """
+        lRetval = []
+        for sFingerprint, dMeta in self.dMetadata.items():
+            for tName in dMeta['lNames']:
+                if (sSymbol is None or tName[0] == sSymbol) and \
+                   (sTimeFrame is None or tName[1] == sTimeFrame) and \
+                   (sYear is None or tName[2] == sYear):
+                    lRetval.append(sFingerprint)
+                    break
+        return lRetval
+
+    def dStats(self):
+        lFingerprints = self.oFeeds.keys()
+        return OrderedDict([('iFeeds', len(lFingerprints)),
+                            ('dFeeds', OrderedDict([
+                                (sFingerprint, self.dMetadata.get(sFingerprint))
+                                for sFingerprint in lFingerprints]))])
+
+oFEED_CACHE = FeedCache()
+oFEED_REGISTRY = FeedRegistry(oFEED_CACHE)
@@ -0,0 +1,158 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+A cache of the indicators that recipes make their ingredients from,
+so that the same indicator on the same feed is only computed once,
+however many recipes, or sweep combinations, ask for it.
+
+The indicators are keyed by (sFingerprint, sIndicator, sColumn, tParams),
+and held in the namespace 'ingredients' of the FeedCache oFEED_CACHE,
+so they are evicted with the feeds, within the budget of iFeedCacheMb.
+sFingerprint is that of the file of the feed, if it was registered in
+oFEED_REGISTRY, which is a lookup; otherwise it is a hash of the index
+and the column(s) sColumn of the feed.
+
+The cumulative sum of each column is kept, so a simple moving average
+of any window is one subtraction of it from itself shifted, with no
+rolling pass over the window:
+{{{
+from OpenTrader.IngredientCache import oINGREDIENT_CACHE
+rShortMa = oINGREDIENT_CACHE.rSMA(mFeedOhlc, 'O', 50)
+rAtr = oINGREDIENT_CACHE.gIndicator(mFeedOhlc, 'talib.ATR', 'HLC', (14,), oFun)
+}}}
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from OpenTrader.FeedCache import oFEED_CACHE, oFEED_REGISTRY, ArrayMemo, \
+     lFeedArrays, bReadOnly
+
+def sFrameFingerprint(mFeed, lColumns=None):
+    """
+    A fingerprint of the contents of the DataFrame or Series mFeed:
+    its index and every one of the values of its columns lColumns
+    (default all). A feed that is changed anywhere in them, even in place,
+    has another fingerprint.
+    """
+    if isinstance(mFeed, pandas.DataFrame):
+        if lColumns is None:
+            lColumns = list(mFeed.columns)
+    else:
+        lColumns = [mFeed.name]
+    lArrays = lFeedArrays(mFeed, lColumns)
+    oHash = hashlib.md5()
+    oHash.update(repr((len(mFeed), lColumns,)))
+    for aArray in lArrays:
+        oHash.update(str(aArray.dtype))
+        if aArray.dtype == object:
+            # the bytes of an object array are its pointers
+            oHash.update(repr(aArray.tolist()))
+        else:
+            oHash.update(numpy.ascontiguousarray(aArray).view('uint8'))
+    return "%d-%s" % (len(mFeed), oHash.hexdigest(),)
+
+def lColumnsOf(mFeed, sColumn):
+    """
+    The columns of the DataFrame mFeed that sColumn names: itself,
+    or one column for each of its letters, as in 'HLC'; None for all.
+    """
+    if sColumn is None or not isinstance(mFeed, pandas.DataFrame):
+        return None
+    if sColumn in mFeed.columns:
+        return [sColumn]
+    if all([sLetter in mFeed.columns for sLetter in sColumn]):
+        return list(sColumn)
+    return None
+
+class IngredientCache(object):
+    """
+    The indicators computed on feeds, held in the namespace sNamespace
+    of a FeedCache. A feed registered in oRegistry is known by the memory
+    of its arrays, in the memo of the registry; any other feed is hashed
+    by sFrameFingerprint, in only the columns that are asked for. The hash
+    is only kept in the memo if the arrays are read-only, so that a feed
+    changed in place is not mistaken for the one it was.
+    """
+
+    def __init__(self, oCache, sNamespace='ingredients', oRegistry=None):
+        self.oIngredients = oCache.oView(sNamespace)
+        self.oMemo = oRegistry.oMemo if oRegistry is not None else ArrayMemo()
+
+    def sFingerprint(self, mFeed, sColumn=None):
+        """
+        The fingerprint of the column(s) sColumn of mFeed (default all),
+        and of its index.
+        """
+        lColumns = lColumnsOf(mFeed, sColumn)
+        lArrays = lFeedArrays(mFeed, lColumns)
+        sFingerprint = self.oMemo.get(lArrays)
+        if sFingerprint is None:
+            sFingerprint = sFrameFingerprint(mFeed, lColumns)
+            if bReadOnly(lArrays):
+                self.oMemo[lArrays] = sFingerprint
+        return sFingerprint
+
+    def gIndicator(self, mFeed, sIndicator, sColumn, tParams, oFun):
+        """
+        The indicator sIndicator with the parameters tParams of the
+        column(s) sColumn of mFeed: it is oFun(mFeed, *tParams) if it
+        is not in the cache already.
+        """
+        tKey = (self.sFingerprint(mFeed, sColumn), sIndicator, sColumn, tuple(tParams),)
+        gVal = self.oIngredients.get(tKey)
+        if gVal is None:
+            gVal = oFun(mFeed, *tParams)
+            self.oIngredients[tKey] = gVal
+        return gVal
+
+    def tCumsum(self, mFeed, sColumn):
+        """
+        The cumulative sum of the column sColumn of mFeed, less its first
+        value so that the sums stay small, as (fBase, aCumsum) where aCumsum
+        starts with a 0: the sum of the rows i..j-1 is aCumsum[j] - aCumsum[i],
+        plus (j - i) * fBase. aCumsum is None if the column has NaNs,
+        which a cumulative sum would spread to every row after them.
+        """
+        def tMakeCumsum(mFeed):
+            aValues = mFeed[sColumn].values.astype('float64')
+            if len(aValues) == 0 or numpy.isnan(aValues).any():
+                return (0.0, None,)
+            fBase = aValues[0]
+            aCumsum = numpy.empty(len(aValues) + 1, dtype='float64')
+            aCumsum[0] = 0.0
+            numpy.cumsum(aValues - fBase, out=aCumsum[1:])
+            return (fBase, aCumsum,)
+        return self.gIndicator(mFeed, 'cumsum', sColumn, (), tMakeCumsum)
+
+    def rSMA(self, mFeed, sColumn, iWindow):
+        """
+        The simple moving average over iWindow rows of the column sColumn
+        of mFeed, as pandas.rolling_mean(mFeed[sColumn], iWindow) gives it,
+        from the cumulative sum of the column.
+        """
+        assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+        def rMakeSMA(mFeed, iWindow):
+            fBase, aCumsum = self.tCumsum(mFeed, sColumn)
+            if aCumsum is None:
+                return pandas.rolling_mean(mFeed[sColumn], iWindow)
+            aSma = numpy.empty(len(mFeed), dtype='float64')
+            aSma[:iWindow - 1] = numpy.nan
+            aSma[iWindow - 1:] = (aCumsum[iWindow:] - aCumsum[:-iWindow]) / iWindow + fBase
+            return pandas.Series(aSma, index=mFeed.index, name=sColumn)
+        return self.gIndicator(mFeed, 'SMA', sColumn, (iWindow,), rMakeSMA)
+
+    def vClear(self):
+        self.oIngredients.clear()
+
+    def dStats(self):
+        dIndicators = OrderedDict()
+        for tKey in self.oIngredients.keys():
+            dIndicators[tKey[1]] = dIndicators.get(tKey[1], 0) + 1
+        return OrderedDict([('iIngredients', len(self.oIngredients)),
+                            ('dIndicators', dIndicators)])
+
+oINGREDIENT_CACHE = IngredientCache(oFEED_CACHE, oRegistry=oFEED_REGISTRY)
@@ -0,0 +1,119 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Exponential smoothing as a first order linear filter,
+y[i] = (1 - fAlpha) * y[i-1] + fAlpha * x[i],
+computed over whole arrays rather than a Python loop over the prices:
+with scipy.signal.lfilter if scipy is installed, or else in numpy,
+a block of bars at a time.
+
+The EMA is this filter with fAlpha = 2 / (iWindow + 1), and Wilder's
+smoothing, of the RSI and the ATR, is this filter with fAlpha = 1 / iWindow.
+They are used by OTPpnAmgc to chart the MACD and the RSI, and can be used
+by recipes on millions of bars.
+"""
+
+import numpy
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+# the decay over a block of the numpy filter is at least exp(-fMAX_BLOCK_EXP)
+fMAX_BLOCK_EXP = 100.0
+
+def aLinearRecursionNumpy(aX, fAlpha, fInit):
+    """
+    The filter of aLinearRecursion, in numpy: within a block of bars,
+    y[j] = fDecay**(j+1) * y[-1] + fAlpha * sum(fDecay**(j-k) * x[k] for k <= j),
+    which is a cumulative sum once the x[k] are scaled by fDecay**-(k+1).
+    The blocks are short enough that these scales do not overflow.
+    """
+    fDecay = 1.0 - fAlpha
+    aY = numpy.empty(len(aX), dtype='float64')
+    if fDecay <= 0.0:
+        aY[:] = aX
+        return aY
+    iBlock = len(aX)
+    if fDecay < 1.0:
+        iBlock = max(1, min(len(aX), int(fMAX_BLOCK_EXP / -numpy.log(fDecay))))
+    aPowers = fDecay ** numpy.arange(1, iBlock + 1)
+    fPrev = fInit
+    for iStart in range(0, len(aX), iBlock):
+        aBlock = aX[iStart:iStart + iBlock]
+        aPow = aPowers[:len(aBlock)]
+        aSum = numpy.cumsum(aBlock / aPow) * aPow * fAlpha
+        aY[iStart:iStart + len(aBlock)] = aSum + aPow * fPrev
+        fPrev = aY[iStart + len(aBlock) - 1]
+    return aY
+
+def aLinearRecursion(aX, fAlpha, fInit):
+    """
+    y[i] = (1 - fAlpha) * y[i-1] + fAlpha * x[i] for the array aX,
+    where y[-1] is fInit.
+    """
+    aX = numpy.asarray(aX, dtype='float64')
+    if len(aX) == 0:
+        return aX.copy()
+    if lfilter is not None:
+        aY, aZf = lfilter([fAlpha], [1.0, fAlpha - 1.0], aX,
+                          zi=[(1.0 - fAlpha) * fInit])
+        return aY
+    return aLinearRecursionNumpy(aX, fAlpha, fInit)
+
+def aSmooth(aValues, iWindow, fAlpha):
+    """
+    The exponential smoothing by fAlpha of aValues, seeded with the mean
+    of its first iWindow values after any leading NaNs: the result is NaN
+    until then, as TA-Lib's is.
+    """
+    aValues = numpy.asarray(aValues, dtype='float64')
+    aRetval = numpy.empty(len(aValues), dtype='float64')
+    aRetval[:] = numpy.nan
+    aValid = numpy.flatnonzero(~numpy.isnan(aValues))
+    if len(aValid) == 0:
+        return aRetval
+    iSeed = aValid[0] + iWindow - 1
+    if iSeed >= len(aValues):
+        return aRetval
+    aRetval[iSeed] = aValues[aValid[0]:iSeed + 1].mean()
+    aRetval[iSeed + 1:] = aLinearRecursion(aValues[iSeed + 1:], fAlpha, aRetval[iSeed])
+    return aRetval
+
+def aEMA(aValues, iWindow):
+    """
+    The exponential moving average of aValues over iWindow bars.
+    """
+    assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+    return aSmooth(aValues, iWindow, 2.0 / (iWindow + 1))
+
+def aWilder(aValues, iWindow):
+    """
+    Wilder's smoothing of aValues over iWindow bars.
+    """
+    assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+    return aSmooth(aValues, iWindow, 1.0 / iWindow)
+
+def aRSI(aPrices, iWindow=14):
+    """
+    The relative strength index of aPrices, as the loop in the old
+    OTPpnAmgc.rsiFunc computed it: the averages up and down are seeded
+    with the sums of the first iWindow + 1 changes divided by iWindow,
+    and Wilder-smoothed from there on; the first iWindow values are
+    those of the seed.
+    """
+    aPrices = numpy.asarray(aPrices, dtype='float64')
+    aDeltas = numpy.diff(aPrices)
+    aSeed = aDeltas[:iWindow + 1]
+    fUp = aSeed[aSeed >= 0].sum() / iWindow
+    fDown = -aSeed[aSeed < 0].sum() / iWindow
+    # the change into bar i, for the bars i >= iWindow
+    aChanges = aDeltas[iWindow - 1:]
+    aUp = aLinearRecursion(numpy.where(aChanges > 0, aChanges, 0.0), 1.0 / iWindow, fUp)
+    aDown = aLinearRecursion(numpy.where(aChanges > 0, 0.0, -aChanges), 1.0 / iWindow, fDown)
+    aRsi = numpy.zeros_like(aPrices)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        aRsi[:iWindow] = 100. - 100. / (1. + fUp / fDown)
+        aRsi[iWindow:] = 100. - 100. / (1. + aUp / aDown)
+    return aRsi
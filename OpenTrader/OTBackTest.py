@@ -8,6 +8,7 @@ The Timeframe is the period in minutes: e.g. 1 60 240 1440
 from __future__ import print_function
 import sys, os
 import traceback
+from collections import OrderedDict
 
 from PandasMt4 import oPreprocessOhlc
 
@@ -26,9 +27,17 @@ def oPyBacktestCook(dFeeds, oRecipe, oChefModule, oOm, oFd=sys.stdout):
     Returns an error message string on failure; a Cooker instance on success.
     """
     #? Why is dFeeds unused?
-    from collections import OrderedDict
-
     dDishes = oRecipe.dApplyRecipe()
+    oBt = oMakeOven(dDishes, oRecipe, oChefModule, oOm, oFd=oFd)
+    if not isinstance(oBt, basestring):
+        vAppendDishesHdf(dDishes, oChefModule, oOm)
+    return oBt
+
+def oMakeOven(dDishes, oRecipe, oChefModule, oOm, oFd=sys.stdout):
+    """
+    The ChefsOven of the dishes that dApplyRecipe returned, or an error
+    message string if there are no signals.
+    """
     rBuy = rCover = dDishes['rBuy']
     rSell = rShort = dDishes['rSell']
 
@@ -57,25 +66,64 @@ def oPyBacktestCook(dFeeds, oRecipe, oChefModule, oOm, oFd=sys.stdout):
     # *signal_fields* specifies names of signal Series that backtester will
     # attempt to extract from dataobj.
     # the keys of sSataObj must be in the list and order of signal_fields
-    dChefParams = OrderedDict(
-        # derive these from the series
-        signal_fields=('buy', 'sell', 'short', 'cover'),
-        open_label='O',
-        close_label='C',
-        )
     oBt = oChefModule.ChefsOven(mOhlc, dDataObj, name=oOm.oRecipe.sName,
-                                **dChefParams)
+                                **dMakeChefParams())
+    return oBt
+
+def dMakeChefParams():
+    # derive these from the series
+    return OrderedDict(signal_fields=('buy', 'sell', 'short', 'cover'),
+                       open_label='O',
+                       close_label='C')
+
+def vAppendDishesHdf(dDishes, oChefModule, oOm):
+    rBuy = rCover = dDishes['rBuy']
+    rSell = rShort = dDishes['rSell']
     #? mOhlc
     oOm.vAppendHdf('recipe/dishes/rBuy', rBuy)
     oOm.vAppendHdf('recipe/dishes/rSell', rSell)
     oOm.vAppendHdf('recipe/dishes/rShort', rShort)
     oOm.vAppendHdf('recipe/dishes/rCover', rCover)
+    dChefParams = dMakeChefParams()
     # FixMe:
-    dChefParams['sName'] = oOm.oChefModule.sChef
+    dChefParams['sName'] = oChefModule.sChef
     dChefParams['sUrl'] = 'file://' +oChefModule.__file__
     oOm.vSetMetadataHdf('recipe/dishes', dChefParams)
 
-    return oBt
+# the key in the omlette of each serving of a ChefsOven
+dSERVINGS_HDF = OrderedDict([('signals', 'recipe/servings/mSignals'),
+                             ('trades', 'recipe/servings/mTrades'),
+                             ('positions', 'recipe/servings/rPositions'),
+                             ('equity', 'recipe/servings/rEquity'),
+                             ('trade_price', 'recipe/servings/rTradePrice')])
+# the method of the recipe that makes each serving: init_pos defaults to 0
+dSERVINGS_RECIPE = dict(signals='mSignals', trades='mTrades',
+                        positions='rPositions', equity='rEquity')
+
+def gServe(oBt, sServing, oRecipe, oOm, oFd=sys.stdout):
+    """
+    The serving sServing of oBt, made by the recipe if it has not been
+    made in this cook, and written to the omlette if it is not there.
+    """
+    oMake = None
+    if sServing in dSERVINGS_RECIPE:
+        oMake = getattr(oRecipe, dSERVINGS_RECIPE[sServing])
+    gServing = oBt.gServing(sServing, oMake)
+    oFd.write('INFO:  bt.%s found: %d\n' % (sServing, len(gServing),))
+    sKey = dSERVINGS_HDF[sServing]
+    # the ChefsOven whose serving is in the omlette
+    if oOm.dStageKeys.get(sKey) is not oBt:
+        oOm.vAppendHdf(sKey, gServing)
+        oOm.dStageKeys[sKey] = oBt
+    return gServing
+
+def vServeReviews(oBt, oOm, oFd=sys.stdout):
+    if oOm.dStageKeys.get('recipe/servings') is not oBt:
+        oOm.vSetTitleHdf('recipe/servings', oOm.oChefModule.sChef)
+        #? Leave this as derived or store it? reviews?
+        oOm.vSetMetadataHdf('recipe/servings', oBt.dSummary())
+        oOm.dStageKeys['recipe/servings'] = oBt
+    oFd.write(oBt.sSummary())
 
 def vPlotEquityCurves(oBt, mOhlc, oChefModule,
                       sPeriod='W',
@@ -178,42 +226,20 @@ def oOmain(lArgv):
     dIngredientsParams = dict(dRecipeParams=dict())
     oRecipe.dMakeIngredients(dFeeds)
     assert oRecipe.dIngredients
+    oOm.vEndStageHdf()
 
     oBt = oPyBacktestCook(dFeeds, oRecipe, oChefModule, oOm)
     assert oBt is not None
     if isinstance(oBt, basestring):
         raise RuntimeError(oBt)
+    oOm.vEndStageHdf()
 
-    # this was the same as: oBt._mSignals = bt.mSignals() or oBt.signals
-    oBt._mSignals = oRecipe.mSignals(oBt)
-    oFd.write('INFO:  bt.signals found: %d\n' % len(oBt.signals))
-    oOm.vAppendHdf('recipe/servings/mSignals', oBt.signals)
-
-    # this was the same as: oBt._mTrades =  oBt.mTrades() or oBt.trades
-    oBt._mTrades = oRecipe.mTrades(oBt)
-    oFd.write('INFO:  bt.trades found: %d\n' % len(oBt.trades))
-    oOm.vAppendHdf('recipe/servings/mTrades', oBt.trades)
-
-    # this was the same as: oBt._rPositions = oBt.rPositions() or oBt.positions
-    oBt._rPositions = oRecipe.rPositions(oBt, init_pos=0)
-    oFd.write('INFO:  bt.positions found: %d\n' % len(oBt.positions))
-    oOm.vAppendHdf('recipe/servings/rPositions', oBt.positions)
-
-    # this was the same as: oBt._rEquity = oBt.rEquity() or oBt.equity
-    oBt._rEquity = oRecipe.rEquity(oBt)
-    oFd.write('INFO:  bt.equity found: %d\n' % len(oBt.equity))
-    oOm.vAppendHdf('recipe/servings/rEquity', oBt.equity)
-
-    # oFd.write('INFO:  bt.rTradePrice() found: %d\n' % len(oBt.rTradePrice()))
-    oFd.write('INFO:  bt.trade_price found: %d\n' % len(oBt.trade_price))
-    oOm.vAppendHdf('recipe/servings/rTradePrice', oBt.trade_price)
-
-    oOm.vSetTitleHdf('recipe/servings', oOm.oChefModule.sChef)
-    #? Leave this as derived or store it? reviews?
-    oOm.vSetMetadataHdf('recipe/servings', oBt.dSummary())
-    oFd.write(oBt.sSummary())
+    for sServing in dSERVINGS_HDF.keys():
+        gServe(oBt, sServing, oRecipe, oOm, oFd=oFd)
+    vServeReviews(oBt, oOm, oFd=oFd)
 
     oOm.vSetMetadataHdf('recipe', dict(oRecipe.oConfig))
+    oOm.vEndStageHdf()
 
     if oOptions.bPlotEquity:
         mOhlc = oRecipe.dIngredients['mOhlc']
@@ -137,6 +137,13 @@ class CmdLineApp(Cmd, PLogMixin):
             if sRecipesDir not in sys.path:
                 sys.path.insert(0, sRecipesDir)
             
+        if 'feed' in oConfig and oConfig['feed'].get('iFeedCacheMb', 0):
+            from OpenTrader.FeedCache import oFEED_CACHE
+            oFEED_CACHE.vSetBudget(int(oConfig['feed']['iFeedCacheMb']) * 1024 * 1024)
+        if 'backtest' in oConfig and oConfig['backtest'].get('iCookCacheEntries', 0):
+            from OpenTrader.CookGraph import oCOOK_GRAPH
+            oCOOK_GRAPH.iEntries = int(oConfig['backtest']['iCookCacheEntries'])
+
         sMt4Dir = oConfig['OTCmd2']['sMt4Dir']
         if sMt4Dir:
             sMt4Dir = os.path.expanduser(os.path.expandvars(sMt4Dir))
@@ -173,7 +180,7 @@ class CmdLineApp(Cmd, PLogMixin):
         elif len(lArgs) == 5:
             sSect = str(lArgs[2])
             sKey = str(lArgs[3])
-            sVal = str(lArgs[5])
+            sVal = str(lArgs[4])
             oType = type(dConfig(sSect, sKey))
             gRetval = dConfig(sSect, sKey, oType(sVal))
             self.vOutput(repr(self.G(gRetval)))
@@ -381,6 +388,10 @@ class CmdLineApp(Cmd, PLogMixin):
             except (KeyboardInterrupt,):
                 # impatient
                 pass
+        if hasattr(self, 'oOm') and self.oOm:
+            # write what the omlette has queued, or its writer is writing
+            sys.stdout.write("DEBUG: Closing the omlette...\n")
+            self.oOm.vClose()
 
 # FixMe: should do_exit call vAtexit ?
 
@@ -37,37 +37,16 @@ from matplotlib.finance import candlestick_ochl
 from matplotlib import pylab
 
 from PandasMt4 import oReadMt4Csv, oPreprocessOhlc
+from OpenTrader.FeedCache import oFEED_CACHE
+from OpenTrader.LinearFilter import aEMA, aRSI
 
 # matplotlib.rcParams.update({'font.size': 11})
 
-dOHLC_CACHE_DF = {}
+dOHLC_CACHE_DF = oFEED_CACHE.oView('plot')
 
 def rsiFunc(prices, n=14):
-    deltas = np.diff(prices)
-    seed = deltas[:n+1]
-    up = seed[seed>=0].sum()/n
-    down = -seed[seed<0].sum()/n
-    rs = up/down
-    rsi = np.zeros_like(prices)
-    rsi[:n] = 100. - 100./(1.+rs)
-
-    for i in range(n, len(prices)):
-        delta = deltas[i-1] # cause the diff is 1 shorter
-
-        if delta>0:
-            upval = delta
-            downval = 0.
-        else:
-            upval = 0.
-            downval = -delta
-
-        up = (up*(n-1) + upval)/n
-        down = (down*(n-1) + downval)/n
-
-        rs = up/down
-        rsi[i] = 100. - 100./(1.+rs)
-
-    return rsi
+    # Wilder's smoothing as a linear filter, not a loop over the prices
+    return aRSI(prices, iWindow=n)
 
 def nSMA(values, window):
     weigths = np.repeat(1.0, window)/window
@@ -76,11 +55,8 @@ def nSMA(values, window):
 
 ########EMA CALC ADDED############
 def ExpMovingAverage(values, window):
-    weights = np.exp(np.linspace(-1., 0., window))
-    weights /= weights.sum()
-    a =  np.convolve(values, weights, mode='full')[:len(values)]
-    a[:window] = a[window]
-    return a
+    # the recursive EMA, NaN until the first window values have been seen
+    return aEMA(values, window)
 
 
 def computeMACD(x, slow=26, fast=12):
@@ -124,7 +100,9 @@ def vGraphData(sSymbol, date, closep, highp, lowp, openp, volume,
                bUseTalib=False,
                ):
     if bUseTalib:
-        import talib
+        # TA-Lib if it is installed, or else its numpy versions
+        from OpenTrader.indicators import oBackend
+        talib = oBackend()
 
     x = 0
     y = len(date)
@@ -282,7 +260,7 @@ def oParseOptions(sUsage):
     oArgParser = ArgumentParser(description=sUsage)
     oArgParser.add_argument('-u', '--use_talib',
                             dest='bUseTalib', action='store_true', default=False,
-                            help='Use Ta-lib for chart operations')
+                            help='Use Ta-lib, or OpenTrader.indicators without it, for chart operations')
     oArgParser.add_argument("--iShortSMA", action="store",
                             dest="iShortSMA", type=int, default=10)
     oArgParser.add_argument("--iLongSMA", action="store",
@@ -0,0 +1,286 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Sweep the parameters of a recipe: backtest it on one feed for every
+combination of the parameter values in the [sweep] section of its
+ini file, over a pool of processes, and tabulate the performance
+summary of each combination.
+
+The [sweep] section has a subsection for each recipe section to vary,
+with a list of values, or a 'START:STOP:STEP' range, for each key:
+{{{
+[sweep]
+[[rShortMa]]
+iShortMa = '10:60:10'
+[[rLongMa]]
+iLongMa = [100, 150, 200]
+}}}
+The feed is written once to numpy files in shared memory (/dev/shm if
+there is one), and the workers memory-map them, rather than each being
+sent a pickled copy of it.
+
+Recipes with a dApplyRecipeBatch can instead be swept in one process
+by mSweepRecipeBatch, which backtests all of the combinations at once.
+"""
+
+import sys, os
+import itertools
+import multiprocessing
+import shutil
+import tempfile
+import time
+import traceback
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from OpenTrader.PandasMt4 import vWriteFeedArrays, oReadFeedArrays
+
+sSHARED_MEMORY_DIR = '/dev/shm'
+
+# the state of a worker process, set up by vSweepWorkerInit
+_dWORKER = {}
+
+def lParseSweepValues(gVal):
+    """
+    The values of one swept parameter: a list of them, or
+    a string 'START:STOP:STEP' for the range START <= value < STOP.
+    """
+    if isinstance(gVal, basestring):
+        lParts = gVal.split(':')
+        assert len(lParts) in (2, 3), \
+               "ERROR: a sweep range must be 'START:STOP:STEP', not " +repr(gVal)
+        oType = float if '.' in gVal else int
+        lParts = [oType(sElt) for sElt in lParts]
+        gStart, gStop = lParts[:2]
+        gStep = lParts[2] if len(lParts) == 3 else 1
+        assert gStep > 0, "ERROR: a sweep range needs a positive step: " +repr(gVal)
+        lRetval = []
+        gElt = gStart
+        while gElt < gStop:
+            lRetval.append(gElt)
+            gElt += gStep
+        return lRetval
+    if isinstance(gVal, (list, tuple,)):
+        return list(gVal)
+    return [gVal]
+
+def lSweepGrid(dSweep):
+    """
+    The combinations of the parameter values in the [sweep] section dSweep,
+    as a list of OrderedDicts of {(sSection, sKey): gValue}.
+    """
+    lKeys = []
+    lValues = []
+    for sSect in dSweep.keys():
+        assert isinstance(dSweep[sSect], dict), \
+               "ERROR: [sweep] must have a [[SECTION]] for each section, not " +sSect
+        for sKey, gVal in dSweep[sSect].items():
+            lKeys.append((sSect, sKey,))
+            lValues.append(lParseSweepValues(gVal))
+    return [OrderedDict(zip(lKeys, tCombo)) for tCombo in itertools.product(*lValues)]
+
+def sParamName(tKey):
+    return '.'.join(tKey)
+
+def dFlattenSummary(dSummary, sPrefix=''):
+    """
+    Flatten the nested dictionaries of dPerformanceSummary into one
+    OrderedDict with keys like 'performance.profit'.
+    """
+    dRetval = OrderedDict()
+    for sKey in sorted(dSummary.keys()):
+        gVal = dSummary[sKey]
+        if isinstance(gVal, dict):
+            dRetval.update(dFlattenSummary(gVal, sPrefix + sKey + '.'))
+        else:
+            dRetval[sPrefix + sKey] = gVal
+    return dRetval
+
+def sShareFeed(mFeedOhlc):
+    """
+    Write the feed to numpy files in a new directory in shared memory,
+    for the workers to memory-map with oReadFeedArrays. Returns the directory,
+    which the caller must remove with shutil.rmtree.
+    """
+    sParent = sSHARED_MEMORY_DIR if os.path.isdir(sSHARED_MEMORY_DIR) else None
+    sDir = tempfile.mkdtemp(prefix='OTSweep', dir=sParent)
+    sDtype = str(mFeedOhlc.dtypes.iloc[0])
+    vWriteFeedArrays(sDir, mFeedOhlc, sDtype=sDtype)
+    return sDir
+
+def oSweepCook(oRecipe, oChefModule, mFeedOhlc):
+    """
+    Cook the recipe on the feed as oPyBacktestCook does, with the
+    oMakeOven of OTBackTest, but into the oFd of the recipe rather than
+    an omlette, returning the ChefsOven, or None if no signals.
+    """
+    from OpenTrader.OTBackTest import oMakeOven
+    oRecipe.dMakeIngredients(dict(mFeedOhlc=mFeedOhlc))
+    dDishes = oRecipe.dApplyRecipe()
+    oBt = oMakeOven(dDishes, oRecipe, oChefModule, oRecipe.oOm, oFd=oRecipe.oFd)
+    if isinstance(oBt, basestring):
+        return None
+    return oBt
+
+def oMakeRecipe(sRecipe, dConfig, oFd):
+    """
+    Make an instance of the recipe sRecipe, with the configuration dConfig
+    over that of its ini file, and an omlette with no HDF file.
+    """
+    from OpenTrader.Omlettes.Omlette import Omlette
+    oOm = Omlette(oFd=oFd)
+    oRecipe = oOm.oAddRecipe(sRecipe)
+    oRecipe.oFd = oFd
+    oConfigObj = oRecipe.oConfig()
+    for sSect, dSect in dConfig.items():
+        if not isinstance(dSect, dict): continue
+        if sSect not in oConfigObj:
+            oConfigObj[sSect] = {}
+        for sKey, gVal in dSect.items():
+            oConfigObj[sSect][sKey] = gVal
+    return oRecipe
+
+def vSweepWorkerInit(lSysPath, sFeedDir, sRecipe, sChef, dConfig):
+    """
+    Set up a worker process: attach to the shared feed, and make
+    its own instances of the recipe and the chef.
+    """
+    for sPath in lSysPath:
+        if sPath not in sys.path:
+            sys.path.append(sPath)
+    oFd = open(os.devnull, 'w')
+    _dWORKER['mFeedOhlc'] = oReadFeedArrays(sFeedDir)
+    _dWORKER['oRecipe'] = oMakeRecipe(sRecipe, dConfig, oFd)
+    _dWORKER['oChefModule'] = __import__(sChef)
+
+def tSweepWorker(tJob):
+    """
+    Backtest one combination of lSweepGrid; this is called in a worker process.
+    Returns a tuple of (iCombo, dMetrics, fSeconds, sError)
+    where sError is "" on success.
+    """
+    iCombo, dParams = tJob
+    oRecipe = _dWORKER['oRecipe']
+    fStart = time.time()
+    dMetrics = OrderedDict()
+    sError = ""
+    try:
+        for (sSect, sKey), gVal in dParams.items():
+            oRecipe.oConfig(sSect, sKey, gVal)
+        oBt = oSweepCook(oRecipe, _dWORKER['oChefModule'], _dWORKER['mFeedOhlc'])
+        if oBt is None:
+            sError = "no signals"
+        else:
+            dMetrics = dFlattenSummary(oBt.dSummary())
+    except Exception as e:
+        sError = "%s: %s" % (e.__class__.__name__, str(e),)
+        sys.stderr.write(traceback.format_exc())
+    return (iCombo, dMetrics, time.time() - fStart, sError,)
+
+def mSweepRecipe(sRecipe, mFeedOhlc, dConfig, lGrid=None, sChef='PybacktestChef',
+                 iWorkers=0, oFd=sys.stdout):
+    """
+    Backtest the recipe sRecipe with the configuration dConfig on the feed
+    mFeedOhlc for every combination in lGrid (default: lSweepGrid of the
+    [sweep] section of dConfig), over a pool of iWorkers processes
+    (default: the number of CPUs). Returns a DataFrame with a row for each
+    combination, of its parameters, the metrics of dPerformanceSummary,
+    and sError, which is "" unless the combination failed.
+    """
+    if lGrid is None:
+        assert 'sweep' in dConfig, \
+               "ERROR: no [sweep] section in the config of " +sRecipe
+        lGrid = lSweepGrid(dConfig['sweep'])
+    assert lGrid, "ERROR: nothing to sweep"
+    if not iWorkers or iWorkers <= 0:
+        iWorkers = multiprocessing.cpu_count()
+    iWorkers = min(iWorkers, len(lGrid))
+    oFd.write("INFO: sweeping %d combinations on %d workers\n" % (len(lGrid), iWorkers,))
+
+    fStart = time.time()
+    lResults = []
+    sFeedDir = sShareFeed(mFeedOhlc)
+    try:
+        oPool = multiprocessing.Pool(iWorkers, vSweepWorkerInit,
+                                     (sys.path[:], sFeedDir, sRecipe, sChef, dConfig,))
+        try:
+            for tResult in oPool.imap_unordered(tSweepWorker, enumerate(lGrid)):
+                iCombo, dMetrics, fSeconds, sError = tResult
+                sParams = ', '.join(["%s=%r" % (sParamName(tKey), gVal,)
+                                     for tKey, gVal in lGrid[iCombo].items()])
+                if sError:
+                    oFd.write("WARN: %s failed after %.2f seconds: %s\n" % (
+                        sParams, fSeconds, sError,))
+                else:
+                    oFd.write("INFO: %s swept in %.2f seconds\n" % (sParams, fSeconds,))
+                lResults.append(tResult)
+            oPool.close()
+        except:
+            oPool.terminate()
+            raise
+        finally:
+            oPool.join()
+    finally:
+        shutil.rmtree(sFeedDir, ignore_errors=True)
+    oFd.write("INFO: swept %d combinations in %.2f seconds\n" % (len(lResults),
+                                                               time.time() - fStart,))
+
+    lRows = []
+    for iCombo, dMetrics, fSeconds, sError in sorted(lResults):
+        dRow = OrderedDict([(sParamName(tKey), gVal)
+                            for tKey, gVal in lGrid[iCombo].items()])
+        dRow.update(dMetrics)
+        dRow['sError'] = sError
+        lRows.append(dRow)
+    lColumns = []
+    for dRow in lRows:
+        lColumns += [sKey for sKey in dRow.keys()
+                     if sKey != 'sError' and sKey not in lColumns]
+    return pandas.DataFrame(lRows, columns=lColumns + ['sError'])
+
+def mSweepRecipeBatch(sRecipe, mFeedOhlc, dConfig, lGrid=None, sChef='PybacktestChef',
+                      oFd=sys.stdout):
+    """
+    mSweepRecipe in one process, in one vectorized pass over all of the
+    combinations, for the recipes that have a dApplyRecipeBatch: it is
+    dMakeIngredients and dApplyRecipe for every combination in lGrid at
+    once, and gives their signals as the columns of DataFrames, in the
+    order of lGrid. The chef's BatchChefsOven backtests them together.
+    The metrics are those of mBatchPerformanceSummary: the ones that need
+    resampling or a Monte Carlo simulation are only in mSweepRecipe.
+    The combinations with no buy or sell signals are marked in sError
+    with "no signals", as mSweepRecipe marks them.
+    """
+    if lGrid is None:
+        assert 'sweep' in dConfig, \
+               "ERROR: no [sweep] section in the config of " +sRecipe
+        lGrid = lSweepGrid(dConfig['sweep'])
+    assert lGrid, "ERROR: nothing to sweep"
+    oFd.write("INFO: sweeping %d combinations in one batch\n" % (len(lGrid),))
+
+    fStart = time.time()
+    oRecipe = oMakeRecipe(sRecipe, dConfig, oFd)
+    assert hasattr(oRecipe, 'dApplyRecipeBatch'), \
+           "ERROR: %s has no dApplyRecipeBatch to sweep in a batch: use back sweep run" % (
+        sRecipe,)
+    oChefModule = __import__(sChef)
+    dDishes = oRecipe.dApplyRecipeBatch(mFeedOhlc, lGrid)
+    mBuy = mCover = dDishes['mBuy']
+    mSell = mShort = dDishes['mSell']
+    dDataObj = OrderedDict(buy=mBuy, sell=mSell, short=mShort, cover=mCover)
+    oBt = oChefModule.BatchChefsOven(mFeedOhlc, dDataObj, name=oRecipe.sName,
+                                     signal_fields=('buy', 'sell', 'short', 'cover'),
+                                     open_label='O')
+    mMetrics = oBt.mSummary()
+    oFd.write("INFO: swept %d combinations in %.2f seconds\n" % (len(lGrid),
+                                                               time.time() - fStart,))
+
+    mParams = pandas.DataFrame([OrderedDict([(sParamName(tKey), gVal)
+                                             for tKey, gVal in dParams.items()])
+                                for dParams in lGrid])
+    mRetval = pandas.concat([mParams, mMetrics], axis=1)
+    aSignals = mBuy.values.any(axis=0) & mSell.values.any(axis=0)
+    mRetval['sError'] = numpy.where(aSignals, "", "no signals")
+    return mRetval
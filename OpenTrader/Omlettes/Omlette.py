@@ -15,28 +15,127 @@ import os
 from collections import OrderedDict
 import pandas
 
-from OpenTrader.PandasMt4 import oReadMt4Csv
+from OpenTrader.PandasMt4 import oReadMt4Csv, oReadMt4Hst, dReadMt4HstHeader
+from OpenTrader.FeedCache import oFEED_REGISTRY
+from OpenTrader.Omlettes.OmletteWriter import OmletteWriter, vRegisterOmlette
+
+# the formats of the HDF store puts, and when the puts are written: for
+# each put as it is made, at the end of each stage (see vEndStageHdf),
+# or when the omlette is closed, and whether they are written by a thread
+# (see OmletteWriter.py); set them in the [omlette] section of OTCmd2.ini
+lHDF_FORMATS = ['table', 'fixed']
+lHDF_FLUSHES = ['put', 'stage', 'close']
+
+# the compression of the HDF store, as in pandas.HDFStore
+lHDF_COMPLIBS = [None, 'zlib', 'lzo', 'bzip2', 'blosc']
+# the storage profiles of an omlette, by name: the layout of the puts, the
+# compression library and level of the store, and the rows of a table
+# that are written at a time (iChunksize) and that its chunk shape is
+# made for (iExpectedRows), 0 for the defaults of pandas. The [omlette.NAME]
+# sections of OTCmd2.ini override these, or add other profiles.
+dHDF_PROFILES = OrderedDict([
+    # no compression, and the fixed layout that is fastest to write and read
+    ('fast', dict(sHdfFormat='fixed', sComplib=None, iComplevel=0,
+                  iChunksize=0, iExpectedRows=0)),
+    # blosc compresses by about as much as zlib, at close to memory speed
+    ('compact', dict(sHdfFormat='table', sComplib='blosc', iComplevel=5,
+                     iChunksize=0, iExpectedRows=0)),
+    # the most compression that other HDF5 readers can read, in large chunks
+    ('archive', dict(sHdfFormat='table', sComplib='zlib', iComplevel=9,
+                     iChunksize=500000, iExpectedRows=5000000)),
+    ])
+lHDF_PROFILE_KEYS = ['sHdfFormat', 'sComplib', 'iComplevel', 'iChunksize', 'iExpectedRows']
 
 class Omlette(object):
     __fOmleteVersion__ = 1.0
     
-    def __init__(self, sHdfStore="", oFd=sys.stdout):
+    def __init__(self, sHdfStore="", oFd=sys.stdout,
+                 sHdfFormat='table', gHdfDataColumns=True, sHdfFlush='stage',
+                 bHdfThread=False, iHdfQueue=4,
+                 sComplib=None, iComplevel=0, iChunksize=0, iExpectedRows=0):
+        """
+        sHdfFormat is the format of the puts: 'table', which can be
+        selected with a where, or 'fixed', which is faster to write and read.
+        gHdfDataColumns are the columns of a table that a where can select
+        on: True for all of them, or a list of the column names.
+        sHdfFlush is when the puts are written: 'put' for each put as it is
+        made; 'stage' and 'close' queue them, with their metadata and titles,
+        and write the last put of each key in one batch with one flush,
+        at the end of each stage (vEndStageHdf), and at vCommitHdf and vClose.
+        bHdfThread writes them in an OmletteWriter thread, with at most
+        iHdfQueue batches waiting, rather than in the caller;
+        vWaitHdf waits for them, and vClose writes them all before closing.
+        sComplib, iComplevel, iChunksize and iExpectedRows are as in
+        dHDF_PROFILES; they are usually set from a profile by vSetHdfProfile.
+        """
+        assert sHdfFlush in lHDF_FLUSHES, \
+               "ERROR: sHdfFlush %r not in %r" % (sHdfFlush, lHDF_FLUSHES,)
+        self.vSetHdfProfile(dict(sHdfFormat=sHdfFormat, sComplib=sComplib,
+                                 iComplevel=iComplevel, iChunksize=iChunksize,
+                                 iExpectedRows=iExpectedRows))
+        self.gHdfDataColumns = gHdfDataColumns
+        self.sHdfFlush = sHdfFlush
+        self.bHdfThread = bool(bHdfThread)
+        self.iHdfQueue = iHdfQueue
+        self.oWriter = None
+        # the queued puts, metadata and titles, by key
+        self._dPendingData = OrderedDict()
+        self._dPendingMetadata = OrderedDict()
+        self._dPendingTitles = OrderedDict()
         self.oHdfStore = None
         self.oFd = oFd
         if sHdfStore:
             # ugly - active
-            self.oHdfStore = pandas.HDFStore(sHdfStore, mode='w')
+            self.oHdfStore = self.oOpenHdfStore(sHdfStore)
             self.oFd.write("INFO: hdf store" +self.oHdfStore.filename +'\n')
 
         self.oRecipe = None
         self.oChefModule = None
+        # what is in the HDF store: the CookGraph key of each stage,
+        # and the ChefsOven of each serving (see OTBackTest.gServe)
+        self.dStageKeys = dict()
+
+    def vSetHdfProfile(self, dProfile):
+        """
+        Set the storage of the HDF stores that are opened from now on
+        from dProfile, which is one of dHDF_PROFILES or a dictionary
+        of its keys; the keys that are not in dProfile are not changed.
+        """
+        for sKey in dProfile.keys():
+            assert sKey in lHDF_PROFILE_KEYS, \
+                   "ERROR: %r not in %r" % (sKey, lHDF_PROFILE_KEYS,)
+        if 'sHdfFormat' in dProfile:
+            assert dProfile['sHdfFormat'] in lHDF_FORMATS, \
+                   "ERROR: sHdfFormat %r not in %r" % (dProfile['sHdfFormat'], lHDF_FORMATS,)
+            self.sHdfFormat = dProfile['sHdfFormat']
+        if 'sComplib' in dProfile:
+            assert dProfile['sComplib'] in lHDF_COMPLIBS, \
+                   "ERROR: sComplib %r not in %r" % (dProfile['sComplib'], lHDF_COMPLIBS,)
+            self.sComplib = dProfile['sComplib']
+        if 'iComplevel' in dProfile:
+            assert 0 <= int(dProfile['iComplevel']) <= 9, \
+                   "ERROR: iComplevel not in 0..9: %r" % (dProfile['iComplevel'],)
+            self.iComplevel = int(dProfile['iComplevel'])
+        if 'iChunksize' in dProfile:
+            self.iChunksize = max(0, int(dProfile['iChunksize']))
+        if 'iExpectedRows' in dProfile:
+            self.iExpectedRows = max(0, int(dProfile['iExpectedRows']))
+
+    def oOpenHdfStore(self, sHdfStore):
+        if self.sComplib is None or self.iComplevel == 0:
+            return pandas.HDFStore(sHdfStore, mode='w')
+        return pandas.HDFStore(sHdfStore, mode='w',
+                               complib=self.sComplib, complevel=self.iComplevel)
 
     def oAddHdfStore(self, sHdfStore):
         if os.path.isabs(sHdfStore):
             assert os.path.isdir(os.path.dirname(sHdfStore)), \
                    "ERROR: directory not found: " +sHdfStore
-        self.oHdfStore = pandas.HDFStore(sHdfStore, mode='w')
+        # what is queued belongs in the store that it was queued for
+        self.vCommitHdf()
+        self.oHdfStore = self.oOpenHdfStore(sHdfStore)
         self.oFd.write("INFO: hdf store: " +self.oHdfStore.filename +'\n')
+        self.dStageKeys = dict()
         return self.oHdfStore
             
     def oRestore(self, sHdfStore):
@@ -47,23 +146,52 @@ class Omlette(object):
         
     # Is this an Omlette method? its generic and the use of self is tangential
     # It is because it adds components to the HDF fuke, which is the omlette.
-    def dGetFeedFrame(self, sCsvFile, sTimeFrame, sSymbol, sYear):
+    def dGetFeedFrame(self, sCsvFile, sTimeFrame, sSymbol, sYear, bUseCache=True,
+                      sDtype='float64'):
         dFeedParams = OrderedDict(sTimeFrame=sTimeFrame, sSymbol=sSymbol, sYear=sYear)
-        # PandasMt4.dDF_OHLC[sKey = sSymbol + sTimeFrame + sYear]
-        dFeedParams['mFeedOhlc'] = oReadMt4Csv(sCsvFile, **dFeedParams)
+        # FeedCache.oFEED_REGISTRY[fingerprint of sCsvFile], shared by reference
+        # served from the memory-mapped feed cache next to sCsvFile if valid
+        dFeedParams['mFeedOhlc'] = oReadMt4Csv(sCsvFile, bUseCache=bUseCache,
+                                               sDtype=sDtype, **dFeedParams)
         dFeedParams['open_label'] = 'O'
         dFeedParams['close_label'] = 'C'
         dFeedParams['sKey'] = sSymbol + sTimeFrame + sYear
         dFeedParams['sCsvFile'] = sCsvFile
+        dFeedParams['sFingerprint'] = oFEED_REGISTRY.sFingerprint(sCsvFile)
+
+        self.vAppendFeedHdf(dFeedParams)
+        return dFeedParams
+
+    def dGetHstFeedFrame(self, sHstFile, sTimeFrame="", sSymbol="", sYear="",
+                         sDtype='float64'):
+        """
+        Like dGetFeedFrame, but reading a Metatrader .hst history file,
+        whose prices are memory-mapped rather than parsed.
+        The symbol and timeframe default to those in the file header.
+        """
+        dHeader = dReadMt4HstHeader(sHstFile)
+        if not sSymbol: sSymbol = dHeader['sSymbol']
+        if not sTimeFrame: sTimeFrame = str(dHeader['iPeriod'])
+        dFeedParams = OrderedDict(sTimeFrame=sTimeFrame, sSymbol=sSymbol, sYear=sYear)
+        dFeedParams['mFeedOhlc'] = oReadMt4Hst(sHstFile, sDtype=sDtype, **dFeedParams)
+        dFeedParams['open_label'] = 'O'
+        dFeedParams['close_label'] = 'C'
+        dFeedParams['sKey'] = sSymbol + sTimeFrame + sYear
+        dFeedParams['sHstFile'] = sHstFile
+        dFeedParams['sFingerprint'] = oFEED_REGISTRY.sFingerprint(sHstFile)
+        dFeedParams['iDigits'] = dHeader['iDigits']
 
+        self.vAppendFeedHdf(dFeedParams)
+        return dFeedParams
+
+    def vAppendFeedHdf(self, dFeedParams):
         self.vAppendHdf('feed/mt4/' +dFeedParams['sKey'],
                         dFeedParams['mFeedOhlc'])
         dMetadata = dFeedParams.copy()
-        del dMetadata['mFeedOhlc']        
+        del dMetadata['mFeedOhlc']
         self.vSetMetadataHdf('feed/mt4/' +dFeedParams['sKey'], dMetadata)
         self.vSetTitleHdf('feed/mt4', 'Mt4')
         self.vSetTitleHdf('feed', 'Feeds')
-        return dFeedParams
     
     def oAddRecipe(self, sRecipe):
         if False:
@@ -99,7 +227,10 @@ class Omlette(object):
     def vSetTitleHdf(self, sKey, sData):
         oHdfStore = self.oHdfStore
         if oHdfStore is None: return
-        self.oHdfStore.get_node(sKey)._g_settitle(sData)
+        if self.sHdfFlush != 'put':
+            self._dPendingTitles[sKey] = sData
+            return
+        self._vWriteHdf(OrderedDict(), OrderedDict(), OrderedDict([(sKey, sData)]))
 
     def vSetMetadataHdf(self, sKey, gData):
         oHdfStore = self.oHdfStore
@@ -110,36 +241,133 @@ class Omlette(object):
         oHdfStore = self.oHdfStore
         if oHdfStore is None: return
         
+        dData = OrderedDict()
+        dMetadata = OrderedDict()
         if gData is None:
             # we need to check if the key exists
             pass
             # drop through
         # assert sCat in ['recipe', 'feed'], "ERROR: unrecognized category: " +sCat
         elif type(gData) in [pandas.Series, pandas.DataFrame, pandas.Panel]:
-            self.oFd.write("INFO: HDF putting " +sKey +'\n')
-            oHdfStore.put('/' +sKey, gData,
-                          format='table',
-                          data_columns=True)
-            oHdfStore.flush()
+            if self.sHdfFlush != 'put':
+                # only the last put of a key is written
+                self._dPendingData.pop(sKey, None)
+                self._dPendingData[sKey] = gData
+            else:
+                dData[sKey] = gData
         else:
             self.oFd.write("ERROR: unsupported datatype for %s: %r \n" % \
                            (sKey, type(gData),))
             return
         
-        if gMetaData is None:
-            return
         if type(gMetaData) in [dict, OrderedDict]:
-            # o = getattr(getattr(oHdfStore.root, sCat), sInst)
-            o = oHdfStore.get_node('/'+sKey)
-            o._v_attrs.metadata = [gMetaData]
-            oHdfStore.flush()
+            if self.sHdfFlush != 'put':
+                self._dPendingMetadata[sKey] = gMetaData
+            else:
+                dMetadata[sKey] = gMetaData
+        if dData or dMetadata:
+            self._vWriteHdf(dData, dMetadata, OrderedDict())
+
+    def _vWriteHdf(self, dData, dMetadata, dTitles):
+        """
+        Write a batch of puts, metadata and titles to the HDF store that
+        is open now, in the OmletteWriter if bHdfThread, else here.
+        """
+        oHdfStore = self.oHdfStore
+        def vWrite():
+            self._vWriteBatch(oHdfStore, dData, dMetadata, dTitles)
+        if not self.bHdfThread:
+            vWrite()
+            return
+        if self.oWriter is None or not self.oWriter.isAlive():
+            self.oWriter = OmletteWriter(iQueue=self.iHdfQueue, oFd=self.oFd)
+            self.oWriter.start()
+            vRegisterOmlette(self)
+        self.oWriter.vSubmit(vWrite)
+
+    def _vWriteBatch(self, oHdfStore, dData, dMetadata, dTitles):
+        for sKey, gData in dData.items():
+            self._vPutHdf(oHdfStore, sKey, gData)
+        for sKey, gMetaData in dMetadata.items():
+            self._vSetMetadataNode(oHdfStore, sKey, gMetaData)
+        for sKey, sData in dTitles.items():
+            oHdfStore.get_node(sKey)._g_settitle(sData)
+        oHdfStore.flush()
+
+    def _vPutHdf(self, oHdfStore, sKey, gData):
+        self.oFd.write("INFO: HDF putting " +sKey +'\n')
+        dKw = dict(format=self.sHdfFormat)
+        if self.sHdfFormat == 'table':
+            gDataColumns = self.gHdfDataColumns
+            if isinstance(gDataColumns, (list, tuple,)):
+                if isinstance(gData, pandas.DataFrame):
+                    gDataColumns = [sCol for sCol in gDataColumns if sCol in gData.columns]
+                else:
+                    gDataColumns = None
+            dKw['data_columns'] = gDataColumns
+            # the compression is that of the store
+            if self.iChunksize:
+                dKw['chunksize'] = self.iChunksize
+            if self.iExpectedRows:
+                dKw['expectedrows'] = max(self.iExpectedRows, len(gData))
+        oHdfStore.put('/' +sKey, gData, **dKw)
+
+    def _vSetMetadataNode(self, oHdfStore, sKey, gMetaData):
+        # o = getattr(getattr(oHdfStore.root, sCat), sInst)
+        o = oHdfStore.get_node('/'+sKey)
+        if o is None:
+            self.oFd.write("WARN: no HDF node for the metadata of " +sKey +'\n')
+            return
+        o._v_attrs.metadata = [gMetaData]
+
+    def vCommitHdf(self):
+        """
+        Write what is queued: the puts, then the metadata and titles of the
+        nodes that they make, with one flush. If bHdfThread, they are
+        handed to the writer, and may not be written yet on return.
+        """
+        oHdfStore = self.oHdfStore
+        if oHdfStore is None or not (self._dPendingData or self._dPendingMetadata or
+                                     self._dPendingTitles):
+            return
+        tBatch = (self._dPendingData, self._dPendingMetadata, self._dPendingTitles,)
+        self._dPendingData = OrderedDict()
+        self._dPendingMetadata = OrderedDict()
+        self._dPendingTitles = OrderedDict()
+        self._vWriteHdf(*tBatch)
+
+    def vWaitHdf(self):
+        """Wait until the writes that were handed to the writer are made."""
+        if self.oWriter is not None:
+            self.oWriter.vDrain()
+
+    def vEndStageHdf(self):
+        """The end of a stage of a backtest: commit, if sHdfFlush is 'stage'."""
+        if self.sHdfFlush == 'stage':
+            self.vCommitHdf()
 
     def vClose(self):
         if self.oHdfStore is None: return
+        # what is queued is all written, and the writer stopped, before the
+        # store is closed, even if a write fails; the first error is then raised
+        tError = None
+        try:
+            self.vCommitHdf()
+        except Exception:
+            tError = sys.exc_info()
+        if self.oWriter is not None:
+            oWriter, self.oWriter = self.oWriter, None
+            try:
+                oWriter.stop()
+            except Exception:
+                if tError is None:
+                    tError = sys.exc_info()
         if False:
             self.oFd.write("INFO: closing hdf " +repr(self.oHdfStore) +'\n')
         self.oHdfStore.close()
         self.oHdfStore = None
+        if tError is not None:
+            raise tError[0], tError[1], tError[2]
 
 def iMain():
     """
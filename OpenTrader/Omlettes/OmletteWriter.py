@@ -0,0 +1,103 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+A thread that makes the HDF writes of an Omlette, so that the cook
+and the command loop do not wait on them. The Omlette hands its batches
+of puts to the writer through a bounded queue: when iHdfQueue batches
+are waiting, the next one blocks until the writer has caught up, so that
+a long batch run cannot queue more frames than the memory can hold.
+
+The frames are handed over by reference, not copied: they must not be
+changed after they are put. What is queued is written before vClose
+returns. At exit, OTCmd2.vAtexit closes the omlette of the command loop,
+and vCloseOmlettes, which is registered with atexit, closes any other
+omlettes that are still open, as those of the scripts that do not go
+through OTCmd2.
+"""
+
+import sys
+import atexit
+import threading
+import traceback
+import weakref
+import Queue
+
+class OmletteWriter(threading.Thread):
+
+    def __init__(self, iQueue=4, oFd=sys.stdout):
+        threading.Thread.__init__(self, name='OmletteWriter')
+        # a daemon, so that a writer that is never stopped cannot hang the
+        # exit: the atexit handler drains it while daemons still run
+        self.daemon = True
+        self.oFd = oFd
+        self.oQueue = Queue.Queue(maxsize=max(1, iQueue))
+        # the exc_info of the first write that failed since the caller was
+        # last told, which is raised in the caller; the later writes are
+        # still made, as they are of other keys
+        self._tError = None
+        self.iFailed = 0
+        self._running = threading.Event()
+
+    def run(self):
+        self._running.set()
+        while True:
+            oJob = self.oQueue.get()
+            try:
+                if oJob is None:
+                    return
+                oJob()
+            except Exception:
+                self.iFailed += 1
+                if self._tError is None:
+                    self._tError = sys.exc_info()
+                self.oFd.write("ERROR: HDF write failed\n" +traceback.format_exc())
+            finally:
+                self.oQueue.task_done()
+
+    def vRaiseError(self):
+        tError = self._tError
+        if tError is None: return
+        self._tError = None
+        raise tError[0], tError[1], tError[2]
+
+    def vSubmit(self, oJob):
+        """
+        Queue oJob, a callable that makes the writes, blocking while
+        the queue is full; then raise the error of an earlier write, if any.
+        oJob is queued whether or not there was one.
+        """
+        assert self.isAlive(), "ERROR: the omlette writer is stopped"
+        self.oQueue.put(oJob)
+        self.vRaiseError()
+
+    def vDrain(self):
+        """Wait until all of the queued writes are made."""
+        if self.isAlive():
+            self.oQueue.join()
+        self.vRaiseError()
+
+    def stop(self):
+        """
+        Make the queued writes, then stop the thread; then raise the
+        error of a write, if any.
+        """
+        if self.isAlive():
+            self.oQueue.put(None)
+            self.join()
+        self.vRaiseError()
+
+# the omlettes that have a writer, so that they are closed at exit
+_oOMLETTES = weakref.WeakSet()
+
+def vRegisterOmlette(oOm):
+    _oOMLETTES.add(oOm)
+
+def vCloseOmlettes():
+    """Close the omlettes that are open, writing what they have queued."""
+    for oOm in list(_oOMLETTES):
+        try:
+            oOm.vClose()
+        except Exception, e:
+            sys.stderr.write("ERROR: closing the omlette: %s\n" % (str(e),))
+
+atexit.register(vCloseOmlettes)
@@ -16,10 +16,15 @@ from configobj import ConfigObj
 import pandas
 
 from OpenTrader.Omlettes.PybacktestChef import mExtractFrame
+from OpenTrader.PYBTParts import rSignalsToPositions, bBooleanSignals, rTradesToEquity
+
+lEQUITY_ENGINES = ['numpy', 'pandas']
 
 class Recipe(object):
     
     __fRecipeVersion__ = 1.0
+    # overridden by sEquityEngine in the [default] section of the ini file
+    sEquityEngine = 'numpy'
 
     def __init__(self, oOm=None, oFd=sys.stdout):
         self.oOm = oOm
@@ -54,7 +59,11 @@ class Recipe(object):
     def vReadIniFile(self):
         assert self.sIniFile, "ERROR: No INI file defined"
         sIniFile = self.sIniFile
-        if not os.path.isabs(sIniFile):
+        if not os.path.isabs(sIniFile) and self.sFile and \
+           os.path.isfile(os.path.join(os.path.dirname(self.sFile), sIniFile)):
+            # next to the recipe, in sRecipesDir
+            sIniFile = os.path.join(os.path.dirname(self.sFile), sIniFile)
+        elif not os.path.isabs(sIniFile):
             sIniFile = os.path.join(os.path.dirname(__file__), self.sIniFile)
         assert os.path.isfile(sIniFile)
         if os.path.isfile(sIniFile) and not self.oConfigObj:
@@ -108,7 +117,6 @@ class Recipe(object):
         assert m is not None
         return m.fillna(value=False)
     
-    # taken from pybacktest.parts.signals_to_positions
     def rPositions(self, oBt, init_pos=0,
                  mask=('Buy', 'Sell', 'Short', 'Cover')):
         # we need a portfolio manager
@@ -117,8 +125,19 @@ class Recipe(object):
         specified.
         WARNING: In production, override default zero value in init_pos with
         extreme caution.
+        This is vectorized by PYBTParts.rSignalsToPositions for boolean
+        signals; other signals are sized, so they go through the loop
+        of rPositionsIterrows.
         """
         mSignals = oBt.signals
+        if init_pos in (-1, 0, 1) and bBooleanSignals(mSignals, mask):
+            return rSignalsToPositions(mSignals, init_pos=init_pos, mask=mask)
+        return self.rPositionsIterrows(oBt, init_pos=init_pos, mask=mask)
+
+    # taken from pybacktest.parts.signals_to_positions
+    def rPositionsIterrows(self, oBt, init_pos=0,
+                           mask=('Buy', 'Sell', 'Short', 'Cover')):
+        mSignals = oBt.signals
         long_en, long_ex, short_en, short_ex = mask
         pos = init_pos
         rPosition = pandas.Series(0.0, index=mSignals.index)
@@ -151,17 +170,28 @@ class Recipe(object):
                "ERROR: Cant operate on signals and prices " + \
                "indexed as of different timezones"
         mTrades = pandas.DataFrame({'pos': p})
-        mTrades['price'] = rTradePrice
+        # the feed may be float32 (sFeedDtype): the equity is in float64
+        mTrades['price'] = rTradePrice.astype('float64')
         mTrades = mTrades.dropna()
         mTrades['vol'] = mTrades.pos.diff()
         # timestamp ('pos', 'price', 'vol')
         return mTrades.dropna()
 
-    # taken from pybacktest.backtest.trades_to_equity
     def rEquity(self, oBt):
         """
         Convert trades dataframe (cols [vol, price, pos]) to equity diff series
+        with the engine sEquityEngine: 'numpy' for PYBTParts.rTradesToEquity,
+        or 'pandas' for rEquityApply, which it replaces;
+        set it in the [default] section of the recipe's ini file.
         """
+        assert self.sEquityEngine in lEQUITY_ENGINES, \
+               "ERROR: sEquityEngine must be one of " +str(lEQUITY_ENGINES)
+        if self.sEquityEngine == 'pandas':
+            return self.rEquityApply(oBt)
+        return rTradesToEquity(oBt.trades)
+
+    # taken from pybacktest.backtest.trades_to_equity
+    def rEquityApply(self, oBt):
         mTrades = oBt.trades
 
         def _cmp_fn(x):
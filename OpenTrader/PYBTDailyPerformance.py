@@ -10,6 +10,10 @@ an equity differences Series.
 
 import pandas
 import numpy
+from collections import OrderedDict
+from pandas.lib import cache_readonly
+
+from OpenTrader.indicators.rolling import aRollingSum, aRollingMax
 
 
 def start(rEquity):
@@ -75,12 +79,46 @@ def mpi(rEquity):
 MPI = mpi
 
 
-def mcmdd(rEquity, runs=1000, quantile=0.99, array=False):
-    maxdds = [maxdd(rEquity.take(numpy.random.permutation(len(rEquity)))) for i in xrange(runs)]
+# the most elements of the (runs, trades) permutations that mcmdd makes at once
+iMCMDD_BATCH_ELEMENTS = 1 << 22
+
+def aMaxdds(aEquity, aPermutations):
+    """
+    The maxdd of aEquity in each order of the rows of aPermutations.
+    """
+    aCumsum = numpy.cumsum(aEquity[aPermutations], axis=1)
+    return (numpy.maximum.accumulate(aCumsum, axis=1) - aCumsum).max(axis=1)
+
+def mcmdd(rEquity, runs=1000, quantile=0.99, array=False,
+          batch_size=None, random_state=None):
+    """
+    The Monte-Carlo worst case drawdown: the quantile of the maxdd of
+    runs random permutations of the equity differences, computed a batch
+    of batch_size permutations at a time as one (batch_size, trades)
+    array; by default as many as fit in iMCMDD_BATCH_ELEMENTS.
+    random_state is a seed or a numpy.random.RandomState, for runs
+    that can be repeated; by default the global numpy.random.
+    """
+    aEquity = numpy.asarray(rEquity, dtype='float64')
+    iTrades = len(aEquity)
+    if random_state is None:
+        oRandom = numpy.random
+    elif isinstance(random_state, numpy.random.RandomState):
+        oRandom = random_state
+    else:
+        oRandom = numpy.random.RandomState(random_state)
+    if not batch_size:
+        batch_size = max(1, iMCMDD_BATCH_ELEMENTS // max(1, iTrades))
+    maxdds = numpy.empty(runs, dtype='float64')
+    for iStart in range(0, runs, batch_size):
+        iRuns = min(batch_size, runs - iStart)
+        # sorting random keys gives each row an independent permutation
+        aPermutations = numpy.argsort(oRandom.random_sample((iRuns, iTrades)), axis=1)
+        maxdds[iStart:iStart + iRuns] = aMaxdds(aEquity, aPermutations)
     if not array:
         return pandas.Series(maxdds).quantile(quantile)
     else:
-        return maxdds
+        return list(maxdds)
 
 
 def holding_periods(rEquity):
@@ -88,50 +126,310 @@ def holding_periods(rEquity):
     return pandas.Series(rEquity.index.to_datetime(), index=rEquity.index, dtype=object).diff().dropna()
 
 
-def dPerformanceSummary(equity_diffs, quantile=0.99, precision=4):
-    def force_quantile(series, q):
-        return sorted(series.values)[int(len(series) * q)]
-    rEquity = equity_diffs[equity_diffs != 0]
-    if getattr(rEquity.index, 'tz', None) is not None:
-        rEquity = rEquity.tz_convert(None)
-    if len(rEquity) == 0:
-        return {}
-    hold = holding_periods(equity_diffs)
-    return {
-        'backtest': {
-            'from': str(rEquity.index[0]),
-            'to': str(rEquity.index[-1]),
-            'days': (rEquity.index[-1] - rEquity.index[0]).days,
-            'trades': len(rEquity),
-            },
-        'exposure': {
-            'trades/month': round(rEquity.groupby(
-                    lambda x: (x.year, x.month)
-                    ).apply(lambda x: x[x != 0].count()).mean(), precision),
-            #'holding periods': {
-            #    'max': str(hold.max()),
-            #    'median': str(force_quantile(hold, 0.5)),
-            #    'min': str(hold.min()),
-            #    }
-            },
-        'performance': {
-            'profit': round(rEquity.sum(), precision),
-            'averages': {
-                'trade': round(rEquity.mean(), precision),
-                'gain': round(rEquity[rEquity > 0].mean(), precision),
-                'loss': round(rEquity[rEquity < 0].mean(), precision),
+# The rolling metrics are over windows of iWindow trades, as the summary's
+# are over all of them: each is computed for all of the windows in one pass
+# from running sums, so a long history costs no more than its whole-period metrics.
+
+def _aRollingMoments(aValues, aIn, iWindow):
+    """
+    The count, mean and sample standard deviation over each window of the
+    aValues where aIn, from the running sums of their deviations from
+    their overall mean, so that the sums of squares stay small.
+    """
+    aValues = numpy.asarray(aValues, dtype='float64')
+    fCenter = aValues[aIn].mean() if aIn.any() else 0.0
+    aDeviations = numpy.where(aIn, aValues - fCenter, 0.0)
+    aCount = aRollingSum(aIn.astype('float64'), iWindow)
+    aSum = aRollingSum(aDeviations, iWindow)
+    aSquares = aRollingSum(aDeviations ** 2, iWindow)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        aMean = aSum / aCount
+        aVar = (aSquares - aSum * aMean) / (aCount - 1)
+        aStd = numpy.sqrt(numpy.maximum(aVar, 0.0))
+        aStd[~(aCount >= 2)] = numpy.nan
+    return aCount, aMean + fCenter, aStd
+
+def rRollingSharpe(rEquity, iWindow=100):
+    aAll = numpy.ones(len(rEquity), dtype=bool)
+    aCount, aMean, aStd = _aRollingMoments(rEquity.values, aAll, iWindow)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return pandas.Series(aMean / aStd, index=rEquity.index)
+
+def rRollingSortino(rEquity, iWindow=100):
+    aMean = aRollingSum(rEquity.values, iWindow) / iWindow
+    aLosses = rEquity.values < 0
+    aCount, aLossMean, aLossStd = _aRollingMoments(rEquity.values, aLosses, iWindow)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return pandas.Series(aMean / aLossStd, index=rEquity.index)
+
+def rRollingWinrate(rEquity, iWindow=100):
+    aGains = (rEquity.values > 0).astype('float64')
+    return pandas.Series(aRollingSum(aGains, iWindow) / iWindow, index=rEquity.index)
+
+def rUnderwater(rEquity):
+    """The underwater curve: the equity less its highest value so far."""
+    rCumsum = rEquity.cumsum()
+    return rCumsum - rCumsum.cummax()
+
+def rRollingDrawdown(rEquity, iWindow=100):
+    """The equity less its highest value in the window."""
+    aCumsum = rEquity.cumsum().values
+    return pandas.Series(aCumsum - aRollingMax(aCumsum, iWindow), index=rEquity.index)
+
+def rDrawdownDuration(rEquity):
+    """The number of trades since the equity was at its highest so far."""
+    aUnderwater = rUnderwater(rEquity).values
+    aRange = numpy.arange(len(aUnderwater))
+    aLastHigh = numpy.maximum.accumulate(numpy.where(aUnderwater >= 0, aRange, 0))
+    return pandas.Series(aRange - aLastHigh, index=rEquity.index)
+
+def mRollingMetrics(rEquity, iWindow=100):
+    """
+    The rolling metrics of the trades of rEquity, its differences that are
+    not 0, as a DataFrame with a row for each trade.
+    """
+    rEquity = rEquity.take(numpy.flatnonzero(rEquity.values != 0))
+    dColumns = OrderedDict()
+    dColumns['sharpe'] = rRollingSharpe(rEquity, iWindow)
+    dColumns['sortino'] = rRollingSortino(rEquity, iWindow)
+    dColumns['winrate'] = rRollingWinrate(rEquity, iWindow)
+    dColumns['drawdown'] = rRollingDrawdown(rEquity, iWindow)
+    dColumns['underwater'] = rUnderwater(rEquity)
+    dColumns['duration'] = rDrawdownDuration(rEquity)
+    return pandas.DataFrame(dColumns, index=rEquity.index, columns=dColumns.keys())
+
+
+def dPerformanceSummary(equity_diffs, quantile=0.99, precision=4,
+                        runs=1000, batch_size=None, random_state=None):
+    return MetricsEngine(equity_diffs).dSummary(quantile=quantile, precision=precision,
+                                                runs=runs, batch_size=batch_size,
+                                                random_state=random_state)
+
+
+class MetricsEngine(object):
+    """
+    The metrics of the functions above, for one equity differences Series,
+    derived from intermediates that are each computed once: the cumulative
+    sum and its drawdown, the gains and losses, and the resamples.
+    dSummary is dPerformanceSummary, cached by its arguments, so keep an
+    engine for as long as the equity does not change (see ChefsOven.oMetrics).
+    """
+
+    def __init__(self, rEquity):
+        self.rEquity = rEquity
+        self._dSummaries = {}
+        self._dRollings = {}
+
+    @cache_readonly
+    def rCumsum(self):
+        return self.rEquity.cumsum()
+
+    @cache_readonly
+    def rDrawdown(self):
+        return self.rCumsum - self.rCumsum.cummax()
+
+    @cache_readonly
+    def rGains(self):
+        return self.rEquity[self.rEquity > 0]
+
+    @cache_readonly
+    def rLosses(self):
+        return self.rEquity[self.rEquity < 0]
+
+    @cache_readonly
+    def rDays(self):
+        return _days(self.rEquity)
+
+    @cache_readonly
+    def oNonzero(self):
+        """The engine of the equity differences that are not 0."""
+        aNonzero = self.rEquity.values != 0
+        if aNonzero.all():
+            return self
+        # take, as a boolean index of a long DatetimeIndex is slow
+        return MetricsEngine(self.rEquity.take(numpy.flatnonzero(aNonzero)))
+
+    @cache_readonly
+    def oTrades(self):
+        """The engine of the trades of the summary: not 0, and in naive time."""
+        rEquity = self.oNonzero.rEquity
+        if getattr(rEquity.index, 'tz', None) is None:
+            return self.oNonzero
+        return MetricsEngine(rEquity.tz_convert(None))
+
+    def start(self):
+        return self.rEquity.index[0]
+    def end(self):
+        return self.rEquity.index[-1]
+    def days(self):
+        return (self.rEquity.index[-1] - self.rEquity.index[0]).days
+    def trades_per_month(self):
+        oIndex = self.rEquity.index
+        rTraded = self.rEquity.notnull() & (self.rEquity != 0)
+        return rTraded.groupby([oIndex.year, oIndex.month]).sum().mean()
+    def profit(self):
+        return self.rEquity.sum()
+    def average(self):
+        return self.oNonzero.rEquity.mean()
+    def average_gain(self):
+        return self.rGains.mean()
+    def average_loss(self):
+        return self.rLosses.mean()
+    def winrate(self):
+        return float(len(self.rGains)) / len(self.rEquity)
+    def payoff(self):
+        return self.rGains.mean() / -self.rLosses.mean()
+    def PF(self):
+        return abs(self.rGains.sum() / self.rLosses.sum())
+    pf = PF
+    def maxdd(self):
+        return self.rDrawdown.abs().max()
+    def RF(self):
+        return self.rEquity.sum() / self.maxdd()
+    rf = RF
+    def trades(self):
+        return len(self.oNonzero.rEquity)
+
+    def sharpe(self):
+        return (self.rDays.mean() / self.rDays.std()) ** (252**0.5)
+
+    def sortino(self):
+        return (self.rDays.mean() / self.rDays[self.rDays < 0]).std()
+
+    def ulcer(self):
+        return ((self.rDrawdown ** 2).sum() / len(self.rEquity)) ** 0.5
+
+    def upi(self, risk_free=0):
+        return (self.oNonzero.rEquity.mean() - risk_free) / self.oNonzero.ulcer()
+    UPI = upi
+
+    def mpi(self):
+        return self.rEquity.resample('M', how='sum').mean() / self.ulcer()
+    MPI = mpi
+
+    def mcmdd(self, runs=1000, quantile=0.99, array=False,
+              batch_size=None, random_state=None):
+        return mcmdd(self.rEquity, runs=runs, quantile=quantile, array=array,
+                     batch_size=batch_size, random_state=random_state)
+
+    def holding_periods(self):
+        return holding_periods(self.rEquity)
+
+    def mRolling(self, iWindow=100):
+        """The mRollingMetrics of the trades of the summary, cached by iWindow."""
+        if iWindow not in self._dRollings:
+            self._dRollings[iWindow] = mRollingMetrics(self.oTrades.rEquity, iWindow)
+        return self._dRollings[iWindow]
+
+    def dSummary(self, quantile=0.99, precision=4,
+                 runs=1000, batch_size=None, random_state=None):
+        tKey = (quantile, precision, runs, batch_size, random_state,)
+        if tKey not in self._dSummaries:
+            self._dSummaries[tKey] = self.dMakeSummary(quantile, precision, runs,
+                                                       batch_size, random_state)
+        return self._dSummaries[tKey]
+
+    def dMakeSummary(self, quantile, precision, runs, batch_size, random_state):
+        oTrades = self.oTrades
+        rEquity = oTrades.rEquity
+        if len(rEquity) == 0:
+            return {}
+        fMean = rEquity.mean()
+        fMaxdd = oTrades.maxdd()
+        fWcdd = oTrades.mcmdd(runs=runs, quantile=quantile,
+                              batch_size=batch_size, random_state=random_state)
+        return {
+            'backtest': {
+                'from': str(rEquity.index[0]),
+                'to': str(rEquity.index[-1]),
+                'days': oTrades.days(),
+                'trades': len(rEquity),
+                },
+            'exposure': {
+                'trades/month': round(oTrades.trades_per_month(), precision),
                 },
-            'winrate': round(float(sum(rEquity > 0)) / len(rEquity), precision),
-            'payoff': round(rEquity[rEquity > 0].mean() / -rEquity[rEquity < 0].mean(), precision),
-            'PF': round(abs(rEquity[rEquity > 0].sum() / rEquity[rEquity < 0].sum()), precision),
-            'RF': round(rEquity.sum() / maxdd(rEquity), precision),
-            },
-        'risk/return profile': {
-            'sharpe': round(rEquity.mean() / rEquity.std(), precision),
-            'sortino': round(rEquity.mean() / rEquity[rEquity < 0].std(), precision),
-            'maxdd': round(maxdd(rEquity), precision),
-            'WCDD (monte-carlo %s quantile)' % quantile: round(mcmdd(rEquity, quantile=quantile), precision),
-            'UPI': round(UPI(rEquity), precision),
-            'MPI': round(MPI(rEquity), precision),
+            'performance': {
+                'profit': round(oTrades.profit(), precision),
+                'averages': {
+                    'trade': round(fMean, precision),
+                    'gain': round(oTrades.average_gain(), precision),
+                    'loss': round(oTrades.average_loss(), precision),
+                    },
+                'winrate': round(oTrades.winrate(), precision),
+                'payoff': round(oTrades.payoff(), precision),
+                'PF': round(oTrades.PF(), precision),
+                'RF': round(oTrades.profit() / fMaxdd, precision),
+                },
+            'risk/return profile': {
+                'sharpe': round(fMean / rEquity.std(), precision),
+                'sortino': round(fMean / oTrades.rLosses.std(), precision),
+                'maxdd': round(fMaxdd, precision),
+                'WCDD (monte-carlo %s quantile)' % quantile: round(fWcdd, precision),
+                'UPI': round(oTrades.UPI(), precision),
+                'MPI': round(oTrades.MPI(), precision),
+                }
             }
-        }
+
+
+def mBatchPerformanceSummary(aCol, aBar, aEquity, iVariants, oIndex, precision=4):
+    """
+    The metrics of dPerformanceSummary that do not need resampling or
+    simulation, for many variants at once, from the flat equity arrays
+    of PYBTParts.aBatchTradesToEquity: aCol is the variant of each
+    equity difference, and aBar the bar of oIndex it is at.
+    Returns a DataFrame with a row for each variant and a column for each
+    metric, named as they are flattened by OTSweep.dFlattenSummary.
+    """
+    aNonzero = aEquity != 0
+    rEquity = pandas.Series(aEquity[aNonzero])
+    aCol = aCol[aNonzero]
+    aBar = aBar[aNonzero]
+    oVariants = pandas.Index(numpy.arange(iVariants))
+
+    def rByVariant(rSeries, sHow, aKeys=aCol):
+        return getattr(rSeries.groupby(aKeys), sHow)().reindex(oVariants)
+
+    rGains = rEquity[rEquity.values > 0]
+    rLosses = rEquity[rEquity.values < 0]
+    aGainCol = aCol[rEquity.values > 0]
+    aLossCol = aCol[rEquity.values < 0]
+    rTrades = rByVariant(rEquity, 'count').fillna(0)
+    rProfit = rByVariant(rEquity, 'sum')
+    # maxdd and ulcer of the cumulative equity of each variant
+    rCum = rEquity.groupby(aCol).cumsum()
+    rDrawdown = rCum - rCum.groupby(aCol).cummax()
+    rMaxdd = rByVariant(rDrawdown.abs(), 'max')
+    rUlcer = (rByVariant(rDrawdown ** 2, 'sum') / rTrades) ** 0.5
+    rMean = rByVariant(rEquity, 'mean')
+
+    dColumns = OrderedDict()
+    # the first and last bars with equity of each variant
+    rFirst = rByVariant(pandas.Series(aBar), 'min')
+    rLast = rByVariant(pandas.Series(aBar), 'max')
+    lFrom = [None if numpy.isnan(fBar) else oIndex[int(fBar)] for fBar in rFirst.values]
+    lTo = [None if numpy.isnan(fBar) else oIndex[int(fBar)] for fBar in rLast.values]
+    dColumns['backtest.days'] = [None if oFrom is None else (oTo - oFrom).days
+                                 for oFrom, oTo in zip(lFrom, lTo)]
+    dColumns['backtest.from'] = [None if oFrom is None else str(oFrom) for oFrom in lFrom]
+    dColumns['backtest.to'] = [None if oTo is None else str(oTo) for oTo in lTo]
+    dColumns['backtest.trades'] = rTrades.astype('int64')
+    dColumns['performance.PF'] = (rByVariant(rGains, 'sum', aGainCol) /
+                                  rByVariant(rLosses, 'sum', aLossCol)).abs()
+    dColumns['performance.RF'] = rProfit / rMaxdd
+    dColumns['performance.averages.gain'] = rByVariant(rGains, 'mean', aGainCol)
+    dColumns['performance.averages.loss'] = rByVariant(rLosses, 'mean', aLossCol)
+    dColumns['performance.averages.trade'] = rMean
+    dColumns['performance.payoff'] = dColumns['performance.averages.gain'] / \
+                                     -dColumns['performance.averages.loss']
+    dColumns['performance.profit'] = rProfit
+    dColumns['performance.winrate'] = rByVariant(rGains, 'count', aGainCol).fillna(0) / rTrades
+    dColumns['risk/return profile.UPI'] = rMean / rUlcer
+    dColumns['risk/return profile.maxdd'] = rMaxdd
+    dColumns['risk/return profile.sharpe'] = rMean / rByVariant(rEquity, 'std')
+    dColumns['risk/return profile.sortino'] = rMean / rByVariant(rLosses, 'std', aLossCol)
+
+    mRetval = pandas.DataFrame(dColumns, index=oVariants, columns=dColumns.keys())
+    for sKey in mRetval.columns:
+        if mRetval[sKey].dtype == 'float64':
+            mRetval[sKey] = mRetval[sKey].round(precision)
+    return mRetval
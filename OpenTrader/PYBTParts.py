@@ -0,0 +1,232 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+# the vectorized equivalents of pybacktest.parts: https://github.com/ematvey/pybacktest
+
+"""
+Vectorized versions of the pybacktest parts that turn signals into
+positions, trades and equity, which work on the numpy arrays of
+the signals rather than iterating over the rows of a DataFrame.
+They give the same results as the loops in Recipe.
+
+The aBatch functions do the same for many variants of a recipe at once:
+their signals are (bars, variants) arrays, and their positions, trades
+and equity are sparse, as flat arrays of (variant, bar, value) events.
+"""
+
+import numpy
+import pandas
+
+def aComposeTransitions(aFirst, aThen):
+    """
+    Compose the position transitions aFirst and then aThen, which are
+    (n, 3) arrays giving the next position for the positions -1, 0 and 1.
+    """
+    aRetval = numpy.empty_like(aFirst)
+    for i in range(3):
+        aRetval[:, i] = aThen[numpy.arange(len(aThen)), aFirst[:, i] + 1]
+    return aRetval
+
+def aTransitionMaps(aLongEntry, aLongExit, aShortEntry, aShortExit):
+    """
+    The (n, 3) position transitions of the bars with the given signals:
+    an exit signal closes the position it is for, and then, if there is
+    no position, a long entry opens a long one, or else a short entry
+    opens a short one.
+    """
+    # the position entered from no position
+    aEntry = numpy.where(aLongEntry, 1, numpy.where(aShortEntry, -1, 0))
+    aMaps = numpy.empty((len(aEntry), 3), dtype='int64')
+    aMaps[:, 0] = numpy.where(aShortExit, aEntry, -1)
+    aMaps[:, 1] = aEntry
+    aMaps[:, 2] = numpy.where(aLongExit, aEntry, 1)
+    return aMaps
+
+def vScanTransitions(aMaps):
+    """
+    Hillis-Steele inclusive scan in place: aMaps[i] becomes the maps 0..i composed.
+    """
+    iStep = 1
+    while iStep < len(aMaps):
+        aMaps[iStep:] = aComposeTransitions(aMaps[:-iStep], aMaps[iStep:])
+        iStep *= 2
+
+def aSignalsToPositions(aLongEntry, aLongExit, aShortEntry, aShortExit, iInitPos=0):
+    """
+    The position (-1, 0 or 1) after each bar, given the boolean arrays of
+    the signals, with the semantics of pybacktest.parts.signals_to_positions
+    (see aTransitionMaps).
+
+    Each bar maps the position before it to the position after it, so
+    the positions are a prefix scan of these maps under composition.
+    Only the bars with signals change anything, so the scan is over
+    those, in log2(bars) vectorized steps of doubling.
+    """
+    assert iInitPos in (-1, 0, 1), \
+           "ERROR: the position must be -1, 0 or 1, not %r" % (iInitPos,)
+    aLongEntry = numpy.asarray(aLongEntry, dtype=bool)
+    aLongExit = numpy.asarray(aLongExit, dtype=bool)
+    aShortEntry = numpy.asarray(aShortEntry, dtype=bool)
+    aShortExit = numpy.asarray(aShortExit, dtype=bool)
+    iBars = len(aLongEntry)
+
+    aBars = numpy.flatnonzero(aLongEntry | aLongExit | aShortEntry | aShortExit)
+    aMaps = aTransitionMaps(aLongEntry[aBars], aLongExit[aBars],
+                            aShortEntry[aBars], aShortExit[aBars])
+    vScanTransitions(aMaps)
+
+    aPositions = numpy.empty(iBars, dtype='float64')
+    aPositions[:] = iInitPos
+    if len(aBars):
+        aAfter = aMaps[:, iInitPos + 1]
+        # the position holds from each signal bar to the next
+        aSegment = numpy.searchsorted(aBars, numpy.arange(iBars), side='right') - 1
+        aHeld = aSegment >= 0
+        aPositions[aHeld] = aAfter[aSegment[aHeld]]
+    return aPositions
+
+def bBooleanSignals(mSignals, mask=('Buy', 'Sell', 'Short', 'Cover')):
+    """
+    True if the signals in the columns mask of mSignals are all
+    True or False (or 1 or 0), so aSignalsToPositions applies;
+    signals of other sizes need the loop in Recipe.rPositionsIterrows.
+    """
+    for sKey in mask:
+        aValues = mSignals[sKey].values
+        if aValues.dtype == bool:
+            continue
+        if not numpy.all((aValues == True) | (aValues == False)):
+            return False
+    return True
+
+def rSignalsToPositions(mSignals, init_pos=0,
+                        mask=('Buy', 'Sell', 'Short', 'Cover')):
+    """
+    Translate signal dataframe into positions series (trade prices aren't
+    specified), keeping only the bars where the position changes,
+    like Recipe.rPositions.
+    """
+    long_en, long_ex, short_en, short_ex = mask
+    aPositions = aSignalsToPositions(mSignals[long_en].values,
+                                     mSignals[long_ex].values,
+                                     mSignals[short_en].values,
+                                     mSignals[short_ex].values,
+                                     iInitPos=init_pos)
+    aChanged = numpy.ones(len(aPositions), dtype=bool)
+    aChanged[1:] = aPositions[1:] != aPositions[:-1]
+    return pandas.Series(aPositions[aChanged], index=mSignals.index[aChanged])
+
+def aTradesToEquity(aPos, aVol, aPrice):
+    """
+    The equity differences of the trades given as the arrays of their
+    positions, volumes and prices, in one pass: the trades where the sign
+    of the position changes close the trades before them, and the PnL of
+    each is the difference of the cash flows between these closes.
+    """
+    aPos = numpy.asarray(aPos, dtype='float64')
+    aPrice = numpy.asarray(aPrice, dtype='float64')
+    aEquity = numpy.zeros(len(aPos), dtype='float64')
+    if len(aPos) == 0:
+        return aEquity
+    aSign = numpy.sign(aPos)
+    aClose = numpy.ones(len(aPos), dtype=bool)
+    aClose[1:] = aSign[1:] != aSign[:-1]
+    aCash = numpy.cumsum(numpy.asarray(aVol, dtype='float64') * aPrice)
+    aIndex = numpy.flatnonzero(aClose)
+    aPnl = -numpy.diff(aCash[aIndex] - aPos[aIndex] * aPrice[aIndex])
+    aEquity[aIndex[1:]] = numpy.where(aPnl != 0, aPnl, 0.0)
+    return aEquity
+
+def rTradesToEquity(mTrades):
+    """
+    Convert trades dataframe (cols [vol, price, pos]) to equity diff series,
+    like Recipe.rEquityApply.
+    """
+    return pandas.Series(aTradesToEquity(mTrades['pos'].values,
+                                         mTrades['vol'].values,
+                                         mTrades['price'].values),
+                         index=mTrades.index)
+
+def tBatchSignalsToPositions(aLongEntry, aLongExit, aShortEntry, aShortExit,
+                             iInitPos=0):
+    """
+    aSignalsToPositions for each column of the (bars, variants) boolean
+    signal arrays, in one scan. The signal bars of all of the variants are
+    scanned as one sequence, variant after variant; the first map of each
+    variant is made constant, at its value for iInitPos, which cuts it
+    off from the variant before it, as a constant map absorbs everything
+    composed before it.
+    Returns the arrays (aCol, aBar, aPos) of the bars where a position
+    changes: the variant, the bar, and the position after it.
+    """
+    assert iInitPos in (-1, 0, 1), \
+           "ERROR: the position must be -1, 0 or 1, not %r" % (iInitPos,)
+    aLongEntry = numpy.asarray(aLongEntry, dtype=bool)
+    aLongExit = numpy.asarray(aLongExit, dtype=bool)
+    aShortEntry = numpy.asarray(aShortEntry, dtype=bool)
+    aShortExit = numpy.asarray(aShortExit, dtype=bool)
+    iBars = aLongEntry.shape[0]
+
+    # variant-major, so each variant's signal bars are together and in order
+    aAny = (aLongEntry | aLongExit | aShortEntry | aShortExit).T
+    aFlat = numpy.flatnonzero(aAny)
+    aCol = aFlat // iBars
+    aBar = aFlat % iBars
+    aMaps = aTransitionMaps(aLongEntry[aBar, aCol], aLongExit[aBar, aCol],
+                            aShortEntry[aBar, aCol], aShortExit[aBar, aCol])
+    aFirst = numpy.ones(len(aCol), dtype=bool)
+    aFirst[1:] = aCol[1:] != aCol[:-1]
+    aMaps[aFirst] = aMaps[aFirst, iInitPos + 1][:, numpy.newaxis]
+    vScanTransitions(aMaps)
+
+    aAfter = aMaps[:, 0]
+    aBefore = numpy.empty_like(aAfter)
+    aBefore[0:1] = iInitPos
+    aBefore[1:] = aAfter[:-1]
+    aBefore[aFirst] = iInitPos
+    aChanged = aAfter != aBefore
+    return (aCol[aChanged], aBar[aChanged], aAfter[aChanged].astype('float64'),)
+
+def tBatchPositionsToTrades(aCol, aBar, aPos, aPrice):
+    """
+    The trades of the position changes from tBatchSignalsToPositions, as
+    Recipe.mTrades makes them: a position changed on a bar is traded on
+    the next bar, at aPrice of that bar, and those with no price are dropped.
+    Returns the arrays (aCol, aBar, aPos, aVol, aPrice) of the trades.
+    """
+    aPrice = numpy.asarray(aPrice, dtype='float64')
+    aBar = aBar + 1
+    aKeep = aBar < len(aPrice)
+    aCol, aBar, aPos = aCol[aKeep], aBar[aKeep], aPos[aKeep]
+    aTradePrice = aPrice[aBar]
+    aKeep = ~numpy.isnan(aTradePrice)
+    aCol, aBar, aPos, aTradePrice = aCol[aKeep], aBar[aKeep], aPos[aKeep], aTradePrice[aKeep]
+    aFirst = numpy.ones(len(aCol), dtype=bool)
+    aFirst[1:] = aCol[1:] != aCol[:-1]
+    aVol = numpy.empty_like(aPos)
+    aVol[0:1] = aPos[0:1]
+    aVol[1:] = aPos[1:] - aPos[:-1]
+    # each variant starts with no position
+    aVol[aFirst] = aPos[aFirst]
+    return (aCol, aBar, aPos, aVol, aTradePrice,)
+
+def aBatchTradesToEquity(aCol, aPos, aVol, aPrice):
+    """
+    aTradesToEquity for the trades of many variants, in one pass,
+    given as the flat arrays of tBatchPositionsToTrades.
+    """
+    aEquity = numpy.zeros(len(aPos), dtype='float64')
+    if len(aPos) == 0:
+        return aEquity
+    aFirst = numpy.ones(len(aCol), dtype=bool)
+    aFirst[1:] = aCol[1:] != aCol[:-1]
+    aSign = numpy.sign(aPos)
+    aClose = aFirst.copy()
+    aClose[1:] |= aSign[1:] != aSign[:-1]
+    # the cash flows summed across variants: only differences within one are used
+    aCash = numpy.cumsum(aVol * aPrice)
+    aIndex = numpy.flatnonzero(aClose)
+    aPnl = -numpy.diff(aCash[aIndex] - aPos[aIndex] * aPrice[aIndex])
+    # the first close of a variant has no PnL
+    aPnl[aFirst[aIndex[1:]]] = 0.0
+    aEquity[aIndex[1:]] = numpy.where(aPnl != 0, aPnl, 0.0)
+    return aEquity
@@ -1,37 +1,330 @@
 # -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
 
 import sys, os
+import re
+import time
+import json
+import multiprocessing
+import numpy
 import pandas
 
-dDF_OHLC = {}
-dDF_RAW1MIN = {}
+from OpenTrader.FeedCache import oFEED_CACHE, oFEED_REGISTRY, lFeedArrays
 
-def vResampleFiles(sSymbol, sDir):
-    for sYear in ['2010', '2011', '2012', '2013', '2014', '2015']:
+# views of the shared feed cache, which evicts to stay in its budget
+dDF_OHLC = oFEED_CACHE.oView('ohlc')
+dDF_RAW1MIN = oFEED_CACHE.oView('raw1min')
+
+# The feed cache is a directory next to each resampled CSV file
+# holding the parsed feed as memory-mappable numpy arrays:
+#   timestamp.npy - int64 nanoseconds since the epoch
+#   ohlc.npy      - float64 array of shape (4, len), one row per O H L C column
+#   meta.json     - the size and mtime of the CSV file that it was made from
+sFEED_CACHE_SUFFIX = '.cache'
+fFEED_CACHE_VERSION = 1.0
+lOHLC_COLUMNS = ['O', 'H', 'L', 'C']
+# the dtypes that feeds can be kept in memory as: see sFeedDtype in OTCmd2.ini
+lFEED_DTYPES = ['float64', 'float32']
+
+# rows of raw 1 minute data read at a time by the streaming resampler
+iRESAMPLE_CHUNK_ROWS = 500000
+
+# The Metatrader .hst history file is a 148 byte header followed by
+# fixed size little-endian records, whose layout depends on the version.
+iHST_HEADER_BYTES = 148
+oHST_HEADER_DTYPE = numpy.dtype([('version', '<i4'),
+                                 ('copyright', 'S64'),
+                                 ('symbol', 'S12'),
+                                 ('period', '<i4'),
+                                 ('digits', '<i4'),
+                                 ('timesign', '<i4'),
+                                 ('last_sync', '<i4'),
+                                 ('unused', '<i4', (13,))])
+# build 600 and later: 60 bytes
+oHST401_DTYPE = numpy.dtype([('ctm', '<i8'),
+                             ('O', '<f8'), ('H', '<f8'), ('L', '<f8'), ('C', '<f8'),
+                             ('V', '<i8'),
+                             ('spread', '<i4'),
+                             ('real_volume', '<i8')])
+# before build 600: 44 bytes - note the low comes before the high
+oHST400_DTYPE = numpy.dtype([('ctm', '<i4'),
+                             ('O', '<f8'), ('L', '<f8'), ('H', '<f8'), ('C', '<f8'),
+                             ('V', '<f8')])
+dHST_DTYPES = {400: oHST400_DTYPE, 401: oHST401_DTYPE}
+
+lRESAMPLE_YEARS = ['2010', '2011', '2012', '2013', '2014', '2015']
+lRESAMPLE_TIMEFRAMES = ['60', '240', '1440']
+
+def vResampleFiles(sSymbol, sDir, lYears=None, lTimeFrames=None, bSinglePass=False):
+    """
+    Resample the 1 minute files SYMBOL1-YEAR.csv in sDir into
+    SYMBOLTIMEFRAME-YEAR.csv files, for those that do not already exist.
+    With bSinglePass, all the missing timeframes of a year are made
+    in one pass over the 1 minute data by vResample1MinFrames.
+    """
+    if lYears is None: lYears = lRESAMPLE_YEARS
+    if lTimeFrames is None: lTimeFrames = lRESAMPLE_TIMEFRAMES
+    for sYear in lYears:
         sRaw1 = os.path.join(sDir, sSymbol + '1-' +sYear +'.csv')
         assert os.path.exists(sRaw1), "File not found: " +sRaw1
 
-        for sTimeFrame in ['60', '240', '1440']:
+        dResampledCsvs = {}
+        for sTimeFrame in lTimeFrames:
             sResampledCsv = os.path.join(sDir, sSymbol + sTimeFrame +'-' +sYear +'.csv')
             if not os.path.exists(sResampledCsv):
+                dResampledCsvs[sTimeFrame] = sResampledCsv
+        if bSinglePass:
+            if dResampledCsvs:
+                print "INFO: cooking %s %s %s" % (','.join(sorted(dResampledCsvs.keys(), key=int)),
+                                                  sSymbol, sYear, )
+                vResample1MinFrames(sRaw1, dResampledCsvs)
+        else:
+            for sTimeFrame in sorted(dResampledCsvs.keys(), key=int):
                 print "INFO: cooking %s %s %s" % (sTimeFrame, sSymbol, sYear, )
-                vResample1Min(sSymbol, sRaw1, sResampledCsv, sTimeFrame)
+                vResample1Min(sSymbol, sRaw1, dResampledCsvs[sTimeFrame], sTimeFrame)
+        for sResampledCsv in dResampledCsvs.values():
             assert os.path.exists(sResampledCsv)
 
+def lMakeResampleJobs(sDir, lSymbols=None, lYears=None, lTimeFrames=None,
+                      bSinglePass=True, bAppend=False):
+    """
+    Find the 1 minute files SYMBOL1-YEAR.csv in sDir, for the symbols
+    lSymbols and years lYears (default all that are found), and return
+    a list of the independent resampling jobs to make the missing
+    SYMBOLTIMEFRAME-YEAR.csv files, as tuples of
+    (sSymbol, sYear, sRaw1, dResampledCsvs, bAppend).
+    With bSinglePass there is one job for all the timeframes of a
+    (symbol, year), otherwise there is one job per timeframe.
+    With bAppend, the files older than their 1 minute file are
+    brought up to date by vResample1MinAppend too.
+    """
+    if lTimeFrames is None: lTimeFrames = lRESAMPLE_TIMEFRAMES
+    oRaw1Re = re.compile(r'^(.+?)1-([0-9]{4})\.csv$')
+    lJobs = []
+    for sFile in sorted(os.listdir(sDir)):
+        oMatch = oRaw1Re.match(sFile)
+        if not oMatch: continue
+        sSymbol, sYear = oMatch.groups()
+        if lSymbols and sSymbol not in lSymbols: continue
+        if lYears and sYear not in lYears: continue
+        sRaw1 = os.path.join(sDir, sFile)
+
+        dResampledCsvs = {}
+        for sTimeFrame in lTimeFrames:
+            sResampledCsv = os.path.join(sDir, sSymbol + sTimeFrame +'-' +sYear +'.csv')
+            if not os.path.exists(sResampledCsv):
+                dResampledCsvs[sTimeFrame] = sResampledCsv
+            elif bAppend and os.path.getmtime(sResampledCsv) < os.path.getmtime(sRaw1):
+                dResampledCsvs[sTimeFrame] = sResampledCsv
+        if not dResampledCsvs: continue
+        if bSinglePass:
+            lJobs.append((sSymbol, sYear, sRaw1, dResampledCsvs, bAppend,))
+        else:
+            for sTimeFrame in sorted(dResampledCsvs.keys(), key=int):
+                lJobs.append((sSymbol, sYear, sRaw1,
+                              {sTimeFrame: dResampledCsvs[sTimeFrame]}, bAppend,))
+    return lJobs
+
+def tResampleJob(tJob):
+    """
+    Run one job from lMakeResampleJobs; this is called in a worker process.
+    Returns a tuple of (sSymbol, sYear, lTimeFrames, fSeconds, sError)
+    where sError is "" on success.
+    """
+    sSymbol, sYear, sRaw1, dResampledCsvs, bAppend = tJob
+    lTimeFrames = sorted(dResampledCsvs.keys(), key=int)
+    fStart = time.time()
+    sError = ""
+    try:
+        vResample1MinFrames(sRaw1, dResampledCsvs, bAppend=bAppend)
+    except Exception as e:
+        # vResample1MinFrames has removed or restored the files it was writing
+        sError = "%s: %s" % (e.__class__.__name__, str(e),)
+    return (sSymbol, sYear, lTimeFrames, time.time() - fStart, sError,)
+
+def lResampleParallel(lJobs, iWorkers=0, oFd=sys.stdout):
+    """
+    Run the jobs from lMakeResampleJobs over a pool of iWorkers
+    processes (default: the number of CPUs), reporting the time
+    each job took as it finishes. Returns the list of results
+    from tResampleJob, in the order they finished.
+    """
+    if not lJobs:
+        oFd.write("INFO: nothing to resample\n")
+        return []
+    if not iWorkers or iWorkers <= 0:
+        iWorkers = multiprocessing.cpu_count()
+    iWorkers = min(iWorkers, len(lJobs))
+    oFd.write("INFO: resampling %d jobs on %d workers\n" % (len(lJobs), iWorkers,))
+
+    fStart = time.time()
+    lResults = []
+    oPool = multiprocessing.Pool(iWorkers)
+    try:
+        for tResult in oPool.imap_unordered(tResampleJob, lJobs):
+            sSymbol, sYear, lTimeFrames, fSeconds, sError = tResult
+            if sError:
+                oFd.write("ERROR: %s %s %s failed after %.2f seconds: %s\n" % (
+                    sSymbol, sYear, ','.join(lTimeFrames), fSeconds, sError,))
+            else:
+                oFd.write("INFO: %s %s %s resampled in %.2f seconds\n" % (
+                    sSymbol, sYear, ','.join(lTimeFrames), fSeconds,))
+            lResults.append(tResult)
+        oPool.close()
+    except:
+        oPool.terminate()
+        raise
+    finally:
+        oPool.join()
+    oFd.write("INFO: resampled %d jobs in %.2f seconds\n" % (len(lResults),
+                                                             time.time() - fStart,))
+    return lResults
+
+def aDaysFromCivil(aYear, aMonth, aDay):
+    """
+    The days since 1970-01-01 of the proleptic Gregorian dates given
+    as integer arrays; this is H. Hinnant's days_from_civil, vectorized.
+    """
+    aYear = aYear - (aMonth <= 2)
+    aEra = aYear // 400
+    aYearOfEra = aYear - aEra * 400
+    # the year starts in March, so the leap day is at its end
+    aDayOfYear = (153 * ((aMonth + 9) % 12) + 2) // 5 + aDay - 1
+    aDayOfEra = aYearOfEra * 365 + aYearOfEra // 4 - aYearOfEra // 100 + aDayOfYear
+    return aEra * 146097 + aDayOfEra - 719468
+
+def aParseDigits(aChars, iStart, iLen):
+    """
+    The integers in the fixed columns iStart:iStart+iLen of the (rows, width)
+    uint8 array of characters aChars. Raises ValueError on a non-digit.
+    """
+    aDigits = aChars[:, iStart:iStart+iLen].astype('int64') - ord('0')
+    if len(aDigits) and (aDigits.min() < 0 or aDigits.max() > 9):
+        raise ValueError("not a digit in columns %d:%d" % (iStart, iStart+iLen,))
+    aRetval = numpy.zeros(len(aChars), dtype='int64')
+    for i in range(iLen):
+        aRetval = aRetval * 10 + aDigits[:, i]
+    return aRetval
+
+def aCharsOf(aStrings, iWidth):
+    """
+    The strings in aStrings as a (rows, iWidth) uint8 array of characters.
+    Raises ValueError unless they are all iWidth long.
+    """
+    # one character wider, so that a longer string is not truncated to fit
+    aBytes = numpy.asarray(aStrings, dtype='S%d' % (iWidth + 1))
+    if len(aBytes):
+        aLens = numpy.char.str_len(aBytes)
+        if aLens.min() != iWidth or aLens.max() != iWidth:
+            raise ValueError("not all %d characters long" % iWidth)
+    return aBytes.view(numpy.uint8).reshape(len(aBytes), iWidth + 1)[:, :iWidth]
+
+def vCheckSeparators(aChars, dSeparators):
+    """
+    Raises ValueError unless each column of the characters aChars in
+    dSeparators holds one of the separators given for it there.
+    """
+    for iColumn, sSeparators in dSeparators.items():
+        aColumn = aChars[:, iColumn]
+        bValid = numpy.zeros(len(aColumn), dtype=bool)
+        for sSeparator in sSeparators:
+            bValid |= aColumn == ord(sSeparator)
+        if not bValid.all():
+            raise ValueError("not %r in column %d" % (sSeparators, iColumn,))
+
+def aParseMt4Timestamps(aDates, aTimes=None):
+    """
+    Parse the fixed layout Mt4 dates and times into int64 nanoseconds
+    since the epoch, with vectorized arithmetic on the characters,
+    rather than pandas' generic date inference.
+
+    aDates are YYYY.MM.DD (or YYYY-MM-DD) and aTimes are HH:MM or HH:MM:SS.
+    If aTimes is None, aDates are YYYY-MM-DD HH:MM:SS as pandas writes them.
+    Raises ValueError if they are not all in the one layout, for
+    the caller to fall back to pandas.
+    """
+    if aTimes is None:
+        aChars = aCharsOf(aDates, 19)
+        vCheckSeparators(aChars, {10: ' '})
+        aTimeChars = aChars[:, 11:]
+    else:
+        aChars = aCharsOf(aDates, 10)
+        aTimes = numpy.asarray(aTimes, dtype='S9')
+        iWidth = 5
+        if len(aTimes) and numpy.char.str_len(aTimes).max() == 8:
+            iWidth = 8
+        aTimeChars = aCharsOf(aTimes, iWidth)
+    vCheckSeparators(aChars, {4: '.-', 7: '.-'})
+    vCheckSeparators(aTimeChars, {2: ':'})
+    if aTimeChars.shape[1] == 8:
+        vCheckSeparators(aTimeChars, {5: ':'})
+
+    aDays = aDaysFromCivil(aParseDigits(aChars, 0, 4),
+                           aParseDigits(aChars, 5, 2),
+                           aParseDigits(aChars, 8, 2))
+    aSeconds = aDays * 86400 + \
+               aParseDigits(aTimeChars, 0, 2) * 3600 + \
+               aParseDigits(aTimeChars, 3, 2) * 60
+    if aTimeChars.shape[1] == 8:
+        aSeconds += aParseDigits(aTimeChars, 6, 2)
+    return aSeconds * 10**9
+
+def mIndexByMt4Timestamps(mDf, sDateColumn, sTimeColumn=None):
+    """
+    Replace the string date (and time) columns of mDf by a DatetimeIndex
+    named timestamp, as read_csv(parse_dates=...) would have made,
+    using aParseMt4Timestamps, or pandas if they are not in the Mt4 layout.
+    """
+    rDates = mDf[sDateColumn]
+    rTimes = None if sTimeColumn is None else mDf[sTimeColumn]
+    try:
+        aTimestamps = aParseMt4Timestamps(rDates.values,
+                                          None if rTimes is None else rTimes.values)
+        oIndex = pandas.DatetimeIndex(aTimestamps.view('M8[ns]'), name='timestamp')
+    except ValueError:
+        if rTimes is not None:
+            rDates = rDates + ' ' + rTimes
+        oIndex = pandas.DatetimeIndex(pandas.to_datetime(rDates), name='timestamp')
+    # in place: mDf is freshly read, and selecting the columns would copy
+    del mDf[sDateColumn]
+    if sTimeColumn is not None:
+        del mDf[sTimeColumn]
+    mDf.index = oIndex
+    return mDf
+
+def mReadMt4Raw1Min(sRaw1, lColumns=None, iChunkRows=None):
+    """
+    Read the 1 minute Mt4 CSV file sRaw1, of D,T,O,H,L,C,V rows,
+    indexed by timestamp, with just the columns lColumns (default all).
+    sRaw1 may also be an open file, which is read from where it is.
+    With iChunkRows, returns an iterator over DataFrames of iChunkRows.
+    """
+    lNames = ['D', 'T', 'O', 'H', 'L', 'C', 'V']
+    if lColumns is None:
+        lColumns = lNames[2:]
+    dDtypes = dict([(sCol, 'float64') for sCol in lColumns])
+    dDtypes['D'] = str
+    dDtypes['T'] = str
+    oRetval = pandas.read_csv(sRaw1, header=None,
+                              names=lNames,
+                              usecols=['D', 'T'] + lColumns,
+                              dtype=dDtypes,
+                              chunksize=iChunkRows)
+    if iChunkRows is None:
+        return mIndexByMt4Timestamps(oRetval, 'D', 'T')
+    return (mIndexByMt4Timestamps(mChunk, 'D', 'T') for mChunk in oRetval)
+
 def vResample1Min(sSymbol, sRaw1, sResampledCsv, sTimeFrame, oFd=sys.stdout):
     global dDF_RAW1MIN
 
     sKey = sSymbol
-    if sKey not in dDF_RAW1MIN:
+    mRaw1 = dDF_RAW1MIN.get(sKey)
+    if mRaw1 is None:
         print "INFO: reading " + sRaw1
-        dDF_RAW1MIN[sKey] = pandas.read_csv(sRaw1, header=None,
-                                           names=['D', 'T', 'O', 'H', 'L', 'C', 'V'],
-                                           parse_dates={'timestamp': ['D', 'T']},
-                                           index_col='timestamp',
-                                           dtype='float64')
-        print "INFO: raw data length: %d" % len(dDF_RAW1MIN[sKey])
-
-    oDfOpen1 = dDF_RAW1MIN[sKey].iloc[:, [0]]
+        mRaw1 = mReadMt4Raw1Min(sRaw1)
+        dDF_RAW1MIN[sKey] = mRaw1
+        print "INFO: raw data length: %d" % len(mRaw1)
+
+    oDfOpen1 = mRaw1.iloc[:, [0]]
     print "INFO: %s raw open length: %d" % (sTimeFrame, len(oDfOpen1),)
     dDF_OHLC[sTimeFrame] = oDfOpen1.resample(sTimeFrame+'T', how='ohlc',
                                              closed='left',
@@ -44,22 +337,616 @@ def vResample1Min(sSymbol, sRaw1, sResampledCsv, sTimeFrame, oFd=sys.stdout):
     dDF_OHLC[sTimeFrame].to_csv(sResampledCsv, header=False)
     print "INFO: wrote "+sResampledCsv
 
-def oReadMt4Csv(sResampledCsv, sTimeFrame, sSymbol, sYear=""):
-    global dDF_OHLC
-    sKey = sSymbol + sTimeFrame + sYear
-    if sKey not in dDF_OHLC:
-        print "INFO: reading " + sResampledCsv
-        dDF_OHLC[sKey] = pandas.read_csv(sResampledCsv,
-                                         names=['T', 'O', 'H', 'L', 'C'],
-                                         parse_dates={'timestamp': ['T']},
-                                         index_col='timestamp',
-                                         dtype={'O': 'float64',
-                                                'H': 'float64',
-                                                'L': 'float64',
-                                                'C': 'float64'})
-    return dDF_OHLC[sKey]
+def iTimeFrameNanos(sTimeFrame):
+    """
+    The length of the timeframe sTimeFrame (in minutes) in nanoseconds.
+    The timeframe must divide a day, so that the bars are anchored at
+    midnight, which is what pandas resample does for these timeframes.
+    """
+    iMinutes = int(sTimeFrame)
+    assert iMinutes > 0 and (24*60) % iMinutes == 0, \
+           "ERROR: the timeframe must divide a day: " +str(sTimeFrame)
+    return iMinutes * 60 * 10**9
 
-def oPreprocessOhlc(oOhlc):
-    # is this in-place?
-    return oOhlc.dropna(how='any')
+def mAggregateOhlc(aTimestamps, aOpen, aHigh, aLow, aClose, iNanos):
+    """
+    Aggregate bars (or ticks: pass the same array four times) into bars
+    of iNanos nanoseconds. aTimestamps are sorted int64 nanoseconds.
+    Returns a DataFrame with columns open high low close, indexed by
+    the start of each bar; bars with no data in them are not included.
+    """
+    aBuckets = aTimestamps - aTimestamps % iNanos
+    iLen = len(aBuckets)
+    if iLen == 0:
+        return pandas.DataFrame(columns=['open', 'high', 'low', 'close'],
+                                index=pandas.DatetimeIndex([], name='timestamp'),
+                                dtype='float64')
+    aStarts = numpy.flatnonzero(numpy.r_[True, aBuckets[1:] != aBuckets[:-1]])
+    aLasts = numpy.r_[aStarts[1:], iLen] - 1
+    oIndex = pandas.DatetimeIndex(aBuckets[aStarts].view('M8[ns]'),
+                                  name='timestamp')
+    return pandas.DataFrame(dict(open=aOpen[aStarts],
+                                 high=numpy.maximum.reduceat(aHigh, aStarts),
+                                 low=numpy.minimum.reduceat(aLow, aStarts),
+                                 close=aClose[aLasts]),
+                            index=oIndex,
+                            columns=['open', 'high', 'low', 'close'])
+
+def mMergeBar(mBar, mBars):
+    """
+    Merge the single bar mBar into the front of the later bars mBars,
+    combining them if mBars starts with the same bar.
+    """
+    if len(mBars) == 0:
+        return mBar
+    if mBars.index[0] != mBar.index[0]:
+        return pandas.concat([mBar, mBars])
+    mBars = mBars.copy()
+    oFirst = mBars.index[0]
+    mBars.at[oFirst, 'open'] = mBar['open'].iat[0]
+    mBars.at[oFirst, 'high'] = max(mBar['high'].iat[0], mBars['high'].iat[0])
+    mBars.at[oFirst, 'low'] = min(mBar['low'].iat[0], mBars['low'].iat[0])
+    return mBars
+
+def mFillGaps(mBars, iNanos, iFirst=None):
+    """
+    Reindex mBars to every bar from iFirst (nanoseconds; default the
+    first bar) to the last bar, with NaN for the empty bars, as pandas
+    resample does.
+    """
+    if len(mBars) == 0:
+        return mBars
+    aBars = mBars.index.asi8
+    if iFirst is None:
+        iFirst = aBars[0]
+    aAll = numpy.arange(iFirst, aBars[-1] + iNanos, iNanos, dtype='int64')
+    if len(aAll) == len(aBars):
+        return mBars
+    return mBars.reindex(pandas.DatetimeIndex(aAll.view('M8[ns]'),
+                                              name=mBars.index.name))
+
+def vResample1MinStreaming(sRaw1, sResampledCsv, sTimeFrame,
+                           iChunkRows=iRESAMPLE_CHUNK_ROWS, oFd=sys.stdout):
+    """
+    Resample the 1 minute CSV file sRaw1 to sTimeFrame and write it to
+    sResampledCsv, in the same format as vResample1Min, but reading
+    iChunkRows at a time and writing the bars as they are completed,
+    so that the memory used does not depend on the size of sRaw1.
+    """
+    vResample1MinFrames(sRaw1, {sTimeFrame: sResampledCsv},
+                        iChunkRows=iChunkRows, oFd=oFd)
+
+def iMt4LineTimestamp(sLine):
+    """
+    The timestamp in nanoseconds of a line of an Mt4 CSV file:
+    either a 1 minute YYYY.MM.DD,HH:MM line or a resampled
+    YYYY-MM-DD HH:MM:SS (or YYYY-MM-DD) line. Returns None for a blank line.
+    """
+    lFields = sLine.strip().split(',')
+    if not lFields[0]:
+        return None
+    if lFields[0][4:5] == '-':
+        # pandas leaves out the time of daily bars
+        return int(aParseMt4Timestamps([(lFields[0] + ' 00:00:00')[:19]])[0])
+    return int(aParseMt4Timestamps([lFields[0]], [lFields[1]])[0])
+
+def iSeekMt4Csv(oFile, iTimestamp):
+    """
+    Seek the sorted Mt4 CSV file oFile, open in binary mode, to the start
+    of its first line at or after iTimestamp, with a binary search over the
+    byte offsets, so only a few lines of the file are read.
+    Returns the offset, which is the size of the file if there is no such line.
+    """
+    def iLineAt(iOffset):
+        # the offset of the first line that starts at or after iOffset
+        if iOffset == 0:
+            return 0
+        oFile.seek(iOffset - 1)
+        oFile.readline()
+        return oFile.tell()
+
+    oFile.seek(0, os.SEEK_END)
+    iLow, iHigh = 0, oFile.tell()
+    while iLow < iHigh:
+        iMid = (iLow + iHigh) // 2
+        oFile.seek(iLineAt(iMid))
+        iLine = iMt4LineTimestamp(oFile.readline())
+        if iLine is None or iLine >= iTimestamp:
+            iHigh = iMid
+        else:
+            iLow = iMid + 1
+    iOffset = iLineAt(iLow)
+    oFile.seek(iOffset)
+    return iOffset
+
+def iLastBarTimestamp(sResampledCsv, iTailBytes=4096):
+    """
+    The timestamp of the last bar in the resampled CSV file sResampledCsv,
+    reading only its tail; None if it has no bars.
+    """
+    with open(sResampledCsv, 'rb') as oFile:
+        oFile.seek(0, os.SEEK_END)
+        iSize = oFile.tell()
+        while True:
+            iTail = min(iSize, iTailBytes)
+            oFile.seek(iSize - iTail)
+            lLines = [sLine for sLine in oFile.read(iTail).splitlines() if sLine.strip()]
+            # the first line of the tail may be partial, unless it is the whole file
+            if len(lLines) > 1 or iTail == iSize:
+                break
+            iTailBytes *= 2
+    if not lLines:
+        return None
+    return iMt4LineTimestamp(lLines[-1])
+
+def tTruncateResampledCsv(sResampledCsv, iStart, iNanos):
+    """
+    Truncate the resampled CSV file sResampledCsv before its first bar at
+    or after iStart. Returns (iOffset, iNextBar, sTail) where iNextBar is
+    the timestamp after the last bar that is left, or None if none are,
+    and sTail is what was cut off, for vRestoreResampledCsv.
+    """
+    with open(sResampledCsv, 'rb+') as oFile:
+        iOffset = iSeekMt4Csv(oFile, iStart)
+        iNextBar = None
+        if iOffset > 0:
+            # the last bar left is on the line before iOffset
+            oFile.seek(max(0, iOffset - 1024))
+            sHead = oFile.read(iOffset - oFile.tell())
+            iNextBar = iMt4LineTimestamp(sHead.splitlines()[-1]) + iNanos
+        oFile.seek(iOffset)
+        sTail = oFile.read()
+        oFile.truncate(iOffset)
+    return (iOffset, iNextBar, sTail,)
+
+def vRestoreResampledCsv(sResampledCsv, iOffset, sTail):
+    """
+    Undo tTruncateResampledCsv, and whatever was appended after it.
+    """
+    with open(sResampledCsv, 'rb+') as oFile:
+        oFile.truncate(iOffset)
+        oFile.seek(iOffset)
+        oFile.write(sTail)
 
+def vResample1MinAppend(sRaw1, dResampledCsvs,
+                        iChunkRows=iRESAMPLE_CHUNK_ROWS, oFd=sys.stdout):
+    """
+    Bring the resampled CSV files in dResampledCsvs {sTimeFrame: sResampledCsv}
+    up to date with the 1 minute CSV file sRaw1, which has had data
+    appended since they were made: the last bar of each file may have been
+    open, so it is dropped, and the bars from there on are resampled from
+    only the 1 minute rows after it, and appended.
+    The cost is in the new data, not the history. The feed caches of
+    the files are updated too, if they were valid.
+    If any of the files do not exist or are empty, they are all remade.
+    """
+    vResample1MinFrames(sRaw1, dResampledCsvs, iChunkRows=iChunkRows, oFd=oFd,
+                        bAppend=True)
+
+def vResample1MinFrames(sRaw1, dResampledCsvs,
+                        iChunkRows=iRESAMPLE_CHUNK_ROWS, oFd=sys.stdout,
+                        bAppend=False):
+    """
+    Resample the 1 minute CSV file sRaw1 to every timeframe in the
+    dictionary dResampledCsvs {sTimeFrame: sResampledCsv} in one pass,
+    writing all of the CSV files together, in the same format as vResample1Min.
+
+    The 1 minute data is read iChunkRows at a time. The smallest timeframe
+    is sampled from the 1 minute data, and each larger timeframe from the
+    bars of the largest smaller timeframe that divides it.
+    The last bar of each chunk may be continued in the next chunk,
+    so it is carried over and merged, rather than written.
+    With bAppend, see vResample1MinAppend.
+    If it fails, the files that it was writing from the start are removed,
+    and those that it was appending to are restored, before it raises.
+    """
+    lTimeFrames = sorted(dResampledCsvs.keys(), key=int)
+    dNanos = dict([(sTimeFrame, iTimeFrameNanos(sTimeFrame))
+                   for sTimeFrame in lTimeFrames])
+    # pandas writes the bars without a time if they are all at midnight, as
+    # those of a whole file of daily bars are, but a chunk may be by chance
+    dDateFormats = dict([(sTimeFrame, '%Y-%m-%d' if dNanos[sTimeFrame] % (86400 * 10**9) == 0
+                          else '%Y-%m-%d %H:%M:%S')
+                         for sTimeFrame in lTimeFrames])
+    # the timeframe each timeframe is derived from: None for the raw data
+    dSource = {}
+    for i, sTimeFrame in enumerate(lTimeFrames):
+        dSource[sTimeFrame] = None
+        for sSmaller in reversed(lTimeFrames[:i]):
+            if int(sTimeFrame) % int(sSmaller) == 0:
+                dSource[sTimeFrame] = sSmaller
+                break
+
+    dNextBar = dict([(sTimeFrame, None) for sTimeFrame in lTimeFrames])
+    # the timestamp the bars are remade from when appending
+    iStart = None
+    if bAppend:
+        lLast = []
+        for sTimeFrame in lTimeFrames:
+            sResampledCsv = dResampledCsvs[sTimeFrame]
+            if not os.path.exists(sResampledCsv): break
+            iLast = iLastBarTimestamp(sResampledCsv)
+            if iLast is None: break
+            lLast.append(iLast)
+        else:
+            # the earliest last bar, moved back to the start of a bar
+            # of every timeframe, so no bar is remade from part of its data
+            iStart = min(lLast)
+            while True:
+                iAligned = min([iStart - iStart % dNanos[sTimeFrame]
+                                for sTimeFrame in lTimeFrames])
+                if iAligned == iStart: break
+                iStart = iAligned
+        if iStart is None:
+            print "WARN: not all of the resampled files exist, remaking them"
+    # the feed caches that can be updated rather than remade
+    dCaches = {}
+    if iStart is not None:
+        for sTimeFrame in lTimeFrames:
+            if bFeedCacheValid(dResampledCsvs[sTimeFrame]):
+                dCaches[sTimeFrame] = []
+
+    iRaw = 0
+    iLastTimestamp = None
+    dBars = dict([(sTimeFrame, 0) for sTimeFrame in lTimeFrames])
+    dPending = dict([(sTimeFrame, None) for sTimeFrame in lTimeFrames])
+    dOut = {}
+    oRaw1 = None
+    # what was cut off the files that are appended to {sTimeFrame: (iOffset, sTail)},
+    # and the files that are written from the start, to undo a failure
+    dTails = {}
+    lWritten = []
+    try:
+        if iStart is not None:
+            for sTimeFrame in lTimeFrames:
+                iOffset, dNextBar[sTimeFrame], sTail = \
+                         tTruncateResampledCsv(dResampledCsvs[sTimeFrame], iStart,
+                                               dNanos[sTimeFrame])
+                dTails[sTimeFrame] = (iOffset, sTail,)
+        if iStart is None:
+            print "INFO: streaming " + sRaw1
+            oReader = mReadMt4Raw1Min(sRaw1, lColumns=['O'], iChunkRows=iChunkRows)
+        else:
+            oRaw1 = open(sRaw1, 'rb')
+            iOffset = iSeekMt4Csv(oRaw1, iStart)
+            print "INFO: streaming %s from byte %d" % (sRaw1, iOffset,)
+            oReader = mReadMt4Raw1Min(oRaw1, lColumns=['O'], iChunkRows=iChunkRows)
+        for sTimeFrame in lTimeFrames:
+            if iStart is None:
+                lWritten.append(sTimeFrame)
+            dOut[sTimeFrame] = open(dResampledCsvs[sTimeFrame],
+                                    'w' if iStart is None else 'a')
+
+        for mChunk in oReader:
+            aTimestamps = mChunk.index.asi8
+            if len(aTimestamps) == 0:
+                continue
+            assert (iLastTimestamp is None or aTimestamps[0] >= iLastTimestamp) \
+                   and (numpy.diff(aTimestamps) >= 0).all(), \
+                   "ERROR: the 1 minute data is not sorted: " +sRaw1
+            iLastTimestamp = aTimestamps[-1]
+            iRaw += len(aTimestamps)
+
+            # like vResample1Min, the bars are sampled from the open
+            aOpen = mChunk['O'].values
+            # the bars of this chunk alone, before merging the carried bar
+            dChunkBars = {}
+            for sTimeFrame in lTimeFrames:
+                iNanos = dNanos[sTimeFrame]
+                sSource = dSource[sTimeFrame]
+                if sSource is None:
+                    mBars = mAggregateOhlc(aTimestamps, aOpen, aOpen, aOpen, aOpen,
+                                           iNanos)
+                else:
+                    mSource = dChunkBars[sSource]
+                    mBars = mAggregateOhlc(mSource.index.asi8,
+                                           mSource['open'].values,
+                                           mSource['high'].values,
+                                           mSource['low'].values,
+                                           mSource['close'].values,
+                                           iNanos)
+                dChunkBars[sTimeFrame] = mBars
+
+                if dPending[sTimeFrame] is not None:
+                    mBars = mMergeBar(dPending[sTimeFrame], mBars)
+                dPending[sTimeFrame] = mBars.iloc[-1:]
+                mDone = mFillGaps(mBars.iloc[:-1], iNanos, dNextBar[sTimeFrame])
+                if len(mDone):
+                    mDone.to_csv(dOut[sTimeFrame], header=False,
+                                 date_format=dDateFormats[sTimeFrame])
+                    dBars[sTimeFrame] += len(mDone)
+                    dNextBar[sTimeFrame] = mDone.index.asi8[-1] + iNanos
+                    if sTimeFrame in dCaches:
+                        dCaches[sTimeFrame].append(mDone)
+
+        for sTimeFrame in lTimeFrames:
+            if dPending[sTimeFrame] is None: continue
+            mDone = mFillGaps(dPending[sTimeFrame], dNanos[sTimeFrame],
+                              dNextBar[sTimeFrame])
+            mDone.to_csv(dOut[sTimeFrame], header=False,
+                         date_format=dDateFormats[sTimeFrame])
+            dBars[sTimeFrame] += len(mDone)
+            if sTimeFrame in dCaches:
+                dCaches[sTimeFrame].append(mDone)
+    except:
+        tError = sys.exc_info()
+        for oOut in dOut.values():
+            oOut.close()
+        # dont leave a partial file to be mistaken for a finished one,
+        # and dont lose the history of the files that were appended to
+        for sTimeFrame, (iOffset, sTail,) in dTails.items():
+            vRestoreResampledCsv(dResampledCsvs[sTimeFrame], iOffset, sTail)
+        for sTimeFrame in lWritten:
+            if os.path.exists(dResampledCsvs[sTimeFrame]):
+                os.remove(dResampledCsvs[sTimeFrame])
+        raise tError[0], tError[1], tError[2]
+    finally:
+        for oOut in dOut.values():
+            oOut.close()
+        if oRaw1 is not None:
+            oRaw1.close()
+
+    for sTimeFrame, lDone in dCaches.items():
+        # no new bars leaves the cache stale, to be remade when it is read
+        if not lDone: continue
+        sResampledCsv = dResampledCsvs[sTimeFrame]
+        try:
+            vAppendFeedCache(sResampledCsv, pandas.concat(lDone), iStart)
+        except (IOError, OSError, ValueError, AssertionError,) as e:
+            print "WARN: not caching %s: %s" % (sResampledCsv, str(e),)
+
+    for sTimeFrame in lTimeFrames:
+        oFd.write("INFO: sampled length from %d to %d raw/%s = %.2f\n" % (iRaw,
+                                                                          dBars[sTimeFrame],
+                                                                          sTimeFrame,
+                                                                          iRaw/float(sTimeFrame)))
+        print "INFO: wrote "+dResampledCsvs[sTimeFrame]
+
+def sFeedCacheDir(sCsvFile):
+    return sCsvFile + sFEED_CACHE_SUFFIX
+
+def dFeedCacheStamp(sCsvFile):
+    """
+    The stamp that the feed cache of sCsvFile is valid for:
+    if the size or the mtime of the CSV file change, the cache is stale.
+    """
+    oStat = os.stat(sCsvFile)
+    return dict(iSize=oStat.st_size,
+                fMtime=oStat.st_mtime,
+                fVersion=fFEED_CACHE_VERSION)
+
+def bFeedCacheValid(sCsvFile):
+    sMetaFile = os.path.join(sFeedCacheDir(sCsvFile), 'meta.json')
+    if not os.path.isfile(sMetaFile):
+        return False
+    try:
+        with open(sMetaFile, 'r') as oFd:
+            dMeta = json.load(oFd)
+    except (IOError, ValueError,):
+        return False
+    for sKey, gVal in dFeedCacheStamp(sCsvFile).items():
+        if dMeta.get(sKey) != gVal:
+            return False
+    return True
+
+def vSaveReplacing(sNpyFile, aArray):
+    """
+    Save aArray to a new file and rename it over sNpyFile, rather than
+    overwriting it, as feeds may still be memory-mapped from the old one.
+    """
+    sTmpFile = sNpyFile + '.tmp'
+    with open(sTmpFile, 'wb') as oFd:
+        numpy.save(oFd, aArray)
+    try:
+        os.rename(sTmpFile, sNpyFile)
+    except OSError:
+        # windows will not rename over an existing file
+        os.remove(sNpyFile)
+        os.rename(sTmpFile, sNpyFile)
+
+def vAppendFeedCache(sCsvFile, mBars, iStart):
+    """
+    Update the feed cache of sCsvFile after vResample1MinAppend replaced
+    its bars from iStart on with mBars, without reparsing the CSV file.
+    """
+    mOhlc = oReadFeedCache(sCsvFile)
+    mOhlc = mOhlc[mOhlc.index.asi8 < iStart]
+    mBars = mBars.copy()
+    mBars.columns = lOHLC_COLUMNS
+    vWriteFeedCache(sCsvFile, pandas.concat([mOhlc, mBars]))
+
+def vWriteFeedCache(sCsvFile, mOhlc):
+    """
+    Write the DataFrame mOhlc read from sCsvFile into its feed cache.
+    The meta.json is removed first and written last, so that
+    an interrupted write leaves an invalid cache, not a corrupt one.
+    """
+    sDir = sFeedCacheDir(sCsvFile)
+    if not os.path.isdir(sDir):
+        os.mkdir(sDir)
+    sMetaFile = os.path.join(sDir, 'meta.json')
+    if os.path.exists(sMetaFile):
+        os.remove(sMetaFile)
+
+    vWriteFeedArrays(sDir, mOhlc)
+    with open(sMetaFile, 'w') as oFd:
+        json.dump(dFeedCacheStamp(sCsvFile), oFd)
+
+def vWriteFeedArrays(sDir, mOhlc, sDtype='float64'):
+    """
+    Write the OHLC feed mOhlc as the numpy files timestamp.npy and ohlc.npy
+    in the directory sDir, with the prices in sDtype, for oReadFeedArrays.
+    """
+    aTimestamps = numpy.asarray(mOhlc.index.asi8, dtype='int64')
+    # one contiguous row per column, so the DataFrame can be a view of it
+    aOhlc = numpy.ascontiguousarray(mOhlc[lOHLC_COLUMNS].values.T,
+                                    dtype=sDtype)
+    vSaveReplacing(os.path.join(sDir, 'timestamp.npy'), aTimestamps)
+    vSaveReplacing(os.path.join(sDir, 'ohlc.npy'), aOhlc)
+
+def oReadFeedCache(sCsvFile):
+    """
+    Read the feed cache of sCsvFile without copying: the DataFrame is
+    a view on copy-on-write memory maps of the cache files, so modifying
+    it does not write to them, and pages are only read from disk when used.
+    The copies of a feed that FeedRegistry shares are made read-only.
+    """
+    return oReadFeedArrays(sFeedCacheDir(sCsvFile))
+
+def oReadFeedArrays(sDir):
+    """
+    Read the feed written by vWriteFeedArrays in sDir as a DataFrame that
+    is a view on copy-on-write memory maps of its files: processes
+    that read the same files share the pages of their prices.
+    """
+    aTimestamps = numpy.load(os.path.join(sDir, 'timestamp.npy'), mmap_mode='c')
+    aOhlc = numpy.load(os.path.join(sDir, 'ohlc.npy'), mmap_mode='c')
+    assert aOhlc.shape == (len(lOHLC_COLUMNS), len(aTimestamps)), \
+           "ERROR: corrupt feed cache: " +sDir
+    oIndex = pandas.DatetimeIndex(aTimestamps.view('M8[ns]'), name='timestamp')
+    return pandas.DataFrame(aOhlc.T, index=oIndex, columns=lOHLC_COLUMNS,
+                            copy=False)
+
+def bIsFeedDtype(mOhlc, sDtype):
+    return all([oDtype == numpy.dtype(sDtype) for oDtype in mOhlc.dtypes])
+
+def mCompactOhlc(mOhlc, sDtype='float64'):
+    """
+    The feed mOhlc with its prices in sDtype, one of lFEED_DTYPES:
+    mOhlc itself if they already are, otherwise a copy. In float32,
+    a feed takes half the memory, so twice as many can be kept resident.
+    """
+    assert sDtype in lFEED_DTYPES, \
+           "ERROR: sFeedDtype must be one of " +str(lFEED_DTYPES)
+    if bIsFeedDtype(mOhlc, sDtype):
+        return mOhlc
+    return mOhlc.astype(sDtype)
+
+def oReadMt4Csv(sResampledCsv, sTimeFrame, sSymbol, sYear="", bUseCache=True,
+                sDtype='float64'):
+    """
+    Read the resampled Mt4 CSV file sResampledCsv into an OHLC DataFrame,
+    with the prices in sDtype (see mCompactOhlc).
+    The feed is registered in oFEED_REGISTRY by the fingerprint of the
+    file contents, so the same file is only read once, whatever names
+    it is asked for under, and the same DataFrame is returned each time.
+    The feed cache on disk is always in float64.
+    """
+    mOhlc = oFEED_REGISTRY.get(sResampledCsv)
+    if mOhlc is not None:
+        bReplace = not bIsFeedDtype(mOhlc, sDtype)
+        mOhlc = mCompactOhlc(mOhlc, sDtype)
+        oFEED_REGISTRY.vRegister(sResampledCsv, mOhlc, sSymbol, sTimeFrame, sYear,
+                                 bReplace=bReplace)
+        return mOhlc
+
+    if bUseCache and bFeedCacheValid(sResampledCsv):
+        try:
+            mOhlc = oReadFeedCache(sResampledCsv)
+        except (IOError, ValueError, AssertionError,) as e:
+            # a corrupt cache is remade from the CSV file
+            print "WARN: not reading cache %s: %s" % (sFeedCacheDir(sResampledCsv), str(e),)
+        else:
+            print "INFO: reading cache " + sFeedCacheDir(sResampledCsv)
+            mOhlc = mCompactOhlc(mOhlc, sDtype)
+            oFEED_REGISTRY.vRegister(sResampledCsv, mOhlc, sSymbol, sTimeFrame, sYear)
+            return mOhlc
+
+    print "INFO: reading " + sResampledCsv
+    mOhlc = pandas.read_csv(sResampledCsv,
+                            names=['T', 'O', 'H', 'L', 'C'],
+                            dtype={'T': str,
+                                   'O': 'float64',
+                                   'H': 'float64',
+                                   'L': 'float64',
+                                   'C': 'float64'})
+    mOhlc = mIndexByMt4Timestamps(mOhlc, 'T')
+    if bUseCache:
+        try:
+            vWriteFeedCache(sResampledCsv, mOhlc)
+        except (IOError, OSError,) as e:
+            # a read-only history directory is not an error
+            print "WARN: not caching %s: %s" % (sResampledCsv, str(e),)
+    mOhlc = mCompactOhlc(mOhlc, sDtype)
+    oFEED_REGISTRY.vRegister(sResampledCsv, mOhlc, sSymbol, sTimeFrame, sYear)
+    return mOhlc
+
+def dReadMt4HstHeader(sHstFile):
+    aHeader = numpy.fromfile(sHstFile, dtype=oHST_HEADER_DTYPE, count=1)
+    assert len(aHeader) == 1, "ERROR: not an hst file: " +sHstFile
+    iVersion = int(aHeader['version'][0])
+    assert iVersion in dHST_DTYPES, \
+           "ERROR: unsupported hst version %d: %s" % (iVersion, sHstFile,)
+    return dict(iVersion=iVersion,
+                sSymbol=aHeader['symbol'][0].split('\0')[0],
+                iPeriod=int(aHeader['period'][0]),
+                iDigits=int(aHeader['digits'][0]))
+
+def aMapMt4Hst(sHstFile, iVersion=None):
+    """
+    Memory-map the records of the Metatrader history file sHstFile as a
+    numpy structured array; see oHST401_DTYPE and oHST400_DTYPE.
+    A partly written last record is left out.
+    """
+    if iVersion is None:
+        iVersion = dReadMt4HstHeader(sHstFile)['iVersion']
+    oDtype = dHST_DTYPES[iVersion]
+    iRecords = (os.path.getsize(sHstFile) - iHST_HEADER_BYTES) // oDtype.itemsize
+    if iRecords <= 0:
+        return numpy.zeros(0, dtype=oDtype)
+    return numpy.memmap(sHstFile, dtype=oDtype, mode='c',
+                        offset=iHST_HEADER_BYTES, shape=(iRecords,))
+
+def oReadMt4Hst(sHstFile, sTimeFrame="", sSymbol="", sYear="", sDtype='float64'):
+    """
+    Read the Metatrader history file sHstFile into an OHLC DataFrame
+    without parsing or copying the prices: the four price fields are
+    adjacent doubles in each record, so the DataFrame is a strided view
+    of the memory-mapped records. Only the timestamp index is made.
+    The symbol and timeframe default to those in the file header.
+    The columns are in the order of lOHLC_COLUMNS, but in the version 400
+    records the low comes before the high, which no one strided view can
+    reorder, so their prices are copied, as they are in float32
+    (see mCompactOhlc).
+    """
+    dHeader = dReadMt4HstHeader(sHstFile)
+    if not sSymbol: sSymbol = dHeader['sSymbol']
+    if not sTimeFrame: sTimeFrame = str(dHeader['iPeriod'])
+    mOhlc = oFEED_REGISTRY.get(sHstFile)
+    if mOhlc is not None:
+        bReplace = not bIsFeedDtype(mOhlc, sDtype)
+        mOhlc = mCompactOhlc(mOhlc, sDtype)
+        oFEED_REGISTRY.vRegister(sHstFile, mOhlc, sSymbol, sTimeFrame, sYear,
+                                 bReplace=bReplace)
+        return mOhlc
+
+    print "INFO: mapping " + sHstFile
+    aRecords = aMapMt4Hst(sHstFile, dHeader['iVersion'])
+    oDtype = aRecords.dtype
+    # the price columns in the order they are in the record
+    lColumns = sorted(lOHLC_COLUMNS, key=lambda sName: oDtype.fields[sName][1])
+    aPrices = numpy.lib.stride_tricks.as_strided(aRecords[lColumns[0]],
+                                                 shape=(len(aRecords), len(lColumns)),
+                                                 strides=(oDtype.itemsize,
+                                                          oDtype.fields['O'][0].itemsize))
+    aTimestamps = aRecords['ctm'].astype('int64') * 10**9
+    oIndex = pandas.DatetimeIndex(aTimestamps.view('M8[ns]'), name='timestamp')
+    mOhlc = pandas.DataFrame(aPrices, index=oIndex, columns=lColumns,
+                             copy=False)
+    if lColumns != lOHLC_COLUMNS:
+        # the callers that index the columns by position expect O H L C
+        mOhlc = mOhlc[lOHLC_COLUMNS]
+    mOhlc = mCompactOhlc(mOhlc, sDtype)
+    oFEED_REGISTRY.vRegister(sHstFile, mOhlc, sSymbol, sTimeFrame, sYear)
+    return mOhlc
+
+def oPreprocessOhlc(oOhlc):
+    # is this in-place? dropna copies, so dont if there is nothing to drop
+    if not oOhlc.isnull().values.any():
+        return oOhlc
+    mOhlc = oOhlc.dropna(how='any')
+    # the feed without the NaNs of a registered feed is known by its file too
+    sFingerprint = oFEED_REGISTRY.oMemo.get(lFeedArrays(oOhlc))
+    if sFingerprint is not None:
+        oFEED_REGISTRY.vMemoFeed(sFingerprint + '-dropna', mOhlc)
+    return mOhlc
@@ -8,6 +8,7 @@ The subcommands are:
 * feed      - Create feeds (pandas DataFrames) from CSV OHLCV files
 * recipe    - Set the recipe that the chef will use, and make the ingredients from the feeds
 * chef      - Set the chef that we will use, and cook from the ingredients and the feeds
+* sweep     - Cook the recipe for every combination of the parameters in its [sweep]
 * servings  - List the servings the chef has cooked, and dish out the servings
 * plot      - Plot the servings the chef has cooked, using matplotlib
 """
@@ -28,6 +29,9 @@ except ImportError:
 
 from OpenTrader.OTUtils import sStripCreole, lConfigToList
 from OpenTrader.doer import Doer
+from OpenTrader.FeedCache import oFEED_CACHE, oFEED_REGISTRY
+from OpenTrader.IngredientCache import oINGREDIENT_CACHE
+from OpenTrader.CookGraph import oCOOK_GRAPH
 
 sCURRENT_OMLETTE_DIR = ""
 
@@ -52,14 +56,69 @@ LCOMMANDS = []
 
 #? feed rename delete
 
-dFEED_CACHE = {}
+# a view of the shared feed cache: see back feed cache
+dFEED_CACHE = oFEED_CACHE.oView('feed')
 sFEED_CACHE_KEY = ""
 
+def vSetCurrentFeed(sKey):
+    """
+    Make sKey the current feed, which is pinned in the feed cache so that
+    it is not evicted while the recipes and chefs are using it.
+    """
+    global sFEED_CACHE_KEY
+    if sFEED_CACHE_KEY:
+        dFEED_CACHE.vUnpin(sFEED_CACHE_KEY)
+    sFEED_CACHE_KEY = sKey
+    if sKey:
+        dFEED_CACHE.vPin(sKey)
+
+def dCurrentFeed():
+    """The current feed, or an error if no feed has been read."""
+    assert sFEED_CACHE_KEY and sFEED_CACHE_KEY in dFEED_CACHE, \
+           "ERROR: Run \"back feed read_*\" first to read a DataFrame"
+    return dFEED_CACHE[sFEED_CACHE_KEY]
+
+def dHdfProfile(ocmd2, sProfile):
+    """
+    The storage profile sProfile: that of Omlette.dHDF_PROFILES,
+    updated from the [omlette.PROFILE] section of the ini, if any.
+    """
+    from OpenTrader.Omlettes.Omlette import dHDF_PROFILES
+    sSection = 'omlette.' +sProfile
+    assert sProfile in dHDF_PROFILES or sSection in ocmd2.oConfig, \
+           "ERROR: unknown omlette profile %r; not in %r" % (sProfile, lHdfProfiles(ocmd2),)
+    dProfile = dict(dHDF_PROFILES.get(sProfile, {}))
+    if sSection in ocmd2.oConfig:
+        dProfile.update(ocmd2.oConfig[sSection])
+    return dProfile
+
+def lHdfProfiles(ocmd2):
+    from OpenTrader.Omlettes.Omlette import dHDF_PROFILES
+    lProfiles = dHDF_PROFILES.keys()
+    for sSection in ocmd2.oConfig.keys():
+        if sSection.startswith('omlette.') and sSection[8:] not in lProfiles:
+            lProfiles.append(sSection[8:])
+    return lProfiles
+
+def dOmletteParams(ocmd2):
+    """The parameters of the HDF writes from the [omlette] section of the ini."""
+    dOmlette = ocmd2.oConfig['omlette'] if 'omlette' in ocmd2.oConfig else {}
+    dParams = dict(sHdfFormat=dOmlette.get('sHdfFormat', 'table'),
+                   gHdfDataColumns=dOmlette.get('gHdfDataColumns', True),
+                   sHdfFlush=dOmlette.get('sHdfFlush', 'stage'),
+                   bHdfThread=dOmlette.get('bHdfThread', False),
+                   iHdfQueue=dOmlette.get('iHdfQueue', 4))
+    sProfile = dOmlette.get('sHdfProfile', '')
+    if sProfile:
+        # the profile is the layout and the compression of the store
+        dParams.update(dHdfProfile(ocmd2, sProfile))
+    return dParams
+
 def oEnsureOmlette(ocmd2, _oValues, sNewOmlette=""):
     from OpenTrader.Omlettes import Omlette
     if not sNewOmlette and hasattr(ocmd2, 'oOm') and ocmd2.oOm:
         return ocmd2.oOm
-    oOm = Omlette.Omlette(oFd=sys.stdout)
+    oOm = Omlette.Omlette(oFd=sys.stdout, **dOmletteParams(ocmd2))
     if sNewOmlette:
         # The default is no HDF file - it's not in ocmd2.oOptions.sOmlette
         oOm.oAddHdfStore(sNewOmlette)
@@ -102,6 +161,8 @@ def oEnsureChef(ocmd2, oValues, sNewChef=""):
     return oOm.oChefModule
 
 def vClearOven(ocmd2, oValues):
+    # the stages that were cooked are still kept by oCOOK_GRAPH,
+    # so the next chef cook only redoes the ones that have changed
     oOm = oEnsureOmlette(ocmd2, oValues)
     oOm.oBt = None
 
@@ -128,11 +189,22 @@ the parameters used by the cook, and the servings results.
 You should open an omlette before you backtest giving it a filename,
 and close it after the 'chef cook' and 'servings'.
 {{{
-back omlette open FILE           - open an HDF file to save all the backtest parts
-back omlette check               - show the current omlette filename
+back omlette open FILE [PROFILE] - open an HDF file to save all the backtest parts
+back omlette check               - show the current omlette filename and storage
+back omlette profiles            - list the storage profiles
 back omlette display             - display the current omlette HDF sections
 back omlette close               - close the HDF file saving the omlette
+back omlette commit              - write what is queued to the HDF file now
 }}}
+The writes to the HDF file are queued, and written together at the end
+of each back command, or when the omlette is closed, as set by sHdfFlush
+in the [omlette] section of the ini file, with the format of the writes.
+The layout and compression of the file are those of the storage profile
+PROFILE, or of sHdfProfile there: fast, compact or archive, or any
+other [omlette.PROFILE] section of the ini file.
+If bHdfThread is set there, they are written by a thread while the
+next command runs; they are all written when the omlette is closed or
+the program exits.
 Real Soon Now you will be able to enjoy them more by reloading previously saved
 omlettes, plotting the data or the results, and adding or editing comments.
         """
@@ -148,7 +220,8 @@ omlettes, plotting the data or the results, and adding or editing comments.
         # plot sSection
         #
         lArgs = self.lArgs
-        _lCmds = ['load', 'open', 'check', 'save', 'close', 'display']
+        _lCmds = ['load', 'open', 'check', 'save', 'close', 'display', 'commit',
+                  'profiles']
         assert len(lArgs) > 1, "ERROR: " +sDo +" " +str(_lCmds)
         sCmd = lArgs[1]
         assert sCmd in _lCmds, "ERROR: " +sDo +" " +str(_lCmds)
@@ -160,11 +233,19 @@ omlettes, plotting the data or the results, and adding or editing comments.
             assert oOm.oHdfStore is not None
             # FixMe: something better than filename
             self.poutput(sDo +" filename: " +oOm.oHdfStore.filename)
+            self.poutput(sDo +" storage: %s %s level %d" % (
+                oOm.sHdfFormat, oOm.sComplib, oOm.iComplevel,))
+            return
+
+        if sCmd == 'profiles':
+            for sProfile in lHdfProfiles(self.ocmd2):
+                self.poutput(sProfile +": " +repr(dHdfProfile(self.ocmd2, sProfile)))
             return
 
         if sCmd == 'display':
             # display gives a complete listing of the contents of the HDF file
             assert hasattr(oOm, 'oHdfStore') and oOm.oHdfStore
+            oOm.vWaitHdf()
             self.poutput(repr(oOm.oHdfStore))
             return
 
@@ -177,11 +258,20 @@ omlettes, plotting the data or the results, and adding or editing comments.
             oOm.vClose()
             return
 
+        if sCmd == 'commit':
+            assert oOm.oHdfStore is not None, \
+                   "ERROR: " +sDo +" " +sCmd +"; not open: use '" +sDo +" open FILE'"
+            oOm.vCommitHdf()
+            oOm.vWaitHdf()
+            return
+
         assert len(lArgs) >= 3, \
                "ERROR: " +sDo +" " +sCmd +" " +" FILENAME"
         sFile = lArgs[2]
 
         if sCmd == 'open':
+            if len(lArgs) > 3:
+                oOm.vSetHdfProfile(dHdfProfile(self.ocmd2, lArgs[3]))
             o = oOm.oAddHdfStore(sFile)
             assert o is not None and oOm.oHdfStore is not None
             sCURRENT_OMLETTE_DIR = os.path.dirname(sFile)
@@ -209,10 +299,13 @@ back feed dir                                  - NotImplemented
 back feed dir dirname                          - NotImplemented
 
 back feed read_mt4_csv SYMBOL TIMEFRAME [YEAR] - read a CSV file from Mt4 into pandas
+back feed read_mt4_hst FILENAME [SYMBOL TIMEFRAME] - map an Mt4 .hst history file into pandas
 back feed read_yahoo_csv SYMBOL [STARTYEAR]    - read a Yahoo internet feed into pandas
 back feed list                                 - list the feeds we have read
 back feed get                                  - get the key name of the current feed
 back feed info                                 - concise summary of the DataFrame
+back feed cache stats                          - show the feed cache, the files, the ingredients and cook stages in it
+back feed cache clear                          - empty the feed cache
 back feed plot                                 - plot the CSV data using OTPpnAmgc
                This plots the feed, with SMA, RSIs and MACDs, using matplotlib.
 }}}
@@ -227,7 +320,8 @@ back feed plot                                 - plot the CSV data using OTPpnAm
 
         #? rename delete
         _lCmds = ['dir', 'list', 'get', 'set',
-                  'read_mt4_csv', 'read_yahoo_csv', 'info', 'plot', 'to_hdf']
+                  'read_mt4_csv', 'read_mt4_hst', 'read_yahoo_csv', 'info', 'plot', 'to_hdf',
+                  'cache']
         assert len(lArgs) > 1, "ERROR: " +sDo +" command required: " +str(_lCmds)
         sCmd = lArgs[1]
         assert lArgs[1] in _lCmds, "ERROR: " +sDo +" " +str(_lCmds)
@@ -250,7 +344,6 @@ back feed plot                                 - plot the CSV data using OTPpnAm
             return
 
         if sCmd == 'read_mt4_csv':
-            from OpenTrader.PandasMt4 import oReadMt4Csv
             assert len(lArgs) >= 3, \
                    "ERROR: " +sDo +" " +sCmd +" FILENAME [SYMBOL TIMEFRAME YEAR]"
             sFile = lArgs[2]
@@ -285,9 +378,10 @@ back feed plot                                 - plot the CSV data using OTPpnAm
                        +", sYear=" +sYear \
                        +", sTimeFrame=" +sTimeFrame)
 
-            mFeedOhlc = oReadMt4Csv(sFile, sTimeFrame, sSymbol, sYear="")
-            assert mFeedOhlc is not None, "oReadMt4Csv failed on " + sFile
-            mFeedOhlc.info(True, sys.stdout)
+            # parse the CSV once, then serve it from its feed cache;
+            # the Omlette reads it through oFEED_REGISTRY, keyed by its contents
+            bUseCache = self.ocmd2.oConfig['feed'].get('bUseFeedCache', True)
+            sDtype = self.ocmd2.oConfig['feed'].get('sFeedDtype', 'float64')
 
             # NaturalNameWarning: object name is not a valid Python identifier: 'Mt4_csv|EURUSD|1440|2014'; it does not match the pattern ``^[a-zA-Z_][a-zA-Z0-9_]*$``;
             sKey = 'Mt4_csv' +'_' +sSymbol +'_' +sTimeFrame +'_' +sYear
@@ -295,14 +389,72 @@ back feed plot                                 - plot the CSV data using OTPpnAm
             _dCurrentFeedFrame = oOm.dGetFeedFrame(sFile,
                                                    sTimeFrame,
                                                    sSymbol,
-                                                   sYear)
-            from OpenTrader.PandasMt4 import oReadMt4Csv, oPreprocessOhlc, vResampleFiles
+                                                   sYear,
+                                                   bUseCache=bUseCache,
+                                                   sDtype=sDtype)
+            from OpenTrader.PandasMt4 import oPreprocessOhlc
+            assert _dCurrentFeedFrame['mFeedOhlc'] is not None, \
+                   "oReadMt4Csv failed on " + sFile
+            _dCurrentFeedFrame['mFeedOhlc'].info(True, sys.stdout)
             mFeedOhlc = oPreprocessOhlc(_dCurrentFeedFrame['mFeedOhlc'])
             sys.stdout.write('INFO:  Data Open length: %d\n' % len(mFeedOhlc))
             _dCurrentFeedFrame['mFeedOhlc'] = mFeedOhlc
 
             dFEED_CACHE[sKey] = _dCurrentFeedFrame
-            sFEED_CACHE_KEY = sKey
+            vSetCurrentFeed(sKey)
+            return
+
+        if sCmd == 'read_mt4_hst':
+            assert len(lArgs) >= 3, \
+                   "ERROR: " +sDo +" " +sCmd +" FILENAME [SYMBOL TIMEFRAME]"
+            sFile = lArgs[2]
+            if not os.path.isabs(sFile):
+                sFile = os.path.join(self.ocmd2.sRoot, sFile)
+            assert os.path.isfile(sFile), \
+                   "ERROR: " +sDo +" " +sCmd +" file not found " +sFile
+            sSymbol = ""
+            sTimeFrame = ""
+            if len(lArgs) > 4:
+                sSymbol = lArgs[3]
+                sTimeFrame = lArgs[4]
+
+            sDtype = self.ocmd2.oConfig['feed'].get('sFeedDtype', 'float64')
+            oOm = oEnsureOmlette(self.ocmd2, oValues)
+            # the symbol and timeframe default to those in the hst header
+            _dCurrentFeedFrame = oOm.dGetHstFeedFrame(sFile,
+                                                      sTimeFrame=sTimeFrame,
+                                                      sSymbol=sSymbol,
+                                                      sDtype=sDtype)
+            sSymbol = _dCurrentFeedFrame['sSymbol']
+            sTimeFrame = _dCurrentFeedFrame['sTimeFrame']
+            self.vDebug(sDo +" " +sCmd +" " + \
+                       "sSymbol=" +sSymbol \
+                       +", sTimeFrame=" +sTimeFrame)
+            from OpenTrader.PandasMt4 import oPreprocessOhlc
+            mFeedOhlc = oPreprocessOhlc(_dCurrentFeedFrame['mFeedOhlc'])
+            mFeedOhlc.info(True, sys.stdout)
+            _dCurrentFeedFrame['mFeedOhlc'] = mFeedOhlc
+
+            sKey = 'Mt4_hst' +'_' +sSymbol +'_' +sTimeFrame
+            dFEED_CACHE[sKey] = _dCurrentFeedFrame
+            vSetCurrentFeed(sKey)
+            return
+
+        if sCmd == 'cache':
+            _lSubCmds = ['stats', 'clear']
+            assert len(lArgs) > 2 and lArgs[2] in _lSubCmds, \
+                   "ERROR: " +sDo +" " +sCmd +" " +'|'.join(_lSubCmds)
+            if lArgs[2] == 'stats':
+                self.poutput(pformat(self.G(oFEED_CACHE.dStats())))
+                self.poutput(pformat(self.G(oFEED_REGISTRY.dStats())))
+                self.poutput(pformat(self.G(oINGREDIENT_CACHE.dStats())))
+                self.poutput(pformat(self.G(oCOOK_GRAPH.dStats())))
+                return
+            # clear
+            oFEED_CACHE.vClear()
+            oCOOK_GRAPH.vClear()
+            oFEED_REGISTRY.dMetadata.clear()
+            vSetCurrentFeed("")
             return
 
         _lFeedCacheKeys = dFEED_CACHE.keys()
@@ -320,7 +472,7 @@ back feed plot                                 - plot the CSV data using OTPpnAm
             sKey = lArgs[2]
             assert sKey in _lFeedCacheKeys, \
                    "ERROR: " +sDo +" " +sCmd +" " + '|'.join(_lFeedCacheKeys)
-            sFEED_CACHE_KEY = sKey
+            vSetCurrentFeed(sKey)
             return
 
         # The following all require that a feed has been loaded
@@ -422,6 +574,9 @@ back recipe config KEY                  - show the current config of KEY
 back recipe config KEY VAL              - set the current config of KEY to VAL
 back recipe config tabview              - view the config with tabview
 }}}
+The ingredients are kept for each feed and config that they were made
+from (see OpenTrader/CookGraph.py), so setting a config back to a value
+that was used before does not make them again.
         """
         global dFEED_CACHE
         global sFEED_CACHE_KEY
@@ -456,6 +611,9 @@ back recipe config tabview              - view the config with tabview
         if sCmd == 'config':
             oRecipe = oEnsureRecipe(self.ocmd2, oValues)
             self.ocmd2.vConfigOp(lArgs, oRecipe.oConfig)
+            if len(lArgs) > 4:
+                # the servings are of the old config: chef cook again
+                vClearOven(self.ocmd2, oValues)
             return
 
         if sCmd == 'set':
@@ -474,19 +632,17 @@ back recipe config tabview              - view the config with tabview
             return
 
         # The following all require that a feed has been loaded
-        assert sFEED_CACHE_KEY
-        assert sFEED_CACHE_KEY in dFEED_CACHE
-        _dCurrentFeedFrame = dFEED_CACHE[sFEED_CACHE_KEY]
-        assert _dCurrentFeedFrame
+        _dCurrentFeedFrame = dCurrentFeed()
         if sCmd == 'make' or sCmd == 'ingredients':
             assert _dCurrentFeedFrame
             oRecipe = oEnsureRecipe(self.ocmd2, oValues)
+            oOm = oEnsureOmlette(self.ocmd2, oValues)
             # ugly
             dFeedParams = _dCurrentFeedFrame
             mFeedOhlc = _dCurrentFeedFrame['mFeedOhlc']
             dFeeds = dict(mFeedOhlc=mFeedOhlc, dFeedParams=dFeedParams)
 
-            oRecipe.dMakeIngredients(dFeeds)
+            oCOOK_GRAPH.tIngredients(dFeeds, oRecipe, oOm)
             assert oRecipe.dIngredients
             return
 
@@ -505,6 +661,9 @@ back chef set                           - show the current chef
 back chef set CHEF                      - set the current chef
 back chef cook                          - cook the recipe by the chef
 }}}
+The cook makes the ingredients if they have not been made, and only
+redoes the stages whose feed, recipe config or chef have changed since
+they were cooked: see OpenTrader/CookGraph.py.
         """
         global dFEED_CACHE
         global sFEED_CACHE_KEY
@@ -547,10 +706,7 @@ back chef cook                          - cook the recipe by the chef
             return
 
         # The following all require that a feed has been loaded
-        assert sFEED_CACHE_KEY
-        assert sFEED_CACHE_KEY in dFEED_CACHE
-        _dCurrentFeedFrame = dFEED_CACHE[sFEED_CACHE_KEY]
-        assert _dCurrentFeedFrame
+        _dCurrentFeedFrame = dCurrentFeed()
 
         # There's always a default provided of these
         oOm = oEnsureOmlette(self.ocmd2, oValues)
@@ -558,15 +714,19 @@ back chef cook                          - cook the recipe by the chef
         oChefModule = oEnsureChef(self.ocmd2, oValues)
 
         if sCmd == 'cook':
-            from OpenTrader.OTBackTest import oPyBacktestCook
-            assert oRecipe.dIngredients
             # ugly
             dFeeds = _dCurrentFeedFrame
 
-            oBt = oPyBacktestCook(dFeeds, oRecipe, oChefModule, oOm)
+            oBt = oCOOK_GRAPH.oCook(dFeeds, oRecipe, oChefModule, oOm)
             assert oBt is not None
             if type(oBt) == str:
                 raise RuntimeError(oBt)
+            if hasattr(oBt, 'dMcmddParams'):
+                dBacktest = self.ocmd2.oConfig['backtest']
+                oBt.dMcmddParams.update(
+                    runs=int(dBacktest.get('iMcmddRuns', 1000)),
+                    batch_size=int(dBacktest.get('iMcmddBatch', 0)) or None,
+                    random_state=dBacktest.get('iMcmddSeed', None))
             oOm.oBt = oBt
             # self.vDebug("Cooked " + oBt.sSummary())
             return
@@ -574,6 +734,89 @@ back chef cook                          - cook the recipe by the chef
         self.vError("Unrecognized chef command: " + str(lArgs) +'\n' +__doc__)
         return
 
+    # Cook the recipe for every combination of the parameters in its [sweep]
+    LCOMMANDS += ['sweep']
+    def backtest_sweep(self):
+        """
+==== OTCmd2 backtest sweep
+
+Cook the recipe on the current feed for every combination of the parameter
+values in the [sweep] section of the recipe ini, over a pool of
+iSweepWorkers processes, and tabulate the performance metrics of each.
+The workers memory-map one copy of the feed in shared memory.
+Recipes with a dApplyRecipeBatch can be swept with batch instead,
+in one process, without the metrics that need resampling or simulation.
+{{{
+back sweep grid                         - list the combinations of the parameters
+back sweep run                          - cook every combination and show the table
+back sweep batch                        - cook every combination in one vectorized pass
+back sweep show                         - show the table of the last sweep
+back sweep to_csv FILE                  - save the table of the last sweep as CSV
+}}}
+        """
+        global dFEED_CACHE
+        global sFEED_CACHE_KEY
+        lArgs = self.lArgs
+        oValues = self.oValues
+        sDo = 'sweep'
+        #!WTF local variable '__doc__' referenced before assignment
+        self.dhelp['sweep'] = __doc__
+
+        from OpenTrader.OTSweep import lSweepGrid, sParamName, mSweepRecipe, \
+             mSweepRecipeBatch
+        _lCmds = ['grid', 'run', 'batch', 'show', 'to_csv']
+        assert len(lArgs) > 1, "ERROR: not enough args: " +sDo +str(_lCmds)
+        sCmd = lArgs[1]
+        assert sCmd in _lCmds, "ERROR: %s %s not in: %r " % (
+            sDo, sCmd, _lCmds)
+
+        oOm = oEnsureOmlette(self.ocmd2, oValues)
+        oRecipe = oEnsureRecipe(self.ocmd2, oValues)
+        oConfigObj = oRecipe.oConfig()
+        assert 'sweep' in oConfigObj, \
+               "ERROR: no [sweep] section in the ini file of " +oRecipe.sName
+        # in the order of the ini file
+        lGrid = lSweepGrid(oConfigObj['sweep'])
+
+        if sCmd == 'grid':
+            for dParams in lGrid:
+                self.poutput(', '.join(["%s=%r" % (sParamName(tKey), gVal,)
+                                        for tKey, gVal in dParams.items()]))
+            return
+
+        if sCmd in ['show', 'to_csv']:
+            if getattr(oOm, 'mSweep', None) is None:
+                self.vError("Run \"back sweep run\" first to sweep the recipe")
+                return
+            if sCmd == 'show':
+                self.poutput(oOm.mSweep.to_string())
+                return
+            assert len(lArgs) > 2, "ERROR: " +sDo +" " +sCmd +" FILE"
+            oOm.mSweep.to_csv(lArgs[2], index=False)
+            return
+
+        # run and batch require that a feed has been loaded
+        _dCurrentFeedFrame = dCurrentFeed()
+        oChefModule = oEnsureChef(self.ocmd2, oValues)
+        if sCmd == 'batch':
+            assert hasattr(oRecipe, 'dApplyRecipeBatch'), \
+                   "ERROR: " +sDo +" " +sCmd +"; " +oRecipe.sName \
+                   +" has no dApplyRecipeBatch: use back sweep run"
+            oOm.mSweep = mSweepRecipeBatch(oRecipe.sName, _dCurrentFeedFrame['mFeedOhlc'],
+                                           oConfigObj.dict(), lGrid=lGrid,
+                                           sChef=oChefModule.sChef, oFd=sys.stdout)
+            oOm.vAppendHdf('recipe/sweep', oOm.mSweep)
+            self.poutput(oOm.mSweep.to_string())
+            return
+        iWorkers = int(self.ocmd2.oConfig['backtest'].get('iSweepWorkers', 0))
+        oOm.mSweep = mSweepRecipe(oRecipe.sName, _dCurrentFeedFrame['mFeedOhlc'],
+                                  oConfigObj.dict(), lGrid=lGrid,
+                                  sChef=oChefModule.sChef,
+                                  iWorkers=iWorkers, oFd=sys.stdout)
+        oOm.vAppendHdf('recipe/sweep', oOm.mSweep)
+        self.poutput(oOm.mSweep.to_string())
+        return
+
     # List the servings the chef has cooked, and dish out the servings
     LCOMMANDS += ['servings']
     def backtest_servings(self):
@@ -588,8 +831,14 @@ back servings trades          - show the trades: what was bought or sold
 back servings positions       - show how the trades effected the positions
 back servings equity          - show the results of the trades as equity differences
 back servings reviews         - show the metrics and reviews of the trades
+back servings rolling [WINDOW...] - the rolling metrics over windows of WINDOW trades
 back servings tabview SERVING - view with tabview: the SERVING, or reviews
 }}}
+The rolling metrics are sharpe, sortino, winrate, drawdown (from the
+highest equity of the window), underwater (from the highest so far) and
+duration (the trades since then), for each trade; they are stored in the
+omlette as recipe/servings/mRollingWINDOW. The default WINDOWs are the
+lRollingWindows of the [backtest] section of the ini file.
         """
         #? back reviews get/set/servings/tabview
 
@@ -611,6 +860,7 @@ back servings tabview SERVING - view with tabview: the SERVING, or reviews
 
         # ['signals', 'trades', 'positions', 'equity', 'reviews', 'trade_price']
         _lCmds = oChefModule.lProducedServings[:]
+        if hasattr(oBt, 'oMetrics'): _lCmds += ['rolling']
         if tabview and tabview not in _lCmds: _lCmds += ['tabview']
 
         if len(lArgs) == 1 or lArgs[1] == 'list':
@@ -623,6 +873,7 @@ back servings tabview SERVING - view with tabview: the SERVING, or reviews
         assert sCmd in _lCmds, "ERROR: %s %s not in %r" % (
             sDo, sCmd, _lCmds)
 
+        from OpenTrader.OTBackTest import dSERVINGS_HDF, gServe, vServeReviews
         oFd = sys.stdout
         # There's always a default provided of these
         oOm = oEnsureOmlette(self.ocmd2, oValues)
@@ -631,45 +882,32 @@ back servings tabview SERVING - view with tabview: the SERVING, or reviews
 
         ## oFun = getattr(self.ocmd2.oBt, sCmd)
         ## self.poutput(oFun())
-        if sCmd == 'signals':
-            # this was the same as: oBt._mSignals = bt.mSignals() or oBt.signals
-            oOm.oBt._mSignals = oRecipe.mSignals(oOm.oBt)
-            oFd.write('INFO:  bt.signals found: %d\n' % len(oOm.oBt.signals))
-            oOm.vAppendHdf('recipe/servings/mSignals', oOm.oBt.signals)
-            return
-
-        if sCmd == 'trades':
-            # this was the same as: oBt._mTrades =  oBt.mTrades() or oBt.trades
-            oOm.oBt._mTrades = oRecipe.mTrades(oOm.oBt)
-            oFd.write('INFO:  bt.trades found: %d\n' % len(oOm.oBt.trades))
-            oOm.vAppendHdf('recipe/servings/mTrades', oOm.oBt.trades)
+        # each serving is made once per cook, and written to the omlette once
+        if sCmd in dSERVINGS_HDF:
+            gServe(oOm.oBt, sCmd, oRecipe, oOm, oFd=oFd)
             return
 
-        if sCmd == 'positions':
-            # this was the same as: oBt._rPositions = oBt.rPositions() or oBt.positions
-            oOm.oBt._rPositions = oRecipe.rPositions(oOm.oBt, init_pos=0)
-            oFd.write('INFO:  bt.positions found: %d\n' % len(oOm.oBt.positions))
-            oOm.vAppendHdf('recipe/servings/rPositions', oOm.oBt.positions)
-            return
-
-        if sCmd == 'equity':
-            # this was the same as: oBt._rEquity = oBt.rEquity() or oBt.equity
-            oOm.oBt._rEquity = oRecipe.rEquity(oOm.oBt)
-            oFd.write('INFO:  bt.equity found: %d\n' % len(oOm.oBt.equity))
-            oOm.vAppendHdf('recipe/servings/rEquity', oOm.oBt.equity)
-            return
-
-        if sCmd == 'trade_price':
-            # oFd.write('INFO:  bt.rTradePrice() found: %d\n' % len(oBt.rTradePrice()))
-            oFd.write('INFO:  bt.trade_price found: %d\n' % len(oOm.oBt.trade_price))
-            oOm.vAppendHdf('recipe/servings/rTradePrice', oOm.oBt.trade_price)
+        if sCmd == 'metrics' or sCmd == 'reviews':
+            vServeReviews(oOm.oBt, oOm, oFd=oFd)
             return
 
-        if sCmd == 'metrics' or sCmd == 'reviews':
-            oOm.vSetTitleHdf('recipe/servings', oOm.oChefModule.sChef)
-            #? Leave this as derived or store it? reviews?
-            oOm.vSetMetadataHdf('recipe/servings', oOm.oBt.dSummary())
-            oFd.write(oOm.oBt.sSummary())
+        if sCmd == 'rolling':
+            if len(lArgs) > 2:
+                lWindows = [int(sArg) for sArg in lArgs[2:]]
+            else:
+                lWindows = self.ocmd2.oConfig['backtest'].get('lRollingWindows', [100])
+            for iWindow in lWindows:
+                assert iWindow > 1, "ERROR: " +sDo +" " +sCmd \
+                       +": the window must be more than 1 trade, not %r" % (iWindow,)
+                mRolling = oBt.oMetrics().mRolling(iWindow)
+                oFd.write('INFO:  bt rolling metrics over %d trades: %d\n' % (
+                    iWindow, len(mRolling),))
+                sKey = 'recipe/servings/mRolling%d' % iWindow
+                if oOm.dStageKeys.get(sKey) is not oBt:
+                    oOm.vAppendHdf(sKey, mRolling)
+                    oOm.dStageKeys[sKey] = oBt
+                if len(mRolling):
+                    oFd.write(mRolling.iloc[-1].to_string() +'\n')
             return
 
         if tabview and sCmd == 'tabview':
@@ -755,6 +993,11 @@ back plot equity    - plot the cumulative equity
         self.vError("Unrecognized plot command: " + str(lArgs))
         return
 
+    def vEndStage(self):
+        # commit the HDF writes of the command, if the omlette queues them
+        if hasattr(self.ocmd2, 'oOm') and self.ocmd2.oOm:
+            self.ocmd2.oOm.vEndStageHdf()
+
     def bexecute(self, lArgs, oValues):
         """bexecute executes the backtest command.
         """
@@ -785,9 +1028,10 @@ back plot equity    - plot the cumulative equity
             self.ocmd2.sChef = self.ocmd2.oConfig['backtest']['chef']
             self.poutput("WARN: backtest chef from config: " + self.ocmd2.sChef)
 
-        if sDo in ['feed', 'recipe', 'chef']:
+        if sDo in ['feed', 'recipe', 'chef', 'sweep']:
             oMeth = getattr(self, 'backtest_' +sDo)
             oMeth()
+            self.vEndStage()
             return
 
         # Set the chef that we will use, and cook from the ingredients and the feeds
@@ -804,6 +1048,7 @@ back plot equity    - plot the cumulative equity
             except Exception as e:
                 # This is still in the process of getting wired up and tested
                 print(traceback.format_exc(10))
+            self.vEndStage()
             return
 
         self.poutput("ERROR: Unrecognized backtest command: " + str(lArgs) +'\n' +__doc__)
@@ -6,7 +6,13 @@ csv url PAIRSYMBOL       - show a URL where you can download  1 minute Mt HST da
 csv resample SRAW1MINFILE, SRESAMPLEDCSV, STIMEFRAME - Resample 1 minute CSV data,
                                                        to a new timeframe
                                                        and save it as CSV file
+csv resample_dir SHISTORYDIR [SYMBOL ...]           - Resample all the SYMBOL1-YEAR.csv
+                                                       files in SHISTORYDIR, in parallel
 }}}
+Use {{{csv --stream resample ...}}} to read the 1 minute data in chunks,
+so that the memory used stays bounded however big the file is.
+Use {{{csv --append resample ...}}} to bring resampled files up to date
+with new 1 minute data, resampling only the data after their last bar.
 """
 SDOC = __doc__
 
@@ -16,7 +22,17 @@ from optparse import make_option
 
 from OpenTrader.doer import Doer
 
-LOPTIONS = []
+LOPTIONS = [make_option("-S", "--stream",
+                        dest="bStream", action="store_true", default=False,
+                        help="resample reading the 1 minute data in chunks, in bounded memory"),
+            make_option("-j", "--iWorkers",
+                        dest="iWorkers", type="int",
+                        # no default here - we want it to come from the ini
+                        help="the number of processes for resample_dir (0 for one per CPU)"),
+            make_option("-a", "--append",
+                        dest="bAppend", action="store_true", default=False,
+                        help="update existing resampled files with only the new 1 minute data"),
+            ]
 
 LCOMMANDS = []
 
@@ -47,6 +63,8 @@ class DoCsv(Doer):
     def csv_resample(self):
         """csv resample SRAW1MINFILE, SRESAMPLEDCSV, STIMEFRAME
         - Resample 1 minute CSV data, to a new timeframe and save it as CSV file
+          with --stream the 1 minute data is read in chunks in bounded memory
+          with --append an existing SRESAMPLEDCSV is updated from its last bar
         """
         self.dhelp['resample'] = __doc__
         sDo = 'csv resample'
@@ -56,7 +74,7 @@ class DoCsv(Doer):
         # csv resample SRAW1MINFILE, SRESAMPLEDCSV, STIMEFRAME -
         # Resample 1 minute CSV data, to a new timeframe
         # Resample 1 minute data to new period, using pandas resample, how='ohlc'
-        from PandasMt4 import vResample1Min
+        from PandasMt4 import vResample1Min, vResample1MinStreaming, vResample1MinAppend
         assert len(self.lArgs) > 3, "ERROR: " +sDo +" SRAW1MINFILE, SRESAMPLEDCSV, STIMEFRAME"
         sRaw1MinFile = self.lArgs[1]
         assert os.path.exists(sRaw1MinFile)
@@ -67,7 +85,46 @@ class DoCsv(Doer):
 
         sTimeFrame = self.lArgs[3]
         oFd = sys.stdout
-        vResample1Min(sRaw1MinFile, sResampledCsv, sTimeFrame, oFd)
+        if self.oValues and self.oValues.bAppend:
+            vResample1MinAppend(sRaw1MinFile, {sTimeFrame: sResampledCsv}, oFd=oFd)
+        elif self.oValues and self.oValues.bStream:
+            vResample1MinStreaming(sRaw1MinFile, sResampledCsv, sTimeFrame, oFd=oFd)
+        else:
+            # the raw data is kept in memory keyed by its filename
+            sKey = os.path.basename(sRaw1MinFile)
+            vResample1Min(sKey, sRaw1MinFile, sResampledCsv, sTimeFrame, oFd)
+        return
+
+    LCOMMANDS += ['resample_dir']
+    def csv_resample_dir(self):
+        """csv resample_dir SHISTORYDIR [SYMBOL ...]
+        - Resample all the 1 minute SYMBOL1-YEAR.csv files in SHISTORYDIR
+          (or just those of the SYMBOLs) to the 60 240 and 1440 timeframes
+          in a pool of --iWorkers processes (default iWorkers in the [csv]
+          section of the ini), reporting the time of each job;
+          with --append the files older than their 1 minute file are updated
+        """
+        self.dhelp['resample_dir'] = __doc__
+        sDo = 'csv resample_dir'
+
+        from PandasMt4 import lMakeResampleJobs, lResampleParallel
+        assert len(self.lArgs) > 1, "ERROR: " +sDo +" SHISTORYDIR [SYMBOL ...]"
+        sDir = self.lArgs[1]
+        assert os.path.isdir(sDir), "ERROR: directory not found: " +sDir
+        lSymbols = [sElt.upper() for sElt in self.lArgs[2:]]
+
+        # --iWorkers, or iWorkers in the [csv] section of the ini
+        iWorkers = 0
+        if self.oValues and self.oValues.iWorkers:
+            iWorkers = int(self.oValues.iWorkers)
+        elif 'csv' in self.ocmd2.oConfig:
+            iWorkers = int(self.ocmd2.oConfig['csv'].get('iWorkers', 0))
+        bAppend = bool(self.oValues and self.oValues.bAppend)
+        lJobs = lMakeResampleJobs(sDir, lSymbols=lSymbols, bAppend=bAppend)
+        lResults = lResampleParallel(lJobs, iWorkers=iWorkers, oFd=sys.stdout)
+        lFailed = [tResult for tResult in lResults if tResult[-1]]
+        if lFailed:
+            self.vError("%d of %d resample jobs failed" % (len(lFailed), len(lResults),))
         return
 
     def bexecute(self, lArgs, oValues):
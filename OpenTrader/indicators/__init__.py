@@ -0,0 +1,77 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Vectorized numpy versions of the common TA-Lib functions, with the same
+names, signatures and outputs: NaN for the lookback at the start, and a
+tuple of arrays for the functions with more than one output.
+{{{
+from OpenTrader import indicators
+upper, middle, lower = indicators.BBANDS(close, timeperiod=20)
+}}}
+If TA-Lib is installed, its compiled functions are faster still, so
+recipes should get their functions with oGetFunction, which takes them
+from the fastest backend that has them:
+{{{
+SMA = indicators.oGetFunction('SMA')
+oTalib = indicators.oBackend()   # talib, or else this package
+}}}
+The functions are grouped as the TA-Lib catalog is in the wiki:
+overlap, momentum, volatility, volume, and price.
+"""
+
+import sys
+
+try:
+    import talib
+except ImportError:
+    talib = None
+
+from OpenTrader.indicators.overlap import MA_Type, MA, SMA, EMA, WMA, DEMA, TEMA, \
+     TRIMA, BBANDS, MIDPOINT, MIDPRICE
+from OpenTrader.indicators.momentum import RSI, CMO, MOM, ROC, ROCP, ROCR, ROCR100, \
+     WILLR, STOCHF, STOCH, MACD, APO, PPO, CCI, AROON, AROONOSC
+from OpenTrader.indicators.volatility import TRANGE, ATR, NATR, VAR, STDDEV
+from OpenTrader.indicators.volume import OBV, AD, ADOSC
+from OpenTrader.indicators.price import AVGPRICE, MEDPRICE, TYPPRICE, WCLPRICE, \
+     MAX, MIN, SUM
+
+lFUNCTIONS = ['MA', 'SMA', 'EMA', 'WMA', 'DEMA', 'TEMA', 'TRIMA', 'BBANDS',
+              'MIDPOINT', 'MIDPRICE',
+              'RSI', 'CMO', 'MOM', 'ROC', 'ROCP', 'ROCR', 'ROCR100', 'WILLR',
+              'STOCHF', 'STOCH', 'MACD', 'APO', 'PPO', 'CCI', 'AROON', 'AROONOSC',
+              'TRANGE', 'ATR', 'NATR', 'VAR', 'STDDEV',
+              'OBV', 'AD', 'ADOSC',
+              'AVGPRICE', 'MEDPRICE', 'TYPPRICE', 'WCLPRICE', 'MAX', 'MIN', 'SUM']
+
+lBACKENDS = ['talib', 'numpy']
+
+def sDefaultBackend():
+    return 'talib' if talib is not None else 'numpy'
+
+def oBackend(sBackend=None):
+    """
+    The module with the functions of sBackend: talib, or this package for
+    numpy; by default talib if it is installed.
+    """
+    if sBackend is None:
+        sBackend = sDefaultBackend()
+    assert sBackend in lBACKENDS, \
+           "ERROR: sBackend %r not in %r" % (sBackend, lBACKENDS,)
+    if sBackend == 'talib':
+        assert talib is not None, "ERROR: TA-Lib is not installed"
+        return talib
+    return sys.modules[__name__]
+
+def oGetFunction(sName, sBackend=None):
+    """
+    The function sName of sBackend, or by default of talib if it is
+    installed and has it, or else of this package.
+    """
+    if sBackend is None and talib is not None and hasattr(talib, sName):
+        return getattr(talib, sName)
+    if sBackend is None:
+        sBackend = 'numpy'
+    oModule = oBackend(sBackend)
+    assert hasattr(oModule, sName), \
+           "ERROR: %s has no indicator %s" % (sBackend, sName,)
+    return getattr(oModule, sName)
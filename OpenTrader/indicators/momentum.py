@@ -0,0 +1,137 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Momentum Indicators.
+"""
+
+import numpy
+
+from OpenTrader.LinearFilter import aWilder
+from OpenTrader.indicators.rolling import aFloat, aNans, aShift, aDivide, \
+     aRollingMax, aRollingMin, aRollingMean, aRollingApply
+from OpenTrader.indicators.overlap import MA, MA_Type, iMaLookback, aMaFrom
+
+def tWilderUpDown(aReal, timeperiod):
+    """
+    Wilder's smoothing of the changes up and down of aReal, seeded with
+    the means of the first timeperiod changes, from bar timeperiod on.
+    """
+    aDelta = numpy.diff(aReal)
+    aUp = aNans(len(aReal))
+    aDown = aNans(len(aReal))
+    aUp[1:] = aWilder(numpy.where(aDelta > 0, aDelta, 0.0), timeperiod)
+    aDown[1:] = aWilder(numpy.where(aDelta < 0, -aDelta, 0.0), timeperiod)
+    return aUp, aDown
+
+def RSI(real, timeperiod=14):
+    aUp, aDown = tWilderUpDown(aFloat(real), timeperiod)
+    return aDivide(100.0 * aUp, aUp + aDown)
+
+def CMO(real, timeperiod=14):
+    aUp, aDown = tWilderUpDown(aFloat(real), timeperiod)
+    return aDivide(100.0 * (aUp - aDown), aUp + aDown)
+
+def MOM(real, timeperiod=10):
+    aReal = aFloat(real)
+    return aReal - aShift(aReal, timeperiod)
+
+def ROC(real, timeperiod=10):
+    aReal = aFloat(real)
+    return aDivide(aReal, aShift(aReal, timeperiod), 1.0) * 100.0 - 100.0
+
+def ROCP(real, timeperiod=10):
+    aReal = aFloat(real)
+    aPrev = aShift(aReal, timeperiod)
+    return aDivide(aReal - aPrev, aPrev)
+
+def ROCR(real, timeperiod=10):
+    aReal = aFloat(real)
+    return aDivide(aReal, aShift(aReal, timeperiod))
+
+def ROCR100(real, timeperiod=10):
+    return ROCR(real, timeperiod) * 100.0
+
+def WILLR(high, low, close, timeperiod=14):
+    aHighest = aRollingMax(aFloat(high), timeperiod)
+    aLowest = aRollingMin(aFloat(low), timeperiod)
+    return aDivide(-100.0 * (aHighest - aFloat(close)), aHighest - aLowest)
+
+def aFastK(high, low, close, fastk_period):
+    aHighest = aRollingMax(aFloat(high), fastk_period)
+    aLowest = aRollingMin(aFloat(low), fastk_period)
+    return aDivide(100.0 * (aFloat(close) - aLowest), aHighest - aLowest)
+
+def STOCHF(high, low, close, fastk_period=5, fastd_period=3, fastd_matype=0):
+    aFast = aFastK(high, low, close, fastk_period)
+    iLookback = fastk_period - 1 + iMaLookback(fastd_period, fastd_matype)
+    aFastD = aMaFrom(aFast, fastd_period, fastd_matype, iLookback)
+    aFast[:iLookback] = numpy.nan
+    return (aFast, aFastD,)
+
+def STOCH(high, low, close, fastk_period=5, slowk_period=3, slowk_matype=0,
+          slowd_period=3, slowd_matype=0):
+    aFast = aFastK(high, low, close, fastk_period)
+    iSlowKStart = fastk_period - 1 + iMaLookback(slowk_period, slowk_matype)
+    iLookback = iSlowKStart + iMaLookback(slowd_period, slowd_matype)
+    aSlowK = aMaFrom(aFast, slowk_period, slowk_matype, iSlowKStart)
+    aSlowD = aMaFrom(aSlowK, slowd_period, slowd_matype, iLookback)
+    aSlowK[:iLookback] = numpy.nan
+    return (aSlowK, aSlowD,)
+
+def MACD(real, fastperiod=12, slowperiod=26, signalperiod=9):
+    aReal = aFloat(real)
+    if slowperiod < fastperiod:
+        fastperiod, slowperiod = slowperiod, fastperiod
+    # both averages start at the bar the slow one does
+    iStart = slowperiod - 1
+    aMacd = aMaFrom(aReal, fastperiod, MA_Type.EMA, iStart) - \
+            aMaFrom(aReal, slowperiod, MA_Type.EMA, iStart)
+    iLookback = iStart + signalperiod - 1
+    aSignal = aMaFrom(aMacd, signalperiod, MA_Type.EMA, iLookback)
+    aMacd[:iLookback] = numpy.nan
+    return (aMacd, aSignal, aMacd - aSignal,)
+
+def tPriceOscillator(real, fastperiod, slowperiod, matype):
+    aReal = aFloat(real)
+    if slowperiod < fastperiod:
+        fastperiod, slowperiod = slowperiod, fastperiod
+    iStart = iMaLookback(slowperiod, matype)
+    return (aMaFrom(aReal, fastperiod, matype, iStart),
+            aMaFrom(aReal, slowperiod, matype, iStart),)
+
+def APO(real, fastperiod=12, slowperiod=26, matype=0):
+    aFast, aSlow = tPriceOscillator(real, fastperiod, slowperiod, matype)
+    return aFast - aSlow
+
+def PPO(real, fastperiod=12, slowperiod=26, matype=0):
+    aFast, aSlow = tPriceOscillator(real, fastperiod, slowperiod, matype)
+    return aDivide(100.0 * (aFast - aSlow), aSlow)
+
+def CCI(high, low, close, timeperiod=14):
+    aTypical = (aFloat(high) + aFloat(low) + aFloat(close)) / 3.0
+    aMean = aRollingMean(aTypical, timeperiod)
+    def aMeanDeviation(aWindows):
+        return numpy.abs(aWindows - aWindows.mean(axis=1)[:, numpy.newaxis]).mean(axis=1)
+    aDeviation = aRollingApply(aTypical, timeperiod, aMeanDeviation)
+    return aDivide(aTypical - aMean, 0.015 * aDeviation)
+
+def tAroon(high, low, timeperiod):
+    """
+    The bars since the highest high and since the lowest low within the
+    last timeperiod + 1 bars: the latest of them if there are ties.
+    """
+    def aSinceHighest(aWindows):
+        return numpy.argmax(aWindows[:, ::-1], axis=1)
+    def aSinceLowest(aWindows):
+        return numpy.argmin(aWindows[:, ::-1], axis=1)
+    return (aRollingApply(aFloat(high), timeperiod + 1, aSinceHighest),
+            aRollingApply(aFloat(low), timeperiod + 1, aSinceLowest),)
+
+def AROON(high, low, timeperiod=14):
+    aSinceHighest, aSinceLowest = tAroon(high, low, timeperiod)
+    return (100.0 * (timeperiod - aSinceLowest) / timeperiod,
+            100.0 * (timeperiod - aSinceHighest) / timeperiod,)
+
+def AROONOSC(high, low, timeperiod=14):
+    aDown, aUp = AROON(high, low, timeperiod)
+    return aUp - aDown
@@ -0,0 +1,98 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Overlap Studies: the moving averages, and the bands and midpoints
+that are charted over the prices.
+"""
+
+import numpy
+
+from OpenTrader.LinearFilter import aEMA
+from OpenTrader.indicators.rolling import aFloat, aNans, aRollingMean, \
+     aRollingMax, aRollingMin, aRollingVar
+
+class MA_Type(object):
+    """The matype of MA, as talib.MA_Type."""
+    SMA, EMA, WMA, DEMA, TEMA, TRIMA, KAMA, MAMA, T3 = range(9)
+
+def SMA(real, timeperiod=30):
+    return aRollingMean(aFloat(real), timeperiod)
+
+def EMA(real, timeperiod=30):
+    return aEMA(aFloat(real), timeperiod)
+
+def WMA(real, timeperiod=30):
+    aReal = aFloat(real)
+    aRetval = aNans(len(aReal))
+    if timeperiod > len(aReal):
+        return aRetval
+    # the latest bar has the weight timeperiod, the earliest 1
+    aWeights = numpy.arange(timeperiod, 0, -1, dtype='float64')
+    aRetval[timeperiod - 1:] = numpy.convolve(aReal, aWeights, 'valid') / aWeights.sum()
+    return aRetval
+
+def DEMA(real, timeperiod=30):
+    aEma = aEMA(aFloat(real), timeperiod)
+    return 2.0 * aEma - aEMA(aEma, timeperiod)
+
+def TEMA(real, timeperiod=30):
+    aEma = aEMA(aFloat(real), timeperiod)
+    aEma2 = aEMA(aEma, timeperiod)
+    return 3.0 * aEma - 3.0 * aEma2 + aEMA(aEma2, timeperiod)
+
+def TRIMA(real, timeperiod=30):
+    # the triangular weights are those of an SMA of an SMA
+    if timeperiod % 2:
+        iFirst = iSecond = (timeperiod + 1) // 2
+    else:
+        iFirst, iSecond = timeperiod // 2, timeperiod // 2 + 1
+    return aRollingMean(aRollingMean(aFloat(real), iFirst), iSecond)
+
+dMOVING_AVERAGES = {MA_Type.SMA: SMA, MA_Type.EMA: EMA, MA_Type.WMA: WMA,
+                    MA_Type.DEMA: DEMA, MA_Type.TEMA: TEMA, MA_Type.TRIMA: TRIMA}
+
+def iMaLookback(timeperiod, matype):
+    """The number of NaNs at the start of MA of timeperiod and matype."""
+    if timeperiod <= 1:
+        return 0
+    if matype == MA_Type.DEMA:
+        return 2 * (timeperiod - 1)
+    if matype == MA_Type.TEMA:
+        return 3 * (timeperiod - 1)
+    return timeperiod - 1
+
+def MA(real, timeperiod=30, matype=0):
+    if matype not in dMOVING_AVERAGES:
+        sSupported = ", ".join(["%s=%d" % (oFun.__name__, iMatype,)
+                                for iMatype, oFun in sorted(dMOVING_AVERAGES.items())])
+        raise ValueError("ERROR: matype %r is only in TA-Lib; the supported matypes are %s" % (
+            matype, sSupported,))
+    if timeperiod == 1:
+        return aFloat(real).copy()
+    return dMOVING_AVERAGES[matype](real, timeperiod)
+
+def aMaFrom(aReal, timeperiod, matype, iStart):
+    """
+    MA of aReal, with the NaNs until iStart, as TA-Lib computes it when
+    its output starts at iStart: an EMA is then seeded with the mean of
+    the timeperiod values before iStart, rather than the first ones.
+    """
+    if matype == MA_Type.EMA and timeperiod > 1 and iStart > timeperiod - 1:
+        aReal = aReal.copy()
+        aReal[:iStart - timeperiod + 1] = numpy.nan
+    aRetval = MA(aReal, timeperiod, matype)
+    aRetval[:iStart] = numpy.nan
+    return aRetval
+
+def BBANDS(real, timeperiod=5, nbdevup=2., nbdevdn=2., matype=0):
+    aReal = aFloat(real)
+    aMiddle = MA(aReal, timeperiod, matype)
+    aStd = numpy.sqrt(aRollingVar(aReal, timeperiod))
+    return (aMiddle + nbdevup * aStd, aMiddle, aMiddle - nbdevdn * aStd,)
+
+def MIDPOINT(real, timeperiod=14):
+    aReal = aFloat(real)
+    return (aRollingMax(aReal, timeperiod) + aRollingMin(aReal, timeperiod)) / 2.0
+
+def MIDPRICE(high, low, timeperiod=14):
+    return (aRollingMax(aFloat(high), timeperiod) + aRollingMin(aFloat(low), timeperiod)) / 2.0
@@ -0,0 +1,28 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Price Transform, and the Math Operators over windows of prices.
+"""
+
+from OpenTrader.indicators.rolling import aFloat, aRollingMax, aRollingMin, aRollingSum
+
+def AVGPRICE(open, high, low, close):
+    return (aFloat(open) + aFloat(high) + aFloat(low) + aFloat(close)) / 4.0
+
+def MEDPRICE(high, low):
+    return (aFloat(high) + aFloat(low)) / 2.0
+
+def TYPPRICE(high, low, close):
+    return (aFloat(high) + aFloat(low) + aFloat(close)) / 3.0
+
+def WCLPRICE(high, low, close):
+    return (aFloat(high) + aFloat(low) + 2.0 * aFloat(close)) / 4.0
+
+def MAX(real, timeperiod=30):
+    return aRollingMax(aFloat(real), timeperiod)
+
+def MIN(real, timeperiod=30):
+    return aRollingMin(aFloat(real), timeperiod)
+
+def SUM(real, timeperiod=30):
+    return aRollingSum(aFloat(real), timeperiod)
@@ -0,0 +1,134 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+The rolling window operations that the indicators are built from, over
+numpy arrays: the result for bar i is that of the window of bars
+i - iWindow + 1 .. i, and NaN for the bars before the first full window,
+or if the window has a NaN in it.
+"""
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+# the most elements of windows that aRollingApply makes at once
+iCHUNK_ELEMENTS = 1 << 22
+
+def aFloat(aReal):
+    return numpy.asarray(aReal, dtype='float64')
+
+def aNans(iLen):
+    aRetval = numpy.empty(iLen, dtype='float64')
+    aRetval[:] = numpy.nan
+    return aRetval
+
+def aShift(aReal, iPeriods):
+    """
+    aReal shifted iPeriods bars later, with NaNs before it.
+    """
+    aRetval = aNans(len(aReal))
+    if iPeriods < len(aReal):
+        aRetval[iPeriods:] = aReal[:len(aReal) - iPeriods]
+    return aRetval
+
+def aRollingSum(aReal, iWindow):
+    """
+    The sum over the window, from the cumulative sum of aReal less its
+    first value, so that the sums stay small: O(n) for any window.
+    """
+    assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+    aReal = aFloat(aReal)
+    iLen = len(aReal)
+    aRetval = aNans(iLen)
+    if iWindow > iLen:
+        return aRetval
+    aNan = numpy.isnan(aReal)
+    bNans = aNan.any()
+    if bNans:
+        aReal = numpy.where(aNan, 0.0, aReal)
+    fBase = aReal[0]
+    aCumsum = numpy.zeros(iLen + 1, dtype='float64')
+    numpy.cumsum(aReal - fBase, out=aCumsum[1:])
+    aRetval[iWindow - 1:] = aCumsum[iWindow:] - aCumsum[:-iWindow] + iWindow * fBase
+    if bNans:
+        aNanCount = numpy.zeros(iLen + 1, dtype='int64')
+        numpy.cumsum(aNan, out=aNanCount[1:])
+        aHasNan = (aNanCount[iWindow:] - aNanCount[:-iWindow]) > 0
+        aRetval[iWindow - 1:][aHasNan] = numpy.nan
+    return aRetval
+
+def aRollingMean(aReal, iWindow):
+    return aRollingSum(aReal, iWindow) / iWindow
+
+def aRollingExtreme(aReal, iWindow, oUfunc):
+    """
+    The van Herk/Gil-Werman algorithm, vectorized: in blocks of iWindow
+    bars, the running extremes from the start of each block and to its
+    end; each window spans at most two blocks, and its extreme is that of
+    the end of the first and the start of the second. O(n) for any window.
+    """
+    assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+    aReal = aFloat(aReal)
+    iLen = len(aReal)
+    aRetval = aNans(iLen)
+    if iWindow > iLen:
+        return aRetval
+    iBlocks = -(-iLen // iWindow)
+    aPadded = numpy.empty(iBlocks * iWindow, dtype='float64')
+    aPadded[:iLen] = aReal
+    aPadded[iLen:] = aReal[-1]
+    aBlocks = aPadded.reshape(iBlocks, iWindow)
+    aFromStart = oUfunc.accumulate(aBlocks, axis=1).ravel()
+    aToEnd = oUfunc.accumulate(aBlocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    aRetval[iWindow - 1:] = oUfunc(aToEnd[:iLen - iWindow + 1], aFromStart[iWindow - 1:iLen])
+    return aRetval
+
+def aRollingMax(aReal, iWindow):
+    return aRollingExtreme(aReal, iWindow, numpy.maximum)
+
+def aRollingMin(aReal, iWindow):
+    return aRollingExtreme(aReal, iWindow, numpy.minimum)
+
+def aWindows(aReal, iWindow):
+    """
+    A read-only (bars - iWindow + 1, iWindow) view of the windows of aReal.
+    """
+    aReal = numpy.ascontiguousarray(aReal, dtype='float64')
+    iStride = aReal.strides[0]
+    aRetval = as_strided(aReal, shape=(len(aReal) - iWindow + 1, iWindow),
+                         strides=(iStride, iStride))
+    aRetval.flags.writeable = False
+    return aRetval
+
+def aRollingApply(aReal, iWindow, oFun):
+    """
+    oFun of each window, where oFun reduces a 2-D array of windows along
+    axis 1; the windows are made a chunk at a time, to bound the memory.
+    This is O(n * iWindow), for the operations with no running form.
+    """
+    assert iWindow > 0, "ERROR: the window must be positive, not %r" % (iWindow,)
+    aReal = aFloat(aReal)
+    aRetval = aNans(len(aReal))
+    if iWindow > len(aReal):
+        return aRetval
+    aAll = aWindows(aReal, iWindow)
+    iChunk = max(1, iCHUNK_ELEMENTS // iWindow)
+    for iStart in range(0, len(aAll), iChunk):
+        aChunk = aAll[iStart:iStart + iChunk]
+        aRetval[iWindow - 1 + iStart:iWindow - 1 + iStart + len(aChunk)] = oFun(aChunk)
+    return aRetval
+
+def aRollingVar(aReal, iWindow):
+    """
+    The population variance over the window, as TA-Lib's VAR, computed
+    from the deviations from the mean of each window.
+    """
+    return aRollingApply(aReal, iWindow, lambda aChunk: aChunk.var(axis=1))
+
+def aDivide(aNumerator, aDenominator, fZero=0.0):
+    """
+    aNumerator / aDenominator, but fZero where the denominator is 0, as TA-Lib does.
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        aRetval = aNumerator / aDenominator
+    aRetval[aDenominator == 0] = fZero
+    return aRetval
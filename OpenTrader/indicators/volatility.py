@@ -0,0 +1,31 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Volatility Indicators, and the Statistic Functions of the volatility.
+"""
+
+import numpy
+
+from OpenTrader.LinearFilter import aWilder
+from OpenTrader.indicators.rolling import aFloat, aNans, aDivide, aRollingVar
+
+def TRANGE(high, low, close):
+    aHigh, aLow, aClose = aFloat(high), aFloat(low), aFloat(close)
+    aRetval = aNans(len(aClose))
+    aRetval[1:] = numpy.maximum(aHigh[1:], aClose[:-1]) - \
+                  numpy.minimum(aLow[1:], aClose[:-1])
+    return aRetval
+
+def ATR(high, low, close, timeperiod=14):
+    # Wilder's smoothing of the true range, seeded with the mean of the first
+    return aWilder(TRANGE(high, low, close), timeperiod)
+
+def NATR(high, low, close, timeperiod=14):
+    return aDivide(100.0 * ATR(high, low, close, timeperiod), aFloat(close))
+
+def VAR(real, timeperiod=5, nbdev=1.):
+    # TA-Lib ignores nbdev here too
+    return aRollingVar(aFloat(real), timeperiod)
+
+def STDDEV(real, timeperiod=5, nbdev=1.):
+    return numpy.sqrt(aRollingVar(aFloat(real), timeperiod)) * nbdev
@@ -0,0 +1,36 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Volume Indicators.
+"""
+
+import numpy
+
+from OpenTrader.LinearFilter import aLinearRecursion
+from OpenTrader.indicators.rolling import aFloat, aDivide
+
+def OBV(real, volume):
+    aReal, aVolume = aFloat(real), aFloat(volume)
+    aSigned = aVolume.copy()
+    aSigned[1:] *= numpy.sign(numpy.diff(aReal))
+    return numpy.cumsum(aSigned)
+
+def AD(high, low, close, volume):
+    aHigh, aLow, aClose = aFloat(high), aFloat(low), aFloat(close)
+    aMoney = aDivide((aClose - aLow) - (aHigh - aClose), aHigh - aLow) * aFloat(volume)
+    return numpy.cumsum(aMoney)
+
+def ADOSC(high, low, close, volume, fastperiod=3, slowperiod=10):
+    aAd = AD(high, low, close, volume)
+    aRetval = numpy.zeros(len(aAd), dtype='float64')
+    if len(aAd):
+        # both EMAs start from the first AD, with no mean to seed them
+        lEmas = []
+        for iPeriod in (fastperiod, slowperiod,):
+            aEma = numpy.empty(len(aAd), dtype='float64')
+            aEma[0] = aAd[0]
+            aEma[1:] = aLinearRecursion(aAd[1:], 2.0 / (iPeriod + 1), aAd[0])
+            lEmas.append(aEma)
+        aRetval = lEmas[0] - lEmas[1]
+    aRetval[:max(fastperiod, slowperiod) - 1] = numpy.nan
+    return aRetval
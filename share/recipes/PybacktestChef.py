@@ -19,25 +19,32 @@ from __future__ import print_function
 import sys
 import time
 import warnings
+from collections import OrderedDict
 
 from pandas.lib import cache_readonly
 
 import pandas
 from OpenTrader import PYBTDailyPerformance
+from OpenTrader import PYBTParts
 
 class StatEngine(object):
-    def __init__(self, equity_fn):
+    def __init__(self, equity_fn, metrics_fn=None):
         self._stats = [i for i in dir(PYBTDailyPerformance) if not i.startswith('_')]
         self._equity_fn = equity_fn
+        # the stats that the MetricsEngine has come from its cached intermediates
+        self._metrics_fn = metrics_fn
 
     def __dir__(self):
         return dir(type(self)) + self._stats
 
     def __getattr__(self, attr):
         if attr in self._stats:
-            equity = self._equity_fn()
-            fn = getattr(PYBTDailyPerformance, attr)
             try:
+                if self._metrics_fn is not None and \
+                   hasattr(PYBTDailyPerformance.MetricsEngine, attr):
+                    return getattr(self._metrics_fn(), attr)()
+                equity = self._equity_fn()
+                fn = getattr(PYBTDailyPerformance, attr)
                 return fn(equity)
             except StandardError, e:
                 sys.stdout.write("Error calling %s function: %s\n" % (attr, str(e),))
@@ -78,7 +85,13 @@ class ChefsOven(object):
     _lSignalFields = ('buy', 'sell', 'short', 'cover')
     _lSignalFieldsInt = ('Buy', 'Sell', 'Short', 'Cover')
     _lPriceFieldsInt = ('BuyPrice', 'SellPrice', 'ShortPrice', 'CoverPrice')
-    # these are the results you can get back from this Chef
+    # these are the results you can get back from this Chef,
+    # and the attributes that a recipe can make them in: see gServing
+    dSERVINGS = OrderedDict([('signals', '_mSignals'),
+                             ('trade_price', '_rTradePrice'),
+                             ('positions', '_rPositions'),
+                             ('trades', '_mTrades'),
+                             ('equity', '_rEquity')])
 
     def __init__(self, mOhlc, dDataDict, name='Unknown',
                  signal_fields=None,
@@ -129,13 +142,16 @@ class ChefsOven(object):
         self._lPriceFieldsExt = price_fields
 
         self.run_time = time.strftime('%Y-%d-%m %H:%M %Z', time.localtime())
-        self.stats = StatEngine(lambda: self.equity)
+        self.stats = StatEngine(lambda: self.equity, self.oMetrics)
         # make things explicit with a functional programming style too
         self._mSignals = False
         self._rTradePrice = False
         self._rPositions = False
         self._mTrades = False
         self._rEquity = False
+        # the runs, batch_size and random_state of the monte-carlo WCDD
+        self.dMcmddParams = dict(runs=1000, batch_size=None, random_state=None)
+        self._oMetrics = None
 
     def __repr__(self):
         return "Backtest(%s, %s)" % (self.name, self.run_time)
@@ -144,6 +160,23 @@ class ChefsOven(object):
     def dDataDict(self):
         return self._dDataDict
 
+    def bServed(self, sServing):
+        """Whether the serving sServing has been made in this cook."""
+        return sServing in getattr(self, '_cache', {}) or \
+               getattr(self, self.dSERVINGS[sServing]) is not False
+
+    def gServing(self, sServing, oMake=None):
+        """
+        The serving sServing: it is made once, by oMake(self) if that is
+        given, such as a recipe's mSignals, and otherwise by the method of
+        this oven; then it is served from the cache_readonly of its name.
+        """
+        assert sServing in self.dSERVINGS, \
+               "ERROR: %s not in %r" % (sServing, self.dSERVINGS.keys(),)
+        if oMake is not None and not self.bServed(sServing):
+            setattr(self, self.dSERVINGS[sServing], oMake(self))
+        return getattr(self, sServing)
+
     @cache_readonly
     def signals(self):
         if self._mSignals is False:
@@ -198,6 +231,9 @@ class ChefsOven(object):
         WARNING: In production, override default zero value in init_pos with
         extreme caution.
         """
+        if PYBTParts.bBooleanSignals(self.signals, mask=self._lSignalFieldsInt):
+            return PYBTParts.rSignalsToPositions(self.signals, init_pos=0,
+                                                 mask=self._lSignalFieldsInt)
         with warnings.catch_warnings():
             warnings.filterwarnings('ignore') # ignore problems during import
             from pybacktest import parts
@@ -218,7 +254,8 @@ class ChefsOven(object):
         assert p.index.tz == tp.index.tz, "ERROR: Cant operate on signals and prices " \
                                           "indexed as of different timezones"
         t = pandas.DataFrame({'pos': p})
-        t['price'] = tp
+        # the feed may be float32 (sFeedDtype): the equity is in float64
+        t['price'] = tp.astype('float64')
         t = t.dropna()
         t['vol'] = t.pos.diff()
         return t.dropna()
@@ -231,18 +268,25 @@ class ChefsOven(object):
     
     def rEquity(self):
         # equity diff series
-        with warnings.catch_warnings():
-            warnings.filterwarnings('ignore') # ignore problems during import
-            from pybacktest import parts
-        return parts.trades_to_equity(self.trades)
+        return PYBTParts.rTradesToEquity(self.trades)
 
     @cache_readonly
     def ohlc(self):
         return self._mOhlc
 
+    def oMetrics(self):
+        """
+        The PYBTDailyPerformance.MetricsEngine of the equity, which caches
+        the summary and its intermediates: a new one if the equity changed.
+        """
+        rEquity = self.equity
+        if self._oMetrics is None or self._oMetrics.rEquity is not rEquity:
+            self._oMetrics = PYBTDailyPerformance.MetricsEngine(rEquity)
+        return self._oMetrics
+
     @cache_readonly
     def report(self):
-        return PYBTDailyPerformance.dPerformanceSummary(self.equity)
+        return self.dSummary()
 
     def summary(self):
         self.vPrintSummary()
@@ -263,7 +307,7 @@ class ChefsOven(object):
         return sRetval
     
     def dSummary(self):
-        return PYBTDailyPerformance.dPerformanceSummary(self.equity)
+        return self.oMetrics().dSummary(**self.dMcmddParams)
     
     def lSummary(self):
         dSummary = self.dSummary()
@@ -305,7 +349,96 @@ class ChefsOven(object):
         oOS.ix[subset].plot(color='black', label='price')
         pylab.legend(loc='best')
         pylab.title('%s\nTrades for %s' % (self, subset))
-    
+
+class BatchChefsOven(object):
+    """
+    The ChefsOven for many variants of a recipe at once: the signals
+    are DataFrames with a column for each variant, as dApplyRecipeBatch
+    returns them, and the positions, trades and equity of all of the
+    variants are computed together with the PYBTParts.aBatch functions.
+    The trades are at the open_label price of the bar after the signal.
+    """
+
+    def __init__(self, mOhlc, dDataDict, name='Unknown',
+                 signal_fields=('buy', 'sell', 'short', 'cover'),
+                 open_label='O'):
+        self.sName = 'pybacktest'
+        self._mOhlc = mOhlc
+        self.name = name
+        self.open_label = open_label
+        self._dDataDict = dict([(k.lower(), v) for k, v in dDataDict.iteritems()])
+        for sElt in signal_fields:
+            assert sElt in self._dDataDict
+            assert isinstance(self._dDataDict[sElt], pandas.DataFrame)
+        self._lSignalFieldsExt = signal_fields
+        self.iVariants = self._dDataDict[signal_fields[0]].shape[1]
+        self.run_time = time.strftime('%Y-%d-%m %H:%M %Z', time.localtime())
+
+    def __repr__(self):
+        return "BatchBacktest(%s, %d variants, %s)" % (self.name, self.iVariants,
+                                                      self.run_time)
+
+    @property
+    def dDataDict(self):
+        return self._dDataDict
+
+    @cache_readonly
+    def ohlc(self):
+        return self._mOhlc
+
+    @cache_readonly
+    def positions(self):
+        return self.tPositions()
+
+    def tPositions(self):
+        """
+        The (aCol, aBar, aPos) arrays of the position changes of the variants.
+        """
+        lSignals = [self.dDataDict[sElt].fillna(value=False).values
+                    for sElt in self._lSignalFieldsExt]
+        return PYBTParts.tBatchSignalsToPositions(*lSignals, iInitPos=0)
+
+    @cache_readonly
+    def trades(self):
+        return self.tTrades()
+
+    def tTrades(self):
+        """
+        The (aCol, aBar, aPos, aVol, aPrice) arrays of the trades of the variants.
+        """
+        aCol, aBar, aPos = self.positions
+        aPrice = getattr(self.ohlc, self.open_label).values
+        return PYBTParts.tBatchPositionsToTrades(aCol, aBar, aPos, aPrice)
+
+    @cache_readonly
+    def equity(self):
+        return self.aEquity()
+
+    def aEquity(self):
+        """
+        The equity differences of the trades, in the order of self.trades.
+        """
+        aCol, aBar, aPos, aVol, aPrice = self.trades
+        return PYBTParts.aBatchTradesToEquity(aCol, aPos, aVol, aPrice)
+
+    def rEquity(self, iVariant):
+        """
+        The equity difference Series of one variant, as ChefsOven.equity.
+        """
+        aCol, aBar, aPos, aVol, aPrice = self.trades
+        aMine = aCol == iVariant
+        return pandas.Series(self.equity[aMine], index=self.ohlc.index[aBar[aMine]])
+
+    def mSummary(self):
+        """
+        A DataFrame of the performance metrics with a row for each variant:
+        see PYBTDailyPerformance.mBatchPerformanceSummary.
+        """
+        aCol, aBar, aPos, aVol, aPrice = self.trades
+        return PYBTDailyPerformance.mBatchPerformanceSummary(aCol, aBar, self.equity,
+                                                             self.iVariants,
+                                                             self.ohlc.index)
+
 def vPlotEquity(rEquityDiff, mOhlc, sPeriod='W',
                 subset=None,
                 sTitle="Equity",
@@ -5,9 +5,28 @@
 
 import sys
 import datetime
+import numpy
 import pandas
 
 from OpenTrader.Omlettes.Recipe import Recipe
+from OpenTrader.IngredientCache import oINGREDIENT_CACHE
+from OpenTrader import indicators
+
+def rMovingAverage(mFeedOhlc, iMa, bUseTalib):
+    """
+    The simple moving average of the O column over iMa bars,
+    from oINGREDIENT_CACHE: that of the fastest of the TA-Lib backends
+    of OpenTrader.indicators if bUseTalib.
+    """
+    if not bUseTalib:
+        return oINGREDIENT_CACHE.rSMA(mFeedOhlc, 'O', iMa)
+    sBackend = indicators.sDefaultBackend()
+    def rIndicatorSMA(mFeedOhlc, iMa):
+        oSMA = indicators.oGetFunction('SMA', sBackend)
+        aMa = oSMA(mFeedOhlc.O.values.astype('float64'), timeperiod=iMa)
+        return pandas.Series(aMa, name='O', index=mFeedOhlc.O.index)
+    return oINGREDIENT_CACHE.gIndicator(mFeedOhlc, sBackend +'.SMA', 'O', (iMa,),
+                                        rIndicatorSMA)
 
 class SMARecipe(Recipe):
         
@@ -50,17 +69,9 @@ class SMARecipe(Recipe):
         iBeginValid = max(iLongMa, iShortMa)-1
         iEndOhlc = len(mFeedOhlc)
 
-        if bUseTalib:
-            import talib
-            aShortMA = talib.SMA(mFeedOhlc.O.values, timeperiod=iShortMa)
-            aLongMA = talib.SMA(mFeedOhlc.O.values, timeperiod=iLongMa)
-            rShortMa = pandas.Series(aShortMA, name='O',
-                                     index=mFeedOhlc.O.index)
-            rLongMa = pandas.Series(aLongMA, name='O',
-                                    index=mFeedOhlc.O.index)
-        else:
-            rShortMa = pandas.rolling_mean(mFeedOhlc.O, iShortMa)
-            rLongMa = pandas.rolling_mean(mFeedOhlc.O, iLongMa)
+        # the moving averages are shared with the other recipes and sweeps on this feed
+        rShortMa = rMovingAverage(mFeedOhlc, iShortMa, bUseTalib)
+        rLongMa = rMovingAverage(mFeedOhlc, iLongMa, bUseTalib)
 
         rShortMa = rShortMa[iBeginValid:]
         rLongMa = rLongMa[iBeginValid:]
@@ -97,3 +108,45 @@ class SMARecipe(Recipe):
         return dict(rBuy=rBuy, rCover=rCover, rSell=rSell, rShort=rShort,
                     dDishesParams=dDishesParams)
 
+    def dApplyRecipeBatch(self, mFeedOhlc, lGrid):
+        """dApplyRecipeBatch
+        returns a dictionary with keys mBuy, mCover, mSell, mShort,
+        which are boolean DataFrames with a column for each combination
+        of iShortMa and iLongMa in lGrid, and a copy of the dDishesParams.
+        Each moving average is computed once, however many combinations use it;
+        the bars before both are valid have no signals, as in dApplyRecipe.
+        """
+        oC = self.oEnsureConfigObj()
+        assert oC is not None
+        self.vCheckRequiredFeeds(dict(mFeedOhlc=mFeedOhlc))
+        bUseTalib = oC['rShortMa']['bUseTalib']
+        lShortMa = []
+        lLongMa = []
+        for dParams in lGrid:
+            lShortMa.append(dParams.get(('rShortMa', 'iShortMa'), oC['rShortMa']['iShortMa']))
+            lLongMa.append(dParams.get(('rLongMa', 'iLongMa'), oC['rLongMa']['iLongMa']))
+
+        dMa = dict()
+        for iMa in set(lShortMa + lLongMa):
+            dMa[iMa] = rMovingAverage(mFeedOhlc, iMa, bUseTalib).values
+        aShortMa = numpy.column_stack([dMa[iMa] for iMa in lShortMa])
+        aLongMa = numpy.column_stack([dMa[iMa] for iMa in lLongMa])
+        aShortMaPrev = numpy.empty_like(aShortMa)
+        aShortMaPrev[0] = numpy.nan
+        aShortMaPrev[1:] = aShortMa[:-1]
+        aLongMaPrev = numpy.empty_like(aLongMa)
+        aLongMaPrev[0] = numpy.nan
+        aLongMaPrev[1:] = aLongMa[:-1]
+
+        self.oFd.write('INFO: Batch of %d combinations of %d moving averages\n' % (
+            len(lGrid), len(dMa),))
+        # the comparisons with NaN are False, like those of the Series
+        with numpy.errstate(invalid='ignore'):
+            aBuy = (aShortMa > aLongMa) & (aShortMaPrev < aLongMaPrev)  # ma cross up
+            aSell = (aShortMa < aLongMa) & (aShortMaPrev > aLongMaPrev)  # ma cross down
+        mBuy = mCover = pandas.DataFrame(aBuy, index=mFeedOhlc.index)
+        mSell = mShort = pandas.DataFrame(aSell, index=mFeedOhlc.index)
+        dDishesParams = dict()
+        return dict(mBuy=mBuy, mCover=mCover, mSell=mSell, mShort=mShort,
+                    dDishesParams=dDishesParams)
+
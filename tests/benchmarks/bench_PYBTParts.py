@@ -0,0 +1,101 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Benchmark turning signals into positions with the iterrows loop of
+Recipe.rPositionsIterrows, and trades into equity with the apply of
+Recipe.rEquityApply, against the vectorized PYBTParts, and then a batch of iBATCH_VARIANTS
+variants one at a time against the aBatch functions.
+
+Give the number of bars (default 1000000) as an argument; the loop
+is timed on at most 100000 of them, and scaled up.
+"""
+
+import sys, os
+import time
+
+# we may need this to run the benchmarks in the source directory uninstalled
+sRootDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if sRootDir not in sys.path:
+    sys.path.insert(0, sRootDir)
+del sRootDir
+
+import numpy
+import pandas
+
+from OpenTrader.Omlettes.Recipe import Recipe
+from OpenTrader import PYBTParts
+
+iLOOP_BARS = 100000
+iBATCH_VARIANTS = 20
+
+class Bt(object):
+    def __init__(self, mSignals):
+        self.signals = mSignals
+
+def mMakeSignals(iBars, fDensity=0.01):
+    oIndex = pandas.date_range('2010-01-01', periods=iBars, freq='T')
+    return pandas.DataFrame(numpy.random.rand(iBars, 4) < fDensity, index=oIndex,
+                            columns=['Buy', 'Sell', 'Short', 'Cover'])
+
+def fTime(oFun, *lArgs):
+    fStart = time.time()
+    gRetval = oFun(*lArgs)
+    return time.time() - fStart, gRetval
+
+def iMain():
+    iBars = 1000000
+    if len(sys.argv) > 1:
+        iBars = int(sys.argv[1])
+    mSignals = mMakeSignals(iBars)
+
+    iLoopBars = min(iBars, iLOOP_BARS)
+    oBt = Bt(mSignals.iloc[:iLoopBars])
+    fLoop, rLoop = fTime(Recipe().rPositionsIterrows, oBt)
+    assert rLoop.equals(PYBTParts.rSignalsToPositions(oBt.signals))
+    fLoop *= iBars / float(iLoopBars)
+
+    fVector, rVector = fTime(PYBTParts.rSignalsToPositions, mSignals)
+    print "bars:                 %8d" % iBars
+    print "rPositionsIterrows:   %8.3f seconds%s" % (fLoop,
+                                                     " (scaled)" if iLoopBars < iBars else "")
+    print "rSignalsToPositions:  %8.3f seconds" % fVector
+    print "speedup:              %8.1fx" % (fLoop / fVector)
+
+    oBt = Bt(mSignals)
+    oBt.positions = rVector
+    oBt.trade_price = pandas.Series(1.3 + numpy.random.normal(scale=1e-4, size=iBars).cumsum(),
+                                    index=mSignals.index)
+    oBt.trades = Recipe().mTrades(oBt)
+    fApply, rApply = fTime(Recipe().rEquityApply, oBt)
+    fVector, rVector = fTime(PYBTParts.rTradesToEquity, oBt.trades)
+    assert numpy.allclose(rApply.values, rVector.values)
+    print "trades:               %8d" % len(oBt.trades)
+    print "rEquityApply:         %8.3f seconds" % fApply
+    print "rTradesToEquity:      %8.3f seconds" % fVector
+    print "speedup:              %8.1fx" % (fApply / fVector)
+
+    aPrice = oBt.trade_price.values
+    lSignals = [numpy.random.rand(iBars, iBATCH_VARIANTS) < 0.01 for i in range(4)]
+    fStart = time.time()
+    for iVariant in range(iBATCH_VARIANTS):
+        oBt = Bt(pandas.DataFrame(dict(zip(['Buy', 'Sell', 'Short', 'Cover'],
+                                           [aSignals[:, iVariant] for aSignals in lSignals])),
+                                  index=mSignals.index))
+        oBt.positions = PYBTParts.rSignalsToPositions(oBt.signals)
+        oBt.trade_price = pandas.Series(aPrice, index=mSignals.index)
+        PYBTParts.rTradesToEquity(Recipe().mTrades(oBt))
+    fOneByOne = time.time() - fStart
+    fStart = time.time()
+    aCol, aBar, aPos = PYBTParts.tBatchSignalsToPositions(*lSignals)
+    aCol, aBar, aPos, aVol, aTradePrice = PYBTParts.tBatchPositionsToTrades(
+        aCol, aBar, aPos, aPrice)
+    PYBTParts.aBatchTradesToEquity(aCol, aPos, aVol, aTradePrice)
+    fBatch = time.time() - fStart
+    print "variants:             %8d" % iBATCH_VARIANTS
+    print "one at a time:        %8.3f seconds" % fOneByOne
+    print "aBatch:               %8.3f seconds" % fBatch
+    print "speedup:              %8.1fx" % (fOneByOne / fBatch)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(iMain())
@@ -0,0 +1,68 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Benchmark reading a 1 minute Mt4 CSV file with pandas' generic date
+parsing, against the vectorized Mt4 timestamp parser in PandasMt4.
+
+Give the number of rows (default 1000000) and optionally an existing
+1 minute CSV file as arguments; otherwise a random one is made in /tmp.
+"""
+
+import sys, os
+import time
+
+# we may need this to run the benchmarks in the source directory uninstalled
+sRootDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if sRootDir not in sys.path:
+    sys.path.insert(0, sRootDir)
+del sRootDir
+
+import numpy
+import pandas
+
+from OpenTrader.PandasMt4 import mReadMt4Raw1Min
+
+def vMakeRaw1Min(sFile, iRows):
+    oIndex = pandas.date_range('2010-01-01', periods=iRows, freq='T')
+    aPrices = 1.3 + numpy.random.normal(scale=1e-4, size=iRows).cumsum()
+    mDf = pandas.DataFrame(dict(D=oIndex.strftime('%Y.%m.%d'),
+                                T=oIndex.strftime('%H:%M'),
+                                O=aPrices, H=aPrices, L=aPrices, C=aPrices,
+                                V=numpy.ones(iRows)),
+                           columns=['D', 'T', 'O', 'H', 'L', 'C', 'V'])
+    mDf.to_csv(sFile, header=False, index=False, float_format='%.5f')
+
+def mReadPandas(sFile):
+    return pandas.read_csv(sFile, header=None,
+                           names=['D', 'T', 'O', 'H', 'L', 'C', 'V'],
+                           parse_dates={'timestamp': ['D', 'T']},
+                           index_col='timestamp',
+                           dtype='float64')
+
+def fTime(oFun, *lArgs):
+    fStart = time.time()
+    gRetval = oFun(*lArgs)
+    return time.time() - fStart, gRetval
+
+def iMain():
+    iRows = 1000000
+    if len(sys.argv) > 1:
+        iRows = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        sFile = sys.argv[2]
+    else:
+        sFile = '/tmp/bench_raw1min_%d.csv' % iRows
+        if not os.path.isfile(sFile):
+            print "INFO: writing %d rows to %s" % (iRows, sFile,)
+            vMakeRaw1Min(sFile, iRows)
+
+    fPandas, mPandas = fTime(mReadPandas, sFile)
+    fMt4, mMt4 = fTime(mReadMt4Raw1Min, sFile)
+    assert (mPandas.index == mMt4.index).all()
+    print "pandas parse_dates:   %8.3f seconds" % fPandas
+    print "aParseMt4Timestamps:  %8.3f seconds" % fMt4
+    print "speedup:              %8.1fx" % (fPandas / fMt4)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(iMain())
@@ -0,0 +1,64 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Benchmark the numpy indicators of OpenTrader.indicators, and TA-Lib's
+if it is installed, on a random feed.
+
+Give the number of bars (default 1000000) as an argument.
+"""
+
+import sys, os
+import time
+
+# we may need this to run the benchmarks in the source directory uninstalled
+sRootDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if sRootDir not in sys.path:
+    sys.path.insert(0, sRootDir)
+del sRootDir
+
+import numpy
+
+from OpenTrader import indicators
+
+def dMakeBars(iBars):
+    aClose = 1.3 + numpy.random.normal(scale=1e-4, size=iBars).cumsum()
+    aOpen = numpy.r_[aClose[0], aClose[:-1]]
+    aHigh = numpy.maximum(aOpen, aClose) + numpy.random.exponential(5e-5, size=iBars)
+    aLow = numpy.minimum(aOpen, aClose) - numpy.random.exponential(5e-5, size=iBars)
+    aVolume = numpy.random.randint(1, 1000, size=iBars).astype('float64')
+    return dict(open=aOpen, high=aHigh, low=aLow, close=aClose, volume=aVolume)
+
+# the inputs of each function, by the names of the bars
+dINPUTS = dict(MIDPRICE=['high', 'low'], AROON=['high', 'low'], AROONOSC=['high', 'low'],
+               MEDPRICE=['high', 'low'], OBV=['close', 'volume'],
+               AD=['high', 'low', 'close', 'volume'], ADOSC=['high', 'low', 'close', 'volume'],
+               AVGPRICE=['open', 'high', 'low', 'close'],
+               WILLR=['high', 'low', 'close'], STOCHF=['high', 'low', 'close'],
+               STOCH=['high', 'low', 'close'], CCI=['high', 'low', 'close'],
+               TRANGE=['high', 'low', 'close'], ATR=['high', 'low', 'close'],
+               NATR=['high', 'low', 'close'], TYPPRICE=['high', 'low', 'close'],
+               WCLPRICE=['high', 'low', 'close'])
+
+def fTime(oFun, lArgs):
+    fStart = time.time()
+    oFun(*lArgs)
+    return time.time() - fStart
+
+def iMain():
+    iBars = 1000000
+    if len(sys.argv) > 1:
+        iBars = int(sys.argv[1])
+    dBars = dMakeBars(iBars)
+    print "bars: %d" % iBars
+    print "%-10s %12s %12s" % ('function', 'numpy', 'talib' if indicators.talib else '')
+    for sName in indicators.lFUNCTIONS:
+        lArgs = [dBars[sKey] for sKey in dINPUTS.get(sName, ['close'])]
+        fNumpy = fTime(getattr(indicators, sName), lArgs)
+        sTalib = ""
+        if indicators.talib is not None and hasattr(indicators.talib, sName):
+            sTalib = "%12.4f" % fTime(getattr(indicators.talib, sName), lArgs)
+        print "%-10s %12.4f %s" % (sName, fNumpy, sTalib)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(iMain())
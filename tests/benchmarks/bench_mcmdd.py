@@ -0,0 +1,49 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Benchmark the vectorized Monte-Carlo drawdown PYBTDailyPerformance.mcmdd
+against the maxdd of one permutation at a time that it replaced.
+
+Give the number of trades (default 1000) as an argument.
+"""
+
+import sys, os
+import time
+
+# we may need this to run the benchmarks in the source directory uninstalled
+sRootDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if sRootDir not in sys.path:
+    sys.path.insert(0, sRootDir)
+del sRootDir
+
+import numpy
+import pandas
+
+from OpenTrader import PYBTDailyPerformance
+
+def fLoopMcmdd(rEquity, runs, quantile=0.99):
+    maxdds = [PYBTDailyPerformance.maxdd(rEquity.take(numpy.random.permutation(len(rEquity))))
+              for i in xrange(runs)]
+    return pandas.Series(maxdds).quantile(quantile)
+
+def fTime(oFun, *lArgs, **dArgs):
+    fStart = time.time()
+    oFun(*lArgs, **dArgs)
+    return time.time() - fStart
+
+def iMain():
+    iTrades = 1000
+    if len(sys.argv) > 1:
+        iTrades = int(sys.argv[1])
+    oIndex = pandas.date_range('2014-01-01', periods=iTrades, freq='H')
+    rEquity = pandas.Series(numpy.random.randn(iTrades), index=oIndex)
+    print "trades: %d" % iTrades
+    print "%8s %12s %12s" % ('runs', 'loop', 'vectorized')
+    for iRuns in [1000, 10000]:
+        fLoop = fTime(fLoopMcmdd, rEquity, iRuns)
+        fVector = fTime(PYBTDailyPerformance.mcmdd, rEquity, runs=iRuns, random_state=1)
+        print "%8d %12.4f %12.4f" % (iRuns, fLoop, fVector)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(iMain())
@@ -0,0 +1,91 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Benchmark the storage profiles of an Omlette (Omlette.dHDF_PROFILES):
+the time to write a backtest of 1-minute bars to the HDF file,
+the time to read it all back, and the size of the file.
+
+Give the number of bars (default 500000) as an argument,
+and optionally the names of the profiles to run.
+"""
+
+import sys, os
+import time
+import tempfile
+import shutil
+
+# we may need this to run the benchmarks in the source directory uninstalled
+sRootDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if sRootDir not in sys.path:
+    sys.path.insert(0, sRootDir)
+del sRootDir
+
+import numpy
+import pandas
+
+from OpenTrader.Omlettes.Omlette import Omlette, dHDF_PROFILES
+
+def lBacktest(iBars):
+    """The frames that a backtest of iBars 1-minute bars puts in its omlette."""
+    oRandom = numpy.random.RandomState(1)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='T')
+    aClose = 1.3 + oRandom.normal(scale=1e-4, size=iBars).cumsum()
+    aOpen = numpy.roll(aClose, 1)
+    aSpread = numpy.abs(oRandom.normal(scale=1e-4, size=iBars))
+    mOhlc = pandas.DataFrame(dict(O=aOpen, H=numpy.maximum(aOpen, aClose) + aSpread,
+                                  L=numpy.minimum(aOpen, aClose) - aSpread, C=aClose,
+                                  V=oRandom.randint(1, 100, iBars).astype('float64')),
+                             index=oIndex, columns=['O', 'H', 'L', 'C', 'V'])
+    rClose = mOhlc.C
+    rPositions = numpy.sign(rClose.rolling(20).mean() - rClose.rolling(50).mean()).fillna(0.0)
+    rEquity = (rPositions.shift().fillna(0.0) * rClose.diff().fillna(0.0))
+    return [('feed/mt4/EURUSD1', mOhlc),
+            ('recipe/servings/rPositions', rPositions),
+            ('recipe/servings/rEquity', rEquity)]
+
+def fWrite(sFile, dProfile, lFrames):
+    fStart = time.time()
+    oOm = Omlette(oFd=open(os.devnull, 'w'), sHdfFlush='close')
+    oOm.vSetHdfProfile(dProfile)
+    oOm.oAddHdfStore(sFile)
+    for sKey, gData in lFrames:
+        oOm.vAppendHdf(sKey, gData)
+    oOm.vClose()
+    return time.time() - fStart
+
+def fRead(sFile):
+    fStart = time.time()
+    oStore = pandas.HDFStore(sFile, mode='r')
+    try:
+        for sKey in oStore.keys():
+            oStore[sKey]
+    finally:
+        oStore.close()
+    return time.time() - fStart
+
+def iMain():
+    iBars = 500000
+    if len(sys.argv) > 1:
+        iBars = int(sys.argv[1])
+    lProfiles = sys.argv[2:] or dHDF_PROFILES.keys()
+    lFrames = lBacktest(iBars)
+    fMb = sum([gData.memory_usage(index=True).sum() if hasattr(gData, 'columns')
+               else gData.memory_usage(index=True)
+               for sKey, gData in lFrames]) / 1e6
+    print "bars: %d, %.1f MB in memory" % (iBars, fMb,)
+    print "%10s %12s %12s %10s %8s" % ('profile', 'write MB/s', 'read MB/s', 'size MB', 'ratio')
+    sDir = tempfile.mkdtemp()
+    try:
+        for sProfile in lProfiles:
+            sFile = os.path.join(sDir, sProfile +'.h5')
+            fWriteTime = fWrite(sFile, dHDF_PROFILES[sProfile], lFrames)
+            fReadTime = fRead(sFile)
+            fSize = os.path.getsize(sFile) / 1e6
+            print "%10s %12.1f %12.1f %10.2f %8.2f" % (sProfile, fMb / fWriteTime,
+                                                       fMb / fReadTime, fSize, fMb / fSize)
+    finally:
+        shutil.rmtree(sDir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(iMain())
@@ -0,0 +1,154 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check that the CookGraph only redoes the stages whose inputs changed.
+"""
+
+import os
+import types
+
+import numpy
+import pandas
+
+from OpenTrader.CookGraph import CookGraph
+from OpenTrader.Omlettes.Omlette import Omlette
+
+class CountingRecipe(object):
+    """A recipe of a moving average cross that counts its cooks."""
+    def __init__(self):
+        self.sName = 'CountingRecipe'
+        self.dConfig = dict(rShortMa=dict(iShortMa=5), rLongMa=dict(iLongMa=20),
+                            sweep=dict(rShortMa=dict(iShortMa=[5, 10])))
+        self.lRequiredDishesParams = ['rShortMa', 'rLongMa']
+        self.iIngredients = 0
+        self.iDishes = 0
+
+    def oConfig(self):
+        return self.dConfig
+
+    def dMakeIngredients(self, dFeeds):
+        self.iIngredients += 1
+        rOpen = dFeeds['mFeedOhlc'].O
+        self.dIngredients = dict(
+            rShortMa=pandas.rolling_mean(rOpen, self.dConfig['rShortMa']['iShortMa']),
+            rLongMa=pandas.rolling_mean(rOpen, self.dConfig['rLongMa']['iLongMa']),
+            mOhlc=dFeeds['mFeedOhlc'])
+        return self.dIngredients
+
+    def dApplyRecipe(self):
+        self.iDishes += 1
+        rShortMa = self.dIngredients['rShortMa']
+        rLongMa = self.dIngredients['rLongMa']
+        rBuy = (rShortMa > rLongMa) & (rShortMa.shift() < rLongMa.shift())
+        rSell = (rShortMa < rLongMa) & (rShortMa.shift() > rLongMa.shift())
+        return dict(rBuy=rBuy, rCover=rBuy, rSell=rSell, rShort=rSell)
+
+class Oven(object):
+    def __init__(self, mOhlc, dDataObj, **dKw):
+        self.mOhlc = mOhlc
+        self.dDataObj = dDataObj
+
+def oChefModule(sChef):
+    oModule = types.ModuleType(sChef)
+    oModule.sChef = sChef
+    oModule.ChefsOven = Oven
+    oModule.__file__ = __file__
+    return oModule
+
+def mRandomFeed(iBars, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    aOpen = 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+    return pandas.DataFrame(dict(O=aOpen, C=aOpen), index=oIndex, columns=['O', 'C'])
+
+def test_oCook():
+    oGraph = CookGraph(iEntries=4)
+    oRecipe = CountingRecipe()
+    oOm = Omlette(oFd=open(os.devnull, 'w'))
+    oOm.oRecipe = oRecipe
+    oChef = oChefModule('Chef')
+    dFeeds = dict(mFeedOhlc=mRandomFeed(2000, iSeed=1))
+    oFd = open(os.devnull, 'w')
+
+    oBt = oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd)
+    dFirst = oRecipe.dIngredients
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (1, 1)
+    assert oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd) is oBt
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (1, 1)
+
+    # the sweep section is not an input of the ingredients
+    oRecipe.dConfig['sweep']['rShortMa']['iShortMa'] = [5, 15]
+    assert oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd) is oBt
+
+    # another chef only makes another oven
+    oOther = oGraph.oCook(dFeeds, oRecipe, oChefModule('Other'), oOm, oFd=oFd)
+    assert oOther is not oBt
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (1, 1)
+
+    oRecipe.dConfig['rShortMa']['iShortMa'] = 10
+    oChanged = oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd)
+    assert oChanged is not oBt
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (2, 2)
+
+    # back to the first config: all of its stages were kept
+    oRecipe.dConfig['rShortMa']['iShortMa'] = 5
+    assert oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd) is oBt
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (2, 2)
+    assert oRecipe.dIngredients is dFirst
+
+    # a feed with other contents is another input
+    dFeeds = dict(mFeedOhlc=mRandomFeed(2000, iSeed=2))
+    oGraph.oCook(dFeeds, oRecipe, oChef, oOm, oFd=oFd)
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (3, 3)
+    assert oGraph.dStats()['ingredients']['iKept'] == 3
+
+def test_oCook_changed_feed():
+    oGraph = CookGraph(iEntries=4)
+    oRecipe = CountingRecipe()
+    oOm = Omlette(oFd=open(os.devnull, 'w'))
+    oOm.oRecipe = oRecipe
+    oChef = oChefModule('Chef')
+    oFd = open(os.devnull, 'w')
+    mFeed = mRandomFeed(100000, iSeed=1)
+    oBt = oGraph.oCook(dict(mFeedOhlc=mFeed), oRecipe, oChef, oOm, oFd=oFd)
+    # a change to rows in the middle of the feed is another feed
+    mOther = mFeed.copy()
+    mOther.iloc[50000:50100, 0] += 0.01
+    assert oGraph.oCook(dict(mFeedOhlc=mOther), oRecipe, oChef, oOm, oFd=oFd) is not oBt
+    assert (oRecipe.iIngredients, oRecipe.iDishes) == (2, 2)
+
+def test_oCook_error_not_kept():
+    # a failed cook is an error message, which is cooked again
+    oGraph = CookGraph(iEntries=4)
+    lMade = []
+    def gMake():
+        lMade.append(1)
+        return "ERROR: the oven failed"
+    assert oGraph.tGet('oven', 'key', gMake) == ("ERROR: the oven failed", False,)
+    assert oGraph.tGet('oven', 'key', gMake) == ("ERROR: the oven failed", False,)
+    assert len(lMade) == 2
+    assert oGraph.dStats()['oven']['iKept'] == 0
+
+def test_oCook_registered_feed(tmpdir, monkeypatch):
+    # a feed read from a file is known by the file, and is not hashed
+    from OpenTrader import IngredientCache
+    from OpenTrader.FeedCache import oFEED_REGISTRY
+    sFile = str(tmpdir.join('feed.csv'))
+    tmpdir.join('feed.csv').write('the contents of the feed')
+    mFeed = mRandomFeed(2000, iSeed=3)
+    oFEED_REGISTRY.vRegister(sFile, mFeed)
+    def sNotHashed(mFeed, lColumns=None):
+        raise AssertionError("the registered feed was hashed")
+    monkeypatch.setattr(IngredientCache, 'sFrameFingerprint', sNotHashed)
+    try:
+        oGraph = CookGraph(iEntries=4)
+        oRecipe = CountingRecipe()
+        oOm = Omlette(oFd=open(os.devnull, 'w'))
+        oOm.oRecipe = oRecipe
+        oChef = oChefModule('Chef')
+        oFd = open(os.devnull, 'w')
+        oBt = oGraph.oCook(dict(mFeedOhlc=mFeed), oRecipe, oChef, oOm, oFd=oFd)
+        assert oGraph.oCook(dict(mFeedOhlc=mFeed), oRecipe, oChef, oOm, oFd=oFd) is oBt
+        assert (oRecipe.iIngredients, oRecipe.iDishes) == (1, 1)
+    finally:
+        del oFEED_REGISTRY.oFeeds[oFEED_REGISTRY.sFingerprint(sFile)]
@@ -0,0 +1,127 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the byte budget of the FeedCache: the arrays shared between
+entries are counted once, and the pinned entries are never evicted;
+and that the FeedRegistry knows the feeds by their contents.
+"""
+
+import os
+import shutil
+
+import numpy
+import pandas
+import pytest
+
+from OpenTrader.FeedCache import FeedCache, iSizeOf, oFEED_REGISTRY
+from OpenTrader.PandasMt4 import oReadMt4Csv, mCompactOhlc
+
+def mRandomFeed(iBars, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='T')
+    return pandas.DataFrame(oRandom.rand(iBars, 4), index=oIndex,
+                            columns=['O', 'H', 'L', 'C'])
+
+def test_shared_counted_once():
+    oCache = FeedCache()
+    mFeed = mRandomFeed(1000, iSeed=1)
+    iBytes = iSizeOf(mFeed)
+    assert iBytes == 1000 * 8 * 5
+    oCache.oView('registry')['fingerprint'] = mFeed
+    oCache.oView('feed')['EURUSD'] = dict(mFeedOhlc=mFeed, sSymbol='EURUSD')
+    assert oCache.iBytes == iBytes
+    # the feed is still held by the registry, so nothing is freed
+    del oCache.oView('feed')['EURUSD']
+    assert oCache.iBytes == iBytes
+    del oCache.oView('registry')['fingerprint']
+    assert oCache.iBytes == 0
+
+def test_pinned_not_evicted():
+    mFeed = mRandomFeed(1000, iSeed=1)
+    oCache = FeedCache(iMaxBytes=iSizeOf(mFeed) * 2)
+    dFeeds = oCache.oView('feed')
+    dFeeds['first'] = mFeed
+    dFeeds.vPin('first')
+    dFeeds['second'] = mRandomFeed(1000, iSeed=2)
+    dFeeds['third'] = mRandomFeed(1000, iSeed=3)
+    assert sorted(dFeeds.keys()) == ['first', 'third']
+    dFeeds.vUnpin('first')
+    dFeeds['fourth'] = mRandomFeed(1000, iSeed=4)
+    assert sorted(dFeeds.keys()) == ['fourth', 'third']
+
+def test_stats():
+    oCache = FeedCache()
+    dFeeds = oCache.oView('feed')
+    dFeeds['first'] = mRandomFeed(10, iSeed=1)
+    # the in test does not count as a hit or a miss
+    assert 'first' in dFeeds and 'second' not in dFeeds
+    assert (oCache.iHits, oCache.iMisses) == (0, 0)
+    assert dFeeds.get('first') is not None and dFeeds.get('second') is None
+    assert (oCache.iHits, oCache.iMisses) == (1, 1)
+
+def test_float32_halves_prices():
+    mFeed = mRandomFeed(1000, iSeed=4)
+    dBytes = dict()
+    for sDtype in ['float64', 'float32']:
+        oCache = FeedCache()
+        oCache.oView('registry')['fingerprint'] = mCompactOhlc(mFeed, sDtype)
+        dBytes[sDtype] = oCache.iBytes
+    # the int64 index is not made smaller
+    iIndex = 1000 * 8
+    assert dBytes['float32'] - iIndex == (dBytes['float64'] - iIndex) // 2 == 1000 * 4 * 4
+
+def vWriteResampledCsv(sCsv, fOpen):
+    with open(sCsv, 'w') as oFd:
+        for iHour in range(24):
+            oFd.write("2014-01-01 %02d:00:00,%.4f,%.4f,%.4f,%.4f\n" % (
+                iHour, fOpen, fOpen + 0.001, fOpen - 0.001, fOpen))
+            fOpen += 0.0001
+
+@pytest.fixture
+def lParsed(monkeypatch):
+    """Count the CSV files that are parsed, with no feeds registered before or after."""
+    oFEED_REGISTRY.oFeeds.clear()
+    oFEED_REGISTRY.dMetadata.clear()
+    lParsed = []
+    oReadCsv = pandas.read_csv
+    def mReadCsv(*lArgs, **dArgs):
+        lParsed.append(lArgs[0])
+        return oReadCsv(*lArgs, **dArgs)
+    monkeypatch.setattr(pandas, 'read_csv', mReadCsv)
+    yield lParsed
+    oFEED_REGISTRY.oFeeds.clear()
+    oFEED_REGISTRY.dMetadata.clear()
+
+def test_registry_same_contents(tmpdir, lParsed):
+    sCsv = str(tmpdir.join('EURUSD60.csv'))
+    vWriteResampledCsv(sCsv, 1.3)
+    # a copy with the same mtime, a link, and a relative path are the same file
+    sCopy = str(tmpdir.mkdir('copy').join('EURUSD60.csv'))
+    shutil.copy2(sCsv, sCopy)
+    sLink = str(tmpdir.join('link.csv'))
+    os.symlink(sCsv, sLink)
+    mFeed = oReadMt4Csv(sCsv, '60', 'EURUSD', '2014', bUseCache=False)
+    for sFile, sSymbol, sYear in [(sCsv, 'EURUSD', ''), (sCopy, 'EURUSD', '2014'),
+                                  (sLink, 'EURUSD', '2014'),
+                                  (os.path.relpath(sCsv), 'EURUSD', '2014')]:
+        assert oReadMt4Csv(sFile, '60', sSymbol, sYear, bUseCache=False) is mFeed
+    assert len(lParsed) == 1
+    dStats = oFEED_REGISTRY.dStats()
+    assert dStats['iFeeds'] == 1
+    dMeta = dStats['dFeeds'].values()[0]
+    assert dMeta['lNames'] == [('EURUSD', '60', '2014'), ('EURUSD', '60', '')]
+    assert sCopy in dMeta['lFiles']
+
+def test_registry_same_basename(tmpdir, lParsed):
+    # the same symbol, timeframe and name in two directories are two feeds
+    lFiles = []
+    for sDir, fOpen in [('broker1', 1.3), ('broker2', 1.2)]:
+        sCsv = str(tmpdir.mkdir(sDir).join('EURUSD60.csv'))
+        vWriteResampledCsv(sCsv, fOpen)
+        lFiles.append(sCsv)
+    mFirst = oReadMt4Csv(lFiles[0], '60', 'EURUSD', bUseCache=False)
+    mSecond = oReadMt4Csv(lFiles[1], '60', 'EURUSD', bUseCache=False)
+    assert len(lParsed) == 2
+    assert mFirst['O'].iat[0] == 1.3 and mSecond['O'].iat[0] == 1.2
+    assert oReadMt4Csv(lFiles[0], '60', 'EURUSD', bUseCache=False) is mFirst
+    assert len(oFEED_REGISTRY.lFind(sSymbol='EURUSD', sTimeFrame='60')) == 2
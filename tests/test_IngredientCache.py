@@ -0,0 +1,119 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the moving averages of the IngredientCache against pandas.rolling_mean.
+"""
+
+import gc
+import warnings
+
+import numpy
+import pandas
+import pytest
+
+from OpenTrader.FeedCache import FeedCache, FeedRegistry, vMakeReadOnly
+from OpenTrader.IngredientCache import IngredientCache, sFrameFingerprint
+
+def mRandomFeed(iBars, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='T')
+    aOpen = 1.3 + oRandom.normal(scale=1e-4, size=iBars).cumsum()
+    return pandas.DataFrame(dict(O=aOpen, C=aOpen + 1e-5), index=oIndex,
+                            columns=['O', 'C'])
+
+def rRollingMean(rSeries, iWindow):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pandas.rolling_mean(rSeries, iWindow)
+
+@pytest.mark.parametrize('iWindow', [1, 2, 50, 200, 5000, 5001])
+def test_rSMA(iWindow):
+    mFeed = mRandomFeed(5000, iSeed=iWindow)
+    oIngredients = IngredientCache(FeedCache())
+    rSma = oIngredients.rSMA(mFeed, 'O', iWindow)
+    pandas.util.testing.assert_series_equal(rSma, rRollingMean(mFeed.O, iWindow),
+                                            check_less_precise=True)
+
+def test_rSMA_with_nans():
+    mFeed = mRandomFeed(500, iSeed=1)
+    mFeed.iloc[100, 0] = numpy.nan
+    oIngredients = IngredientCache(FeedCache())
+    pandas.util.testing.assert_series_equal(oIngredients.rSMA(mFeed, 'O', 20),
+                                            rRollingMean(mFeed.O, 20))
+
+def test_shared_by_contents():
+    oCache = FeedCache()
+    oIngredients = IngredientCache(oCache)
+    mFeed = mRandomFeed(100000, iSeed=2)
+    rFirst = oIngredients.rSMA(mFeed, 'O', 20)
+    # a copy of the same feed hits the same entries
+    assert oIngredients.rSMA(mFeed.copy(), 'O', 20) is rFirst
+    assert oIngredients.rSMA(mFeed, 'C', 20) is not rFirst
+    mOther = mFeed.copy()
+    mOther.iloc[-1, 0] += 1e-3
+    assert sFrameFingerprint(mOther) != sFrameFingerprint(mFeed)
+    assert oIngredients.rSMA(mOther, 'O', 20) is not rFirst
+    assert oIngredients.dStats()['dIndicators'] == dict(cumsum=3, SMA=3)
+    oIngredients.vClear()
+    assert len(oCache) == 0
+
+def test_changed_feed():
+    oIngredients = IngredientCache(FeedCache())
+    mFeed = mRandomFeed(100000, iSeed=3)
+    oIngredients.rSMA(mFeed, 'O', 20)
+    # a change to rows in the middle of the feed is another feed
+    mOther = mFeed.copy()
+    mOther.iloc[50000:50100, 0] += 0.01
+    assert sFrameFingerprint(mOther) != sFrameFingerprint(mFeed)
+    pandas.util.testing.assert_series_equal(oIngredients.rSMA(mOther, 'O', 20),
+                                            rRollingMean(mOther.O, 20),
+                                            check_less_precise=True)
+    # as is a change in place to the feed that was hashed
+    mFeed['O'] += 1.3
+    pandas.util.testing.assert_series_equal(oIngredients.rSMA(mFeed, 'O', 20),
+                                            rRollingMean(mFeed.O, 20),
+                                            check_less_precise=True)
+
+def test_registered_feed(tmpdir):
+    oCache = FeedCache()
+    oRegistry = FeedRegistry(oCache)
+    oIngredients = IngredientCache(oCache, oRegistry=oRegistry)
+    sFile = str(tmpdir.join('feed.csv'))
+    tmpdir.join('feed.csv').write('the contents of the feed')
+    mFeed = mRandomFeed(1000, iSeed=4)
+    oRegistry.vRegister(sFile, mFeed)
+    # the feed is known by its file, by column and dtype, without hashing it
+    sFingerprint = oRegistry.sFingerprint(sFile)
+    assert oIngredients.sFingerprint(mFeed, 'O') == sFingerprint + '-O-float64'
+    assert oIngredients.sFingerprint(mFeed['O']) == sFingerprint + '-O-float64'
+    assert oIngredients.sFingerprint(mFeed) == sFingerprint + '-float64,float64'
+    rSma = oIngredients.rSMA(mFeed, 'O', 20)
+    assert oIngredients.rSMA(mFeed, 'O', 20) is rSma
+    # which is why it cannot be changed in place
+    with pytest.raises(ValueError):
+        mFeed.iloc[10, 0] = 2.0
+    # a copy of it is hashed, and so is a slice of it
+    assert oIngredients.sFingerprint(mFeed.copy(), 'O') == sFrameFingerprint(mFeed, ['O'])
+    assert oIngredients.sFingerprint(mFeed[10:], 'O') == sFrameFingerprint(mFeed[10:], ['O'])
+
+def test_hashed_by_column():
+    oIngredients = IngredientCache(FeedCache())
+    mFeed = mRandomFeed(1000, iSeed=5)
+    sOpen = oIngredients.sFingerprint(mFeed, 'O')
+    mFeed['C'] += 1.0
+    assert oIngredients.sFingerprint(mFeed, 'O') == sOpen
+    mFeed['O'] += 1.0
+    assert oIngredients.sFingerprint(mFeed, 'O') != sOpen
+    assert len(oIngredients.oMemo) == 0
+
+def test_read_only_memoized():
+    oIngredients = IngredientCache(FeedCache())
+    mFeed = mRandomFeed(1000, iSeed=6)
+    vMakeReadOnly(mFeed)
+    sOpen = oIngredients.sFingerprint(mFeed, 'O')
+    assert len(oIngredients.oMemo) == 1
+    assert oIngredients.sFingerprint(mFeed, 'O') == sOpen
+    # and forgotten when the feed is freed, so its memory is not mistaken for another
+    del mFeed
+    gc.collect()
+    assert len(oIngredients.oMemo) == 0
@@ -0,0 +1,68 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the linear filters of LinearFilter against the loops they replace.
+"""
+
+import numpy
+import pytest
+
+from OpenTrader import LinearFilter
+
+def aRandomPrices(iBars, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    return 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+
+def aRsiLoop(prices, n=14):
+    """The loop of the old OTPpnAmgc.rsiFunc."""
+    deltas = numpy.diff(prices)
+    seed = deltas[:n+1]
+    up = seed[seed>=0].sum()/n
+    down = -seed[seed<0].sum()/n
+    rsi = numpy.zeros_like(prices)
+    rsi[:n] = 100. - 100./(1.+up/down)
+    for i in range(n, len(prices)):
+        delta = deltas[i-1]
+        upval = delta if delta > 0 else 0.
+        downval = 0. if delta > 0 else -delta
+        up = (up*(n-1) + upval)/n
+        down = (down*(n-1) + downval)/n
+        rsi[i] = 100. - 100./(1.+up/down)
+    return rsi
+
+def aEmaLoop(aValues, iWindow):
+    fAlpha = 2.0 / (iWindow + 1)
+    aRetval = numpy.empty(len(aValues))
+    aRetval[:] = numpy.nan
+    aRetval[iWindow - 1] = aValues[:iWindow].mean()
+    for i in range(iWindow, len(aValues)):
+        aRetval[i] = (1 - fAlpha) * aRetval[i - 1] + fAlpha * aValues[i]
+    return aRetval
+
+@pytest.mark.parametrize('iWindow', [2, 14, 30])
+def test_aRSI(iWindow):
+    aPrices = aRandomPrices(5000, iWindow)
+    numpy.testing.assert_allclose(LinearFilter.aRSI(aPrices, iWindow),
+                                  aRsiLoop(aPrices, iWindow), rtol=1e-10)
+
+@pytest.mark.parametrize('iWindow', [1, 9, 26, 200])
+def test_aEMA(iWindow):
+    aPrices = aRandomPrices(5000, iWindow)
+    numpy.testing.assert_allclose(LinearFilter.aEMA(aPrices, iWindow),
+                                  aEmaLoop(aPrices, iWindow), rtol=1e-10)
+    # leading NaNs, as in the signal line of the MACD, delay the seed
+    aShifted = numpy.r_[numpy.nan * numpy.ones(25), aPrices]
+    numpy.testing.assert_allclose(LinearFilter.aEMA(aShifted, iWindow)[25:],
+                                  aEmaLoop(aPrices, iWindow), rtol=1e-10)
+
+@pytest.mark.parametrize('fAlpha', [1.0, 0.5, 2 / 27.0, 1e-3, 1e-7])
+def test_aLinearRecursionNumpy(fAlpha):
+    aX = aRandomPrices(20000, 1)
+    aY = numpy.empty(len(aX))
+    fPrev = 1.0
+    for i in range(len(aX)):
+        fPrev = aY[i] = (1 - fAlpha) * fPrev + fAlpha * aX[i]
+    numpy.testing.assert_allclose(LinearFilter.aLinearRecursionNumpy(aX, fAlpha, 1.0),
+                                  aY, rtol=1e-10)
+    numpy.testing.assert_allclose(LinearFilter.aLinearRecursion(aX, fAlpha, 1.0),
+                                  aY, rtol=1e-10)
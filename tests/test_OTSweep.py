@@ -0,0 +1,118 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the parsing of the [sweep] grid, and that a sweep gives the
+summaries that cooking each of its combinations on its own gives.
+"""
+
+import sys, os
+from collections import OrderedDict
+
+import numpy
+import pandas
+import pytest
+
+# the recipes and chefs that the sweep workers import by name
+sRecipesDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'share', 'recipes')
+if sRecipesDir not in sys.path:
+    sys.path.append(sRecipesDir)
+del sRecipesDir
+
+from OpenTrader.OTSweep import lParseSweepValues, lSweepGrid, dFlattenSummary, \
+     mSweepRecipe, mSweepRecipeBatch
+from OpenTrader.Omlettes.Omlette import Omlette
+from OpenTrader.OTBackTest import oPyBacktestCook
+
+def test_lParseSweepValues():
+    assert lParseSweepValues('10:60:10') == [10, 20, 30, 40, 50]
+    assert lParseSweepValues('1:4') == [1, 2, 3]
+    assert lParseSweepValues('0.5:1.0:0.25') == [0.5, 0.75]
+    assert lParseSweepValues([100, 150]) == [100, 150]
+    assert lParseSweepValues(5) == [5]
+    for sBad in ['10', '1:2:3:4', '1:10:0']:
+        with pytest.raises(AssertionError):
+            lParseSweepValues(sBad)
+
+def test_lSweepGrid():
+    dSweep = OrderedDict([('rShortMa', dict(iShortMa='10:30:10')),
+                          ('rLongMa', dict(iLongMa=[100, 200]))])
+    lGrid = lSweepGrid(dSweep)
+    assert [tuple(dParams.values()) for dParams in lGrid] == \
+        [(10, 100), (10, 200), (20, 100), (20, 200)]
+    assert lGrid[0].keys() == [('rShortMa', 'iShortMa'), ('rLongMa', 'iLongMa')]
+    with pytest.raises(AssertionError):
+        lSweepGrid(dict(iShortMa=[10, 20]))
+
+def test_dFlattenSummary():
+    dSummary = dict(backtest=dict(trades=3, days=2), performance=dict(profit=1.5), name='x')
+    assert dFlattenSummary(dSummary).items() == \
+        [('backtest.days', 2), ('backtest.trades', 3), ('name', 'x'),
+         ('performance.profit', 1.5)]
+
+def mRandomFeed(iBars, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    aClose = 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+    aOpen = numpy.roll(aClose, 1)
+    aOpen[0] = aClose[0]
+    return pandas.DataFrame(dict(O=aOpen, H=numpy.maximum(aOpen, aClose),
+                                 L=numpy.minimum(aOpen, aClose), C=aClose),
+                            index=oIndex, columns=['O', 'H', 'L', 'C'])
+
+def dCookSummary(mFeedOhlc, dParams):
+    """The summary of a single chef cook of SMARecipe with dParams."""
+    oFd = open(os.devnull, 'w')
+    oOm = Omlette(oFd=oFd)
+    oRecipe = oOm.oAddRecipe('SMARecipe')
+    oRecipe.oFd = oFd
+    for (sSect, sKey), gVal in dParams.items():
+        oRecipe.oConfig(sSect, sKey, gVal)
+    dFeeds = dict(mFeedOhlc=mFeedOhlc)
+    oRecipe.dMakeIngredients(dFeeds)
+    # as backtester.oEnsureChef names it
+    oChefModule = __import__('PybacktestChef')
+    oChefModule.sChef = 'PybacktestChef'
+    oBt = oPyBacktestCook(dFeeds, oRecipe, oChefModule, oOm, oFd=oFd)
+    assert not isinstance(oBt, basestring), oBt
+    return dFlattenSummary(oBt.dSummary())
+
+def test_mSweepRecipe():
+    mFeedOhlc = mRandomFeed(3000, iSeed=1)
+    oRecipe = Omlette(oFd=open(os.devnull, 'w')).oAddRecipe('SMARecipe')
+    dConfig = dict([(sSect, dict(oRecipe.oConfig()[sSect]))
+                    for sSect in oRecipe.oConfig().keys()])
+    lGrid = [OrderedDict([(('rShortMa', 'iShortMa'), 10), (('rLongMa', 'iLongMa'), 50)]),
+             OrderedDict([(('rShortMa', 'iShortMa'), 20), (('rLongMa', 'iLongMa'), 100)])]
+    mSweep = mSweepRecipe('SMARecipe', mFeedOhlc, dConfig, lGrid=lGrid, iWorkers=2,
+                          oFd=open(os.devnull, 'w'))
+    assert list(mSweep['rShortMa.iShortMa']) == [10, 20]
+    assert list(mSweep['rLongMa.iLongMa']) == [50, 100]
+    assert list(mSweep['sError']) == ["", ""]
+    for iCombo, dParams in enumerate(lGrid):
+        dSummary = dCookSummary(mFeedOhlc, dParams)
+        for sKey, gVal in dSummary.items():
+            if 'monte-carlo' in sKey:
+                # a Monte Carlo simulation, from another random state
+                continue
+            gSwept = mSweep[sKey].iloc[iCombo]
+            if isinstance(gVal, float):
+                assert numpy.allclose(gSwept, gVal, equal_nan=True), sKey
+            else:
+                assert gSwept == gVal, sKey
+
+def test_mSweepRecipeBatch_needs_batch(tmpdir, monkeypatch):
+    # a recipe with no dApplyRecipeBatch is only swept a combination at a time
+    sIniFile = os.path.join(os.path.dirname(__import__('SMARecipe').__file__), 'SMARecipe.ini')
+    tmpdir.join('NoBatchRecipe.py').write(
+        "from OpenTrader.Omlettes.Recipe import Recipe\n"
+        "class NoBatchRecipe(Recipe):\n"
+        "    def __init__(self, *lArgs):\n"
+        "        Recipe.__init__(self, *lArgs)\n"
+        "        self.sIniFile = %r\n" % (sIniFile,))
+    monkeypatch.syspath_prepend(str(tmpdir))
+    with pytest.raises(AssertionError) as oInfo:
+        mSweepRecipeBatch('NoBatchRecipe', mRandomFeed(500, iSeed=1), dict(),
+                          lGrid=lSweepGrid(dict(rShortMa=dict(iShortMa=[10, 20]))),
+                          oFd=open(os.devnull, 'w'))
+    assert "use back sweep run" in str(oInfo.value)
@@ -0,0 +1,89 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check that the queued HDF writes of an Omlette give the same store
+as writing each put as it is made.
+"""
+
+import os
+
+import numpy
+import pandas
+import pytest
+
+tables = pytest.importorskip('tables')
+
+from OpenTrader.Omlettes.Omlette import Omlette, dHDF_PROFILES
+
+def lWrites(iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=500, freq='H')
+    mTrades = pandas.DataFrame(dict(pos=oRandom.randint(-1, 2, 500).astype('float64'),
+                                    price=oRandom.rand(500)),
+                               index=oIndex, columns=['pos', 'price'])
+    rEquity = pandas.Series(oRandom.randn(500), index=oIndex)
+    return [('recipe/servings/mTrades', mTrades),
+            ('recipe/servings/rEquity', rEquity * 2.0),
+            # the last put of a key is the one that is kept
+            ('recipe/servings/rEquity', rEquity)]
+
+def oWriteOmlette(sFile, sHdfFormat, sHdfFlush, bHdfThread=False):
+    oOm = Omlette(oFd=open(os.devnull, 'w'), sHdfFormat=sHdfFormat, sHdfFlush=sHdfFlush,
+                  bHdfThread=bHdfThread, iHdfQueue=1)
+    oOm.oAddHdfStore(sFile)
+    for sKey, gData in lWrites(1):
+        oOm.vAppendHdf(sKey, gData)
+    oOm.vSetMetadataHdf('recipe/servings', dict(sName='test'))
+    oOm.vSetTitleHdf('recipe/servings', 'Chef')
+    oOm.vEndStageHdf()
+    oOm.vClose()
+
+@pytest.mark.parametrize('sHdfFormat', ['table', 'fixed'])
+@pytest.mark.parametrize('sHdfFlush', ['put', 'stage', 'close'])
+@pytest.mark.parametrize('bHdfThread', [False, True])
+def test_vCommitHdf(tmpdir, sHdfFormat, sHdfFlush, bHdfThread):
+    sPut = str(tmpdir.join('put.h5'))
+    sQueued = str(tmpdir.join('queued.h5'))
+    oWriteOmlette(sPut, sHdfFormat, 'put')
+    oWriteOmlette(sQueued, sHdfFormat, sHdfFlush, bHdfThread)
+    oPut = pandas.HDFStore(sPut, mode='r')
+    oQueued = pandas.HDFStore(sQueued, mode='r')
+    try:
+        assert sorted(oPut.keys()) == sorted(oQueued.keys())
+        for sKey in oPut.keys():
+            gPut = oPut[sKey]
+            if isinstance(gPut, pandas.DataFrame):
+                pandas.util.testing.assert_frame_equal(gPut, oQueued[sKey])
+            else:
+                pandas.util.testing.assert_series_equal(gPut, oQueued[sKey])
+        oNode = oQueued.get_node('/recipe/servings')
+        assert oNode._v_attrs.metadata == [dict(sName='test')]
+        assert oNode._v_title == 'Chef'
+    finally:
+        oPut.close()
+        oQueued.close()
+
+@pytest.mark.parametrize('sProfile', dHDF_PROFILES.keys())
+def test_vSetHdfProfile(tmpdir, sProfile):
+    dProfile = dHDF_PROFILES[sProfile]
+    if dProfile['sComplib'] and not tables.which_lib_version(dProfile['sComplib']):
+        pytest.skip("PyTables was built without " +dProfile['sComplib'])
+    sFile = str(tmpdir.join(sProfile +'.h5'))
+    oOm = Omlette(oFd=open(os.devnull, 'w'))
+    oOm.vSetHdfProfile(dProfile)
+    oOm.oAddHdfStore(sFile)
+    for sKey, gData in lWrites(2):
+        oOm.vAppendHdf(sKey, gData)
+    oOm.vClose()
+    oStore = pandas.HDFStore(sFile, mode='r')
+    try:
+        pandas.util.testing.assert_series_equal(oStore['recipe/servings/rEquity'],
+                                                lWrites(2)[-1][1])
+        oStorer = oStore.get_storer('recipe/servings/mTrades')
+        assert oStorer.is_table == (dProfile['sHdfFormat'] == 'table')
+        if dProfile['sComplib']:
+            oLeaf = [o for o in oStore.get_node('recipe/servings/mTrades')._f_walknodes('Leaf')][0]
+            assert oLeaf.filters.complib == dProfile['sComplib']
+            assert oLeaf.filters.complevel == dProfile['iComplevel']
+    finally:
+        oStore.close()
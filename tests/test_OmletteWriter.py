@@ -0,0 +1,114 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check that the OmletteWriter makes its writes in order, holds back the
+caller when its queue is full, and raises the errors of its writes
+without dropping the others, and that an Omlette closes its store
+only after they are all made.
+"""
+
+import os
+import threading
+
+import pandas
+import pytest
+
+from OpenTrader.Omlettes.Omlette import Omlette
+from OpenTrader.Omlettes.OmletteWriter import OmletteWriter
+
+def oStartWriter(iQueue):
+    oWriter = OmletteWriter(iQueue=iQueue, oFd=open(os.devnull, 'w'))
+    oWriter.start()
+    return oWriter
+
+def test_vDrain():
+    oWriter = oStartWriter(2)
+    lWritten = []
+    for i in range(50):
+        oWriter.vSubmit(lambda i=i: lWritten.append(i))
+    oWriter.vDrain()
+    assert lWritten == range(50)
+    oWriter.stop()
+    assert not oWriter.isAlive()
+
+def test_backpressure():
+    oWriter = oStartWriter(1)
+    oRelease = threading.Event()
+    oWriter.vSubmit(oRelease.wait)
+    # the writer is held by the first write, and the queue holds the second
+    oWriter.vSubmit(lambda: None)
+    oSubmitted = threading.Event()
+    def vSubmit():
+        oWriter.vSubmit(lambda: None)
+        oSubmitted.set()
+    oThread = threading.Thread(target=vSubmit)
+    oThread.start()
+    assert not oSubmitted.wait(0.2)
+    oRelease.set()
+    assert oSubmitted.wait(5.0)
+    oThread.join()
+    oWriter.stop()
+
+def test_vRaiseError():
+    oWriter = oStartWriter(4)
+    lWritten = []
+    oRelease = threading.Event()
+    def vFail():
+        oRelease.wait()
+        raise IOError("disk full")
+    oWriter.vSubmit(vFail)
+    oWriter.vSubmit(lambda: lWritten.append(1))
+    oRelease.set()
+    with pytest.raises(IOError):
+        oWriter.vDrain()
+    # the writes after a failure are still made
+    assert lWritten == [1]
+    assert oWriter.iFailed == 1
+    # the error is raised once, after the next write is queued
+    oRelease.clear()
+    oWriter.vSubmit(vFail)
+    oRelease.set()
+    oWriter.oQueue.join()
+    with pytest.raises(IOError):
+        oWriter.vSubmit(lambda: lWritten.append(2))
+    oWriter.stop()
+    assert lWritten == [1, 2]
+
+class FailingStore(object):
+    """An HDF store whose puts of the keys in lFail fail, once oRelease is set."""
+    def __init__(self, lFail):
+        self.lFail = lFail
+        self.oRelease = threading.Event()
+        self.lPuts = []
+        self.bClosed = False
+    def put(self, sKey, gData, **dKw):
+        assert not self.bClosed, "the store was closed before the write"
+        if sKey.lstrip('/') in self.lFail:
+            self.oRelease.wait()
+            raise IOError("disk full")
+        self.lPuts.append(sKey.lstrip('/'))
+    def get_node(self, sKey):
+        return None
+    def flush(self):
+        pass
+    def close(self):
+        self.bClosed = True
+
+def test_vClose_after_failure():
+    oOm = Omlette(oFd=open(os.devnull, 'w'), sHdfFlush='stage', bHdfThread=True, iHdfQueue=1)
+    oStore = FailingStore(['a'])
+    oOm.oHdfStore = oStore
+    oOm.vAppendHdf('a', pandas.Series([1.0]))
+    oOm.vEndStageHdf()
+    oOm.vAppendHdf('b', pandas.Series([2.0]))
+    oOm.vEndStageHdf()
+    oOm.vAppendHdf('c', pandas.Series([3.0]))
+    oWriter = oOm.oWriter
+    oStore.oRelease.set()
+    with pytest.raises(IOError):
+        oOm.vClose()
+    # the batches queued after the failure were written, then the store closed
+    assert oStore.lPuts == ['b', 'c']
+    assert oStore.bClosed
+    assert not oWriter.isAlive()
+    assert oOm.oHdfStore is None
@@ -0,0 +1,95 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the vectorized Monte-Carlo drawdown of PYBTDailyPerformance against
+the maxdd of each permutation that it replaces.
+"""
+
+import numpy
+import pandas
+import pytest
+
+from OpenTrader import PYBTDailyPerformance
+
+def rRandomEquity(iTrades, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iTrades, freq='H')
+    return pandas.Series(oRandom.randn(iTrades), index=oIndex)
+
+@pytest.mark.parametrize('iTrades', [1, 2, 50, 777])
+def test_aMaxdds(iTrades):
+    rEquity = rRandomEquity(iTrades, iSeed=iTrades)
+    oRandom = numpy.random.RandomState(iTrades)
+    aPermutations = numpy.array([oRandom.permutation(iTrades) for i in range(40)])
+    lLoop = [PYBTDailyPerformance.maxdd(rEquity.take(aPermutation))
+             for aPermutation in aPermutations]
+    aVector = PYBTDailyPerformance.aMaxdds(rEquity.values, aPermutations)
+    assert numpy.allclose(lLoop, aVector, rtol=1e-12, atol=1e-12)
+
+def test_mcmdd_random_state():
+    rEquity = rRandomEquity(300, iSeed=3)
+    fFirst = PYBTDailyPerformance.mcmdd(rEquity, runs=500, random_state=42)
+    fSecond = PYBTDailyPerformance.mcmdd(rEquity, runs=500,
+                                         random_state=numpy.random.RandomState(42))
+    assert fFirst == fSecond
+
+@pytest.mark.parametrize('batch_size', [1, 7, 100, 1000])
+def test_mcmdd_batch_size(batch_size):
+    # the batches draw their keys from the same stream, so they give the same runs
+    rEquity = rRandomEquity(200, iSeed=5)
+    lAll = PYBTDailyPerformance.mcmdd(rEquity, runs=300, array=True,
+                                      batch_size=300, random_state=1)
+    lBatched = PYBTDailyPerformance.mcmdd(rEquity, runs=300, array=True,
+                                          batch_size=batch_size, random_state=1)
+    assert lAll == lBatched
+
+lMETRICS = ['days', 'trades_per_month', 'profit', 'average', 'average_gain',
+            'average_loss', 'winrate', 'payoff', 'PF', 'maxdd', 'RF', 'trades',
+            'sortino', 'ulcer', 'UPI', 'MPI']
+
+@pytest.mark.parametrize('sTz', [None, 'US/Eastern'])
+def test_MetricsEngine(sTz):
+    oRandom = numpy.random.RandomState(7)
+    oIndex = pandas.date_range('2014-01-01', periods=3000, freq='H', tz=sTz)
+    aEquity = oRandom.randn(3000)
+    aEquity[oRandom.rand(3000) < 0.5] = 0.0
+    rEquity = pandas.Series(aEquity, index=oIndex)
+    oEngine = PYBTDailyPerformance.MetricsEngine(rEquity)
+    for sMetric in lMETRICS:
+        fFunction = getattr(PYBTDailyPerformance, sMetric)(rEquity)
+        assert numpy.allclose(getattr(oEngine, sMetric)(), fFunction,
+                              rtol=1e-12, atol=0), sMetric
+    dSummary = oEngine.dSummary(random_state=1)
+    assert oEngine.dSummary(random_state=1) is dSummary
+    assert dSummary['backtest']['trades'] == PYBTDailyPerformance.trades(rEquity)
+    assert dSummary['risk/return profile']['maxdd'] == \
+        round(PYBTDailyPerformance.maxdd(rEquity[rEquity != 0]), 4)
+
+@pytest.mark.parametrize('iWindow', [2, 10, 100])
+def test_mRollingMetrics(iWindow):
+    rEquity = rRandomEquity(1000, iSeed=iWindow)
+    mRolling = PYBTDailyPerformance.mRollingMetrics(rEquity, iWindow)
+    # the running sums lose a few digits when a window has almost no variance
+    oRolling = rEquity.rolling(iWindow)
+    def rSortino(aWindow):
+        aLosses = aWindow[aWindow < 0]
+        return aWindow.mean() / aLosses.std(ddof=1) if len(aLosses) > 1 else numpy.nan
+    dExpected = {
+        'sharpe': oRolling.mean() / oRolling.std(),
+        'sortino': oRolling.apply(rSortino),
+        'winrate': (rEquity > 0).astype('float64').rolling(iWindow).mean(),
+        'drawdown': rEquity.cumsum() - rEquity.cumsum().rolling(iWindow).max(),
+        'underwater': rEquity.cumsum() - pandas.Series(
+            numpy.maximum.accumulate(rEquity.cumsum().values), index=rEquity.index),
+        }
+    for sKey, rExpected in dExpected.items():
+        assert numpy.allclose(mRolling[sKey].values, rExpected.values,
+                              rtol=1e-6, atol=1e-9, equal_nan=True), sKey
+    # the trades since the highest equity so far
+    lDuration = []
+    fHigh, iHigh = -numpy.inf, 0
+    for i, fCumsum in enumerate(rEquity.cumsum().values):
+        if fCumsum >= fHigh:
+            fHigh, iHigh = fCumsum, i
+        lDuration.append(i - iHigh)
+    assert list(mRolling['duration'].values) == lDuration
@@ -0,0 +1,126 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the vectorized PYBTParts against the loops in Recipe that they replace.
+"""
+
+import numpy
+import pandas
+import pytest
+
+from OpenTrader.Omlettes.Recipe import Recipe
+from OpenTrader import PYBTParts
+
+lMASK = ['Buy', 'Sell', 'Short', 'Cover']
+
+class Bt(object):
+    """Just the servings of a ChefsOven that the Recipe loops use."""
+    def __init__(self, mSignals):
+        self.signals = mSignals
+
+def mRandomSignals(iBars, fDensity, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    return pandas.DataFrame(oRandom.rand(iBars, 4) < fDensity,
+                            index=oIndex, columns=lMASK)
+
+@pytest.mark.parametrize('fDensity', [0.0, 0.01, 0.2, 0.9])
+@pytest.mark.parametrize('init_pos', [-1, 0, 1])
+def test_rSignalsToPositions(fDensity, init_pos):
+    oBt = Bt(mRandomSignals(2000, fDensity, iSeed=int(fDensity * 100) + init_pos + 1))
+    rLoop = Recipe().rPositionsIterrows(oBt, init_pos=init_pos)
+    rVector = PYBTParts.rSignalsToPositions(oBt.signals, init_pos=init_pos)
+    pandas.util.testing.assert_series_equal(rLoop, rVector)
+
+def test_rPositions_sized_signals():
+    mSignals = mRandomSignals(500, 0.2, iSeed=1).astype('float64') * 2
+    assert not PYBTParts.bBooleanSignals(mSignals, lMASK)
+    oBt = Bt(mSignals)
+    pandas.util.testing.assert_series_equal(Recipe().rPositions(oBt),
+                                            Recipe().rPositionsIterrows(oBt))
+
+@pytest.mark.parametrize('fDensity', [0.01, 0.2, 0.9])
+def test_rTradesToEquity(fDensity):
+    oBt = Bt(mRandomSignals(2000, fDensity, iSeed=int(fDensity * 100)))
+    oRandom = numpy.random.RandomState(2)
+    oBt.trade_price = pandas.Series(1.3 + oRandom.normal(scale=1e-3, size=2000).cumsum(),
+                                    index=oBt.signals.index)
+    oBt.positions = PYBTParts.rSignalsToPositions(oBt.signals)
+    oBt.trades = Recipe().mTrades(oBt)
+    oRecipe = Recipe()
+    rApply = oRecipe.rEquityApply(oBt)
+    oRecipe.sEquityEngine = 'numpy'
+    pandas.util.testing.assert_series_equal(rApply, oRecipe.rEquity(oBt))
+
+def tRandomBatch(iBars, iVariants, fDensity, iSeed):
+    oRandom = numpy.random.RandomState(iSeed)
+    return [oRandom.rand(iBars, iVariants) < fDensity for sKey in lMASK]
+
+@pytest.mark.parametrize('fDensity', [0.0, 0.01, 0.2, 0.9])
+@pytest.mark.parametrize('init_pos', [-1, 0, 1])
+def test_tBatchSignalsToPositions(fDensity, init_pos):
+    lSignals = tRandomBatch(500, 7, fDensity, iSeed=int(fDensity * 100) + init_pos + 1)
+    aCol, aBar, aPos = PYBTParts.tBatchSignalsToPositions(*lSignals, iInitPos=init_pos)
+    for iVariant in range(7):
+        aPositions = PYBTParts.aSignalsToPositions(*[aSignals[:, iVariant]
+                                                     for aSignals in lSignals],
+                                                   iInitPos=init_pos)
+        aChanged = numpy.flatnonzero(numpy.diff(numpy.r_[init_pos, aPositions]))
+        aMine = aCol == iVariant
+        numpy.testing.assert_array_equal(aBar[aMine], aChanged)
+        numpy.testing.assert_array_equal(aPos[aMine], aPositions[aChanged])
+
+@pytest.mark.parametrize('fDensity', [0.01, 0.2, 0.9])
+def test_aBatchTradesToEquity(fDensity):
+    iBars = 1000
+    lSignals = tRandomBatch(iBars, 5, fDensity, iSeed=int(fDensity * 100))
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    oRandom = numpy.random.RandomState(3)
+    aPrice = 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+    aPrice[oRandom.rand(iBars) < 0.02] = numpy.nan
+    aCol, aBar, aPos = PYBTParts.tBatchSignalsToPositions(*lSignals)
+    aCol, aBar, aPos, aVol, aTradePrice = PYBTParts.tBatchPositionsToTrades(
+        aCol, aBar, aPos, aPrice)
+    aEquity = PYBTParts.aBatchTradesToEquity(aCol, aPos, aVol, aTradePrice)
+    for iVariant in range(5):
+        oBt = Bt(pandas.DataFrame(dict(zip(lMASK, [aSignals[:, iVariant]
+                                                   for aSignals in lSignals])),
+                                  index=oIndex, columns=lMASK))
+        oBt.trade_price = pandas.Series(aPrice, index=oIndex)
+        oBt.positions = PYBTParts.rSignalsToPositions(oBt.signals)
+        mTrades = Recipe().mTrades(oBt)
+        aMine = aCol == iVariant
+        numpy.testing.assert_array_equal(oIndex[aBar[aMine]], mTrades.index)
+        numpy.testing.assert_array_equal(aVol[aMine], mTrades.vol.values)
+        numpy.testing.assert_allclose(aEquity[aMine],
+                                      PYBTParts.rTradesToEquity(mTrades).values,
+                                      atol=1e-12)
+
+def test_mBatchPerformanceSummary():
+    from OpenTrader.PYBTDailyPerformance import dPerformanceSummary, \
+         mBatchPerformanceSummary
+    from OpenTrader.OTSweep import dFlattenSummary
+    iBars = 3000
+    lSignals = tRandomBatch(iBars, 4, 0.05, iSeed=4)
+    # a variant with no trades
+    for aSignals in lSignals:
+        aSignals[:, 2] = False
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    aPrice = 1.3 + numpy.random.RandomState(5).normal(scale=1e-3, size=iBars).cumsum()
+    aCol, aBar, aPos = PYBTParts.tBatchSignalsToPositions(*lSignals)
+    aCol, aBar, aPos, aVol, aTradePrice = PYBTParts.tBatchPositionsToTrades(
+        aCol, aBar, aPos, aPrice)
+    aEquity = PYBTParts.aBatchTradesToEquity(aCol, aPos, aVol, aTradePrice)
+    mSummary = mBatchPerformanceSummary(aCol, aBar, aEquity, 4, oIndex)
+    assert list(mSummary.index) == range(4)
+    assert mSummary.loc[2, 'backtest.trades'] == 0
+    for iVariant in [0, 1, 3]:
+        aMine = aCol == iVariant
+        rEquity = pandas.Series(aEquity[aMine], index=oIndex[aBar[aMine]])
+        dSummary = dFlattenSummary(dPerformanceSummary(rEquity))
+        for sKey in mSummary.columns:
+            gBatch = mSummary.loc[iVariant, sKey]
+            if isinstance(gBatch, float):
+                assert abs(gBatch - dSummary[sKey]) < 1e-3, sKey
+            else:
+                assert gBatch == dSummary[sKey], sKey
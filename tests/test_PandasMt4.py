@@ -0,0 +1,333 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the vectorized parsing of the Mt4 dates and times against pandas,
+and the resampling of the 1 minute data.
+"""
+
+import os
+import numpy
+import pandas
+import pytest
+
+from OpenTrader.PandasMt4 import aParseMt4Timestamps, mIndexByMt4Timestamps, \
+     mReadMt4Raw1Min, vResample1MinFrames, vResample1MinStreaming, tResampleJob, \
+     vResample1MinAppend, vWriteFeedCache, bFeedCacheValid, oReadFeedCache, \
+     oReadMt4Hst, dReadMt4HstHeader, oHST_HEADER_DTYPE, dHST_DTYPES, lOHLC_COLUMNS, \
+     oReadMt4Csv, sFeedCacheDir, lMakeResampleJobs, lResampleParallel
+from OpenTrader.FeedCache import oFEED_REGISTRY, _aRootOf
+
+def aObjects(lStrings):
+    return numpy.array(lStrings, dtype=object)
+
+def oPandasIndex(lDates, lTimes):
+    rDates = pandas.Series(lDates) + ' ' + pandas.Series(lTimes)
+    return pandas.DatetimeIndex(pandas.to_datetime(rDates), name='timestamp')
+
+@pytest.mark.parametrize('lTimes', [['00:00', '13:07', '23:59'],
+                                    ['00:00:00', '13:07:31', '23:59:59']])
+def test_aParseMt4Timestamps(lTimes):
+    lDates = ['2014.01.01', '2016-02-29', '1999.12.31']
+    aTimestamps = aParseMt4Timestamps(aObjects(lDates), aObjects(lTimes))
+    assert list(aTimestamps.view('M8[ns]')) == list(oPandasIndex(lDates, lTimes).values)
+
+@pytest.mark.parametrize('sDate, sTime', [
+    ('2014.01.011', '00:00'),
+    ('2014.01.0', '00:00'),
+    ('2014/01/01', '00:00'),
+    ('2014.01.01', '00:001'),
+    ('2014.01.01', '00.00'),
+    ('2014.01.01', '00:00:001'),
+    ])
+def test_malformed_rows(sDate, sTime):
+    lDates = ['2014.01.01', sDate]
+    lTimes = ['00:00', sTime]
+    with pytest.raises(ValueError):
+        aParseMt4Timestamps(aObjects(lDates), aObjects(lTimes))
+    # mIndexByMt4Timestamps falls back to pandas, and fails or not as it does
+    mDf = pandas.DataFrame(dict(D=lDates, T=lTimes, O=[1.0, 2.0]), columns=['D', 'T', 'O'])
+    try:
+        oExpected = oPandasIndex(lDates, lTimes)
+    except ValueError:
+        with pytest.raises(ValueError):
+            mIndexByMt4Timestamps(mDf, 'D', 'T')
+    else:
+        assert list(mIndexByMt4Timestamps(mDf, 'D', 'T').index) == list(oExpected)
+
+def vWriteRaw1Min(sRaw1, oIndex, sMode='w'):
+    """Write 1 minute Mt4 rows at the timestamps oIndex, opening at i/100."""
+    with open(sRaw1, sMode) as oFd:
+        for i, oTime in enumerate(oIndex):
+            fOpen = 1.0 + ((oTime.value // 60000000000) % 97) / 100.0
+            oFd.write("%s,%s,%.2f,%.2f,%.2f,%.2f,%d\n" % (
+                oTime.strftime('%Y.%m.%d'), oTime.strftime('%H:%M'),
+                fOpen, fOpen + 0.01, fOpen - 0.01, fOpen, 10,))
+
+def sReadFile(sFile):
+    with open(sFile, 'rb') as oFd:
+        return oFd.read()
+
+def oGappyIndex():
+    """Two days of minutes, with a gap of a few hours and missing minutes."""
+    oIndex = pandas.date_range('2014-01-01', '2014-01-02 23:59', freq='T')
+    aKeep = numpy.ones(len(oIndex), dtype=bool)
+    aKeep[600:840] = False
+    aKeep[1000:1003] = False
+    aKeep[numpy.arange(7, len(oIndex), 11)] = False
+    return oIndex[aKeep]
+
+def sOneShotCsv(sRaw1, sTimeFrame, sCsv):
+    """Resample all of sRaw1 at once, as vResample1Min does."""
+    mRaw1 = mReadMt4Raw1Min(sRaw1)
+    mRaw1.iloc[:, [0]].resample(sTimeFrame+'T', how='ohlc', closed='left').to_csv(sCsv, header=False)
+    return sReadFile(sCsv)
+
+@pytest.mark.parametrize('iChunkRows', [7, 13, 100, 10**6])
+def test_chunked_like_one_shot(tmpdir, iChunkRows):
+    # the chunks end inside the bars, so the bars are carried over and merged
+    sRaw1 = str(tmpdir.join('raw1.csv'))
+    vWriteRaw1Min(sRaw1, oGappyIndex())
+    lTimeFrames = ['5', '15', '60', '240', '1440']
+    dResampledCsvs = dict([(sTimeFrame, str(tmpdir.join(sTimeFrame + '.csv')))
+                           for sTimeFrame in lTimeFrames])
+    vResample1MinFrames(sRaw1, dResampledCsvs, iChunkRows=iChunkRows)
+    for sTimeFrame in lTimeFrames:
+        sExpected = sOneShotCsv(sRaw1, sTimeFrame, str(tmpdir.join('expected.csv')))
+        assert sReadFile(dResampledCsvs[sTimeFrame]) == sExpected, sTimeFrame
+
+    sStreamed = str(tmpdir.join('streamed.csv'))
+    vResample1MinStreaming(sRaw1, sStreamed, '15', iChunkRows=iChunkRows)
+    assert sReadFile(sStreamed) == sReadFile(dResampledCsvs['15'])
+
+def test_failed_append_keeps_history(tmpdir):
+    sRaw1 = str(tmpdir.join('raw1.csv'))
+    dResampledCsvs = {'5': str(tmpdir.join('5.csv')), '15': str(tmpdir.join('15.csv'))}
+    vWriteRaw1Min(sRaw1, pandas.date_range('2014-01-01', periods=200, freq='T'))
+    vResample1MinFrames(sRaw1, dResampledCsvs, iChunkRows=50)
+    dBefore = dict([(sFile, sReadFile(sFile)) for sFile in dResampledCsvs.values()])
+
+    # rows appended out of order make the append fail after the truncation
+    vWriteRaw1Min(sRaw1, pandas.date_range('2014-01-01 03:20', periods=20, freq='T')
+                  .append(pandas.date_range('2014-01-01 01:00', periods=5, freq='T')),
+                  sMode='a')
+    tResult = tResampleJob(('EURUSD', '2014', sRaw1, dResampledCsvs, True,))
+    assert 'not sorted' in tResult[-1]
+    for sFile, sBefore in dBefore.items():
+        assert sReadFile(sFile) == sBefore
+
+def test_failed_resample_removes_files(tmpdir):
+    sRaw1 = str(tmpdir.join('raw1.csv'))
+    dResampledCsvs = {'5': str(tmpdir.join('5.csv'))}
+    vWriteRaw1Min(sRaw1, pandas.date_range('2014-01-01 01:00', periods=20, freq='T')
+                  .append(pandas.date_range('2014-01-01', periods=5, freq='T')))
+    tResult = tResampleJob(('EURUSD', '2014', sRaw1, dResampledCsvs, False,))
+    assert 'not sorted' in tResult[-1]
+    assert not os.path.exists(dResampledCsvs['5'])
+
+def mReadResampled(sCsv):
+    """Parse the resampled CSV file sCsv, as oReadMt4Csv does."""
+    mOhlc = pandas.read_csv(sCsv, names=['T', 'O', 'H', 'L', 'C'],
+                            dtype={'T': str, 'O': 'float64', 'H': 'float64',
+                                   'L': 'float64', 'C': 'float64'})
+    return mIndexByMt4Timestamps(mOhlc, 'T')
+
+def test_append_like_one_shot(tmpdir):
+    sRaw1 = str(tmpdir.join('raw1.csv'))
+    oIndex = oGappyIndex()
+    # the old data ends at 03:07 on the second day, inside a bar of every timeframe
+    iSplit = oIndex.searchsorted(pandas.Timestamp('2014-01-02 03:08'))
+    vWriteRaw1Min(sRaw1, oIndex[:iSplit])
+    lTimeFrames = ['5', '15', '60', '1440']
+    dResampledCsvs = dict([(sTimeFrame, str(tmpdir.join(sTimeFrame + '.csv')))
+                           for sTimeFrame in lTimeFrames])
+    vResample1MinFrames(sRaw1, dResampledCsvs, iChunkRows=50)
+    for sCsv in dResampledCsvs.values():
+        vWriteFeedCache(sCsv, mReadResampled(sCsv))
+
+    vWriteRaw1Min(sRaw1, oIndex[iSplit:], sMode='a')
+    vResample1MinAppend(sRaw1, dResampledCsvs, iChunkRows=50)
+    for sTimeFrame in lTimeFrames:
+        sCsv = dResampledCsvs[sTimeFrame]
+        sExpected = sOneShotCsv(sRaw1, sTimeFrame, str(tmpdir.join('expected.csv')))
+        assert sReadFile(sCsv) == sExpected, sTimeFrame
+        # the feed cache was brought up to date, not left stale
+        assert bFeedCacheValid(sCsv)
+        pandas.util.testing.assert_frame_equal(oReadFeedCache(sCsv), mReadResampled(sCsv),
+                                               check_names=False)
+
+def mHstBars(iBars):
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    aOpen = 1.3 + numpy.arange(iBars) / 1000.0
+    return pandas.DataFrame(dict(O=aOpen, H=aOpen + 0.002, L=aOpen - 0.001,
+                                 C=aOpen + 0.0005),
+                            index=oIndex, columns=lOHLC_COLUMNS)
+
+def vWriteHst(sHstFile, iVersion, mBars):
+    """Write mBars as a Metatrader history file of version iVersion."""
+    aHeader = numpy.zeros(1, dtype=oHST_HEADER_DTYPE)
+    aHeader['version'] = iVersion
+    aHeader['symbol'] = 'EURUSD'
+    aHeader['period'] = 60
+    aHeader['digits'] = 5
+    aRecords = numpy.zeros(len(mBars), dtype=dHST_DTYPES[iVersion])
+    aRecords['ctm'] = mBars.index.asi8 // 10**9
+    for sColumn in lOHLC_COLUMNS:
+        aRecords[sColumn] = mBars[sColumn].values
+    with open(sHstFile, 'wb') as oFd:
+        aHeader.tofile(oFd)
+        aRecords.tofile(oFd)
+        # a record that is still being written is left out
+        oFd.write('\0' * 10)
+
+@pytest.mark.parametrize('iVersion', [400, 401])
+def test_oReadMt4Hst(tmpdir, iVersion):
+    sHstFile = str(tmpdir.join('EURUSD60.hst'))
+    mBars = mHstBars(50)
+    vWriteHst(sHstFile, iVersion, mBars)
+    assert dReadMt4HstHeader(sHstFile) == dict(iVersion=iVersion, sSymbol='EURUSD',
+                                               iPeriod=60, iDigits=5)
+    try:
+        mOhlc = oReadMt4Hst(sHstFile)
+        assert list(mOhlc.index) == list(mBars.index)
+        pandas.util.testing.assert_frame_equal(mOhlc, mBars, check_names=False)
+        # by position too: the high is not the low
+        assert list(mOhlc.iloc[:, 1]) == list(mBars.H)
+        # the version 401 prices are a view of the records, not a copy
+        iStride = dHST_DTYPES[iVersion].itemsize if iVersion == 401 else 8
+        assert mOhlc['H'].values.strides == (iStride,)
+
+        mFloat32 = oReadMt4Hst(sHstFile, sDtype='float32')
+        assert list(mFloat32.columns) == lOHLC_COLUMNS
+        assert numpy.allclose(mFloat32.values, mBars.values, atol=1e-6)
+    finally:
+        del oFEED_REGISTRY.oFeeds[oFEED_REGISTRY.sFingerprint(sHstFile)]
+
+@pytest.fixture
+def sResampledCsv(tmpdir):
+    """A resampled CSV file, and no feeds in oFEED_REGISTRY before or after."""
+    sRaw1 = str(tmpdir.join('raw1.csv'))
+    vWriteRaw1Min(sRaw1, pandas.date_range('2014-01-01', periods=600, freq='T'))
+    sCsv = str(tmpdir.join('60.csv'))
+    vResample1MinFrames(sRaw1, {'60': sCsv})
+    oFEED_REGISTRY.oFeeds.clear()
+    yield sCsv
+    oFEED_REGISTRY.oFeeds.clear()
+
+def mReadMt4Csv(oMonkeypatch, sCsv, bParsed):
+    """oReadMt4Csv, not from oFEED_REGISTRY, checking if it parsed sCsv."""
+    oFEED_REGISTRY.oFeeds.clear()
+    lParsed = []
+    oReadCsv = pandas.read_csv
+    def mReadCsv(*lArgs, **dArgs):
+        lParsed.append(1)
+        return oReadCsv(*lArgs, **dArgs)
+    with oMonkeypatch.context() as oPatch:
+        oPatch.setattr(pandas, 'read_csv', mReadCsv)
+        mOhlc = oReadMt4Csv(sCsv, '60', 'EURUSD')
+    assert bool(lParsed) == bParsed
+    return mOhlc
+
+def test_feed_cache(sResampledCsv, monkeypatch):
+    mFirst = mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True)
+    assert bFeedCacheValid(sResampledCsv)
+    mSecond = mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=False)
+    assert isinstance(_aRootOf(mSecond['O'].values), numpy.memmap)
+    pandas.util.testing.assert_frame_equal(mSecond, mFirst)
+
+def test_feed_cache_stale(sResampledCsv, monkeypatch):
+    mFirst = mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True)
+    # a new mtime
+    fMtime = os.stat(sResampledCsv).st_mtime
+    os.utime(sResampledCsv, (fMtime + 10, fMtime + 10))
+    assert not bFeedCacheValid(sResampledCsv)
+    pandas.util.testing.assert_frame_equal(mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True), mFirst)
+    assert bFeedCacheValid(sResampledCsv)
+    # a new size, with the same mtime
+    with open(sResampledCsv, 'a') as oFd:
+        oFd.write('2014-01-01 10:00:00,1.0,1.0,1.0,1.0\n')
+    os.utime(sResampledCsv, (fMtime + 10, fMtime + 10))
+    assert not bFeedCacheValid(sResampledCsv)
+    mThird = mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True)
+    assert len(mThird) == len(mFirst) + 1
+    pandas.util.testing.assert_frame_equal(mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=False), mThird)
+
+@pytest.mark.parametrize('sFile, sContents', [
+    # an interrupted write leaves no meta.json
+    ('meta.json', None),
+    ('meta.json', '{"iSize": '),
+    ('ohlc.npy', None),
+    ('ohlc.npy', 'not a numpy file'),
+    ('timestamp.npy', None),
+    ])
+def test_feed_cache_corrupt(sResampledCsv, monkeypatch, sFile, sContents):
+    mFirst = mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True)
+    sPath = os.path.join(sFeedCacheDir(sResampledCsv), sFile)
+    if sContents is None:
+        # truncated, or not there at all
+        if sFile == 'meta.json':
+            os.remove(sPath)
+        else:
+            with open(sPath, 'rb+') as oFd:
+                oFd.truncate(os.path.getsize(sPath) // 2)
+    else:
+        with open(sPath, 'w') as oFd:
+            oFd.write(sContents)
+    # the CSV file is parsed, and the cache made again
+    pandas.util.testing.assert_frame_equal(mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=True), mFirst)
+    pandas.util.testing.assert_frame_equal(mReadMt4Csv(monkeypatch, sResampledCsv, bParsed=False), mFirst)
+
+def test_lMakeResampleJobs(tmpdir):
+    sDir = str(tmpdir)
+    oIndex = pandas.date_range('2014-01-01', periods=10, freq='T')
+    for sFile in ['EURUSD1-2014.csv', 'EURUSD1-2015.csv', 'GBPUSD1-2014.csv']:
+        vWriteRaw1Min(os.path.join(sDir, sFile), oIndex)
+    tmpdir.join('EURUSD1-2014.txt').write('not a 1 minute file')
+    # this one is made already
+    sMade = os.path.join(sDir, 'EURUSD60-2014.csv')
+    tmpdir.join('EURUSD60-2014.csv').write('')
+
+    lJobs = lMakeResampleJobs(sDir, lSymbols=['EURUSD'])
+    assert [tJob[:2] for tJob in lJobs] == [('EURUSD', '2014'), ('EURUSD', '2015')]
+    assert sorted(lJobs[0][3].keys()) == ['1440', '240']
+    assert sorted(lJobs[1][3].keys()) == ['1440', '240', '60']
+    assert lJobs[0][2] == os.path.join(sDir, 'EURUSD1-2014.csv')
+    assert not lJobs[0][4]
+
+    lJobs = lMakeResampleJobs(sDir, lYears=['2014'], lTimeFrames=['60', '240'],
+                              bSinglePass=False)
+    assert [(tJob[0], tJob[3].keys()) for tJob in lJobs] == \
+        [('EURUSD', ['240']), ('GBPUSD', ['60']), ('GBPUSD', ['240'])]
+
+    # with bAppend, a file is only remade if it is older than its 1 minute file
+    fMtime = os.path.getmtime(os.path.join(sDir, 'EURUSD1-2014.csv'))
+    os.utime(sMade, (fMtime + 10, fMtime + 10))
+    lJobs = lMakeResampleJobs(sDir, lSymbols=['EURUSD'], lYears=['2014'],
+                              lTimeFrames=['60'], bAppend=True)
+    assert lJobs == []
+    os.utime(sMade, (fMtime - 10, fMtime - 10))
+    lJobs = lMakeResampleJobs(sDir, lSymbols=['EURUSD'], lYears=['2014'],
+                              lTimeFrames=['60'], bAppend=True)
+    assert lJobs == [('EURUSD', '2014', os.path.join(sDir, 'EURUSD1-2014.csv'),
+                      {'60': sMade}, True,)]
+
+def test_lResampleParallel(tmpdir):
+    sDir = str(tmpdir)
+    oIndex = pandas.date_range('2014-01-01', periods=300, freq='T')
+    vWriteRaw1Min(os.path.join(sDir, 'AUDUSD1-2014.csv'), oIndex)
+    # unsorted, so its job fails
+    vWriteRaw1Min(os.path.join(sDir, 'EURUSD1-2014.csv'), oIndex[::-1])
+    vWriteRaw1Min(os.path.join(sDir, 'GBPUSD1-2014.csv'), oIndex)
+    lJobs = lMakeResampleJobs(sDir, lTimeFrames=['5', '60'])
+    oFd = open(str(tmpdir.join('log.txt')), 'w')
+    lResults = lResampleParallel(lJobs, iWorkers=1, oFd=oFd)
+    oFd.close()
+    assert [(tResult[0], tResult[2]) for tResult in lResults] == \
+        [('AUDUSD', ['5', '60']), ('EURUSD', ['5', '60']), ('GBPUSD', ['5', '60'])]
+    assert [bool(tResult[-1]) for tResult in lResults] == [False, True, False]
+    assert 'not sorted' in lResults[1][-1]
+    # the jobs after the failed one were made, and it left no files
+    for sSymbol, bMade in [('AUDUSD', True), ('EURUSD', False), ('GBPUSD', True)]:
+        for sTimeFrame in ['5', '60']:
+            sFile = os.path.join(sDir, sSymbol + sTimeFrame + '-2014.csv')
+            assert os.path.exists(sFile) == bMade
+    assert "ERROR: EURUSD 2014 5,60 failed" in tmpdir.join('log.txt').read()
@@ -0,0 +1,82 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check that the servings of a ChefsOven are made once per cook,
+and that a float32 feed gives float64 trades and equity.
+"""
+
+import os
+
+import numpy
+import pandas
+
+from OpenTrader.Omlettes.PybacktestChef import ChefsOven
+from OpenTrader.Omlettes.Recipe import Recipe
+from OpenTrader.Omlettes.Omlette import Omlette
+from OpenTrader.OTBackTest import dSERVINGS_HDF, gServe
+from OpenTrader.PandasMt4 import mCompactOhlc
+
+def oRandomOven(iBars, iSeed, sDtype='float64'):
+    oRandom = numpy.random.RandomState(iSeed)
+    oIndex = pandas.date_range('2014-01-01', periods=iBars, freq='H')
+    aOpen = 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+    mOhlc = pandas.DataFrame(dict(O=aOpen, C=aOpen), index=oIndex, columns=['O', 'C'])
+    mOhlc = mCompactOhlc(mOhlc, sDtype)
+    dDataObj = dict([(sKey, pandas.Series(oRandom.rand(iBars) < 0.05, index=oIndex))
+                     for sKey in ['buy', 'sell', 'short', 'cover']])
+    return ChefsOven(mOhlc, dDataObj)
+
+class CountingRecipe(Recipe):
+    def __init__(self):
+        Recipe.__init__(self)
+        self.dCounts = dict()
+    def vCount(self, sServing):
+        self.dCounts[sServing] = self.dCounts.get(sServing, 0) + 1
+    def mSignals(self, oBt):
+        self.vCount('signals')
+        return Recipe.mSignals(self, oBt)
+    def mTrades(self, oBt):
+        self.vCount('trades')
+        return Recipe.mTrades(self, oBt)
+    def rPositions(self, oBt, init_pos=0):
+        self.vCount('positions')
+        return Recipe.rPositions(self, oBt, init_pos=init_pos)
+    def rEquity(self, oBt):
+        self.vCount('equity')
+        return Recipe.rEquity(self, oBt)
+
+def test_gServing():
+    oBt = oRandomOven(2000, iSeed=1)
+    oRecipe = CountingRecipe()
+    oOm = Omlette(oFd=open(os.devnull, 'w'))
+    oFd = open(os.devnull, 'w')
+    dFirst = dict()
+    for sServing in dSERVINGS_HDF.keys():
+        dFirst[sServing] = gServe(oBt, sServing, oRecipe, oOm, oFd=oFd)
+    for sServing in dSERVINGS_HDF.keys():
+        assert gServe(oBt, sServing, oRecipe, oOm, oFd=oFd) is dFirst[sServing]
+        assert getattr(oBt, sServing) is dFirst[sServing]
+        assert oOm.dStageKeys[dSERVINGS_HDF[sServing]] is oBt
+    # the trades made the positions, so the recipe did not make them again
+    assert oRecipe.dCounts == dict(signals=1, trades=1, equity=1)
+
+    # the same servings as the oven makes on its own
+    oOther = oRandomOven(2000, iSeed=1)
+    pandas.util.testing.assert_frame_equal(oOther.trades, oBt.trades)
+    pandas.util.testing.assert_series_equal(oOther.equity, oBt.equity)
+
+def test_float32_feed():
+    # the signals do not depend on the prices, so both ovens trade the same bars
+    oBt64 = oRandomOven(2000, iSeed=2)
+    oBt32 = oRandomOven(2000, iSeed=2, sDtype='float32')
+    assert oBt32.ohlc['O'].dtype == numpy.float32
+    for oBt in [oBt64, oBt32]:
+        assert oBt.trades['price'].dtype == numpy.float64
+        assert oBt.equity.dtype == numpy.float64
+    mTrades = Recipe().mTrades(oBt32)
+    assert mTrades['price'].dtype == numpy.float64
+    pandas.util.testing.assert_frame_equal(mTrades, oBt32.trades)
+    assert list(oBt32.equity.index) == list(oBt64.equity.index)
+    assert numpy.allclose(oBt32.equity.values, oBt64.equity.values, rtol=0, atol=1e-5)
+    assert numpy.allclose(oBt32.equity.cumsum().values, oBt64.equity.cumsum().values,
+                          rtol=0, atol=1e-5)
@@ -0,0 +1,216 @@
+# -*-mode: python; py-indent-offset: 4; indent-tabs-mode: nil; encoding: utf-8-dos; coding: utf-8 -*-
+
+"""
+Check the numpy indicators against loops that follow TA-Lib's code,
+and against TA-Lib itself when it is installed.
+"""
+
+import warnings
+
+import numpy
+import pandas
+import pytest
+
+from OpenTrader import indicators
+from OpenTrader.indicators import rolling
+
+iBARS = 2000
+
+def dRandomOhlcv(iBars=iBARS, iSeed=1):
+    oRandom = numpy.random.RandomState(iSeed)
+    aClose = 1.3 + oRandom.normal(scale=1e-3, size=iBars).cumsum()
+    aOpen = numpy.r_[aClose[0], aClose[:-1]]
+    aHigh = numpy.maximum(aOpen, aClose) + oRandom.exponential(5e-4, size=iBars)
+    aLow = numpy.minimum(aOpen, aClose) - oRandom.exponential(5e-4, size=iBars)
+    # some flat bars, and repeated closes, for the ties and the zero divisions
+    aFlat = oRandom.rand(iBars) < 0.02
+    aHigh[aFlat] = aLow[aFlat] = aOpen[aFlat] = aClose[aFlat]
+    aClose[oRandom.rand(iBars) < 0.02] = numpy.round(aClose[0], 2)
+    aVolume = oRandom.randint(1, 1000, size=iBars).astype('float64')
+    return dict(open=aOpen, high=aHigh, low=aLow, close=aClose, volume=aVolume)
+
+def aWindowLoop(aReal, iWindow, oFun):
+    aRetval = numpy.empty(len(aReal))
+    aRetval[:] = numpy.nan
+    for i in range(iWindow - 1, len(aReal)):
+        aRetval[i] = oFun(aReal[i - iWindow + 1:i + 1])
+    return aRetval
+
+def aEmaLoop(aReal, iPeriod, iStart=None):
+    """TA-Lib's EMA: seeded with the mean of the iPeriod values up to iStart."""
+    if iStart is None:
+        iStart = iPeriod - 1
+    fK = 2.0 / (iPeriod + 1)
+    aRetval = numpy.empty(len(aReal))
+    aRetval[:] = numpy.nan
+    aRetval[iStart] = aReal[iStart - iPeriod + 1:iStart + 1].mean()
+    for i in range(iStart + 1, len(aReal)):
+        aRetval[i] = (aReal[i] - aRetval[i - 1]) * fK + aRetval[i - 1]
+    return aRetval
+
+def vAssertClose(aActual, aExpected, rtol=1e-9, atol=1e-9):
+    numpy.testing.assert_array_equal(numpy.isnan(aActual), numpy.isnan(aExpected))
+    aValid = ~numpy.isnan(aExpected)
+    numpy.testing.assert_allclose(aActual[aValid], aExpected[aValid], rtol=rtol, atol=atol)
+
+@pytest.mark.parametrize('iWindow', [1, 2, 7, 30, iBARS, iBARS + 1])
+def test_rolling(iWindow):
+    aReal = dRandomOhlcv()['close']
+    aReal[100] = numpy.nan
+    vAssertClose(rolling.aRollingSum(aReal, iWindow), aWindowLoop(aReal, iWindow, numpy.sum))
+    vAssertClose(rolling.aRollingMax(aReal, iWindow), aWindowLoop(aReal, iWindow, numpy.max))
+    vAssertClose(rolling.aRollingMin(aReal, iWindow), aWindowLoop(aReal, iWindow, numpy.min))
+    vAssertClose(rolling.aRollingVar(aReal, iWindow), aWindowLoop(aReal, iWindow, numpy.var))
+
+@pytest.mark.parametrize('iPeriod', [2, 5, 30])
+def test_overlap(iPeriod):
+    aClose = dRandomOhlcv()['close']
+    vAssertClose(indicators.SMA(aClose, iPeriod), aWindowLoop(aClose, iPeriod, numpy.mean))
+    vAssertClose(indicators.EMA(aClose, iPeriod), aEmaLoop(aClose, iPeriod))
+    aWeights = numpy.arange(1, iPeriod + 1, dtype='float64')
+    vAssertClose(indicators.WMA(aClose, iPeriod),
+                 aWindowLoop(aClose, iPeriod, lambda a: (a * aWeights).sum() / aWeights.sum()))
+    aTriangle = numpy.minimum(numpy.arange(1, iPeriod + 1), numpy.arange(iPeriod, 0, -1))
+    aTriangle = numpy.minimum(aTriangle, (iPeriod + 2) // 2).astype('float64')
+    vAssertClose(indicators.TRIMA(aClose, iPeriod),
+                 aWindowLoop(aClose, iPeriod, lambda a: (a * aTriangle).sum() / aTriangle.sum()))
+    aEma = aEmaLoop(aClose, iPeriod)
+    aEma2 = aEma.copy()
+    aEma2[2 * (iPeriod - 1):] = aEmaLoop(aEma[iPeriod - 1:], iPeriod)[iPeriod - 1:]
+    aEma2[:2 * (iPeriod - 1)] = numpy.nan
+    vAssertClose(indicators.DEMA(aClose, iPeriod), 2 * aEma - aEma2)
+    aUpper, aMiddle, aLower = indicators.BBANDS(aClose, iPeriod, 2., 1.5)
+    aStd = aWindowLoop(aClose, iPeriod, numpy.std)
+    vAssertClose(aUpper, aMiddle + 2 * aStd)
+    vAssertClose(aLower, aMiddle - 1.5 * aStd)
+    vAssertClose(indicators.MIDPOINT(aClose, iPeriod),
+                 aWindowLoop(aClose, iPeriod, lambda a: (a.max() + a.min()) / 2))
+
+def test_MA():
+    aClose = dRandomOhlcv()['close']
+    for iMatype in range(6):
+        assert numpy.isnan(indicators.MA(aClose, 10, iMatype)).sum() == \
+               indicators.overlap.iMaLookback(10, iMatype)
+    vAssertClose(indicators.MA(aClose, 1), aClose)
+    with pytest.raises(ValueError) as oExc:
+        indicators.MA(aClose, 10, indicators.MA_Type.T3)
+    assert 'SMA=0' in str(oExc.value) and 'TRIMA=5' in str(oExc.value)
+
+@pytest.mark.parametrize('iPeriod', [2, 14])
+def test_RSI(iPeriod):
+    aClose = dRandomOhlcv()['close']
+    aDelta = numpy.diff(aClose)
+    aRetval = numpy.empty(len(aClose))
+    aRetval[:] = numpy.nan
+    fUp = aDelta[:iPeriod][aDelta[:iPeriod] > 0].sum() / iPeriod
+    fDown = -aDelta[:iPeriod][aDelta[:iPeriod] < 0].sum() / iPeriod
+    aRetval[iPeriod] = 100 * fUp / (fUp + fDown)
+    for i in range(iPeriod + 1, len(aClose)):
+        fDelta = aDelta[i - 1]
+        fUp = (fUp * (iPeriod - 1) + max(fDelta, 0)) / iPeriod
+        fDown = (fDown * (iPeriod - 1) + max(-fDelta, 0)) / iPeriod
+        aRetval[i] = 100 * fUp / (fUp + fDown) if fUp + fDown else 0
+    vAssertClose(indicators.RSI(aClose, iPeriod), aRetval)
+
+def test_MACD():
+    aClose = dRandomOhlcv()['close']
+    aMacd, aSignal, aHist = indicators.MACD(aClose, 12, 26, 9)
+    aExpected = aEmaLoop(aClose, 12, iStart=25) - aEmaLoop(aClose, 26)
+    aExpectedSignal = aExpected.copy()
+    aExpectedSignal[25:] = aEmaLoop(aExpected[25:], 9)
+    aExpected[:33] = numpy.nan
+    vAssertClose(aMacd, aExpected)
+    vAssertClose(aSignal, aExpectedSignal)
+    vAssertClose(aHist, aExpected - aExpectedSignal)
+
+def test_momentum():
+    dBars = dRandomOhlcv()
+    aHigh, aLow, aClose = dBars['high'], dBars['low'], dBars['close']
+    vAssertClose(indicators.MOM(aClose, 10)[10:], aClose[10:] - aClose[:-10])
+    vAssertClose(indicators.ROCR(aClose, 10)[10:], aClose[10:] / aClose[:-10])
+    aHighest = aWindowLoop(aHigh, 14, numpy.max)
+    aLowest = aWindowLoop(aLow, 14, numpy.min)
+    aRange = aHighest - aLowest
+    aRange[aRange == 0] = numpy.inf
+    vAssertClose(indicators.WILLR(aHigh, aLow, aClose, 14), -100 * (aHighest - aClose) / aRange)
+    aFastK = 100 * (aClose - aWindowLoop(aLow, 5, numpy.min)) / \
+             (aWindowLoop(aHigh, 5, numpy.max) - aWindowLoop(aLow, 5, numpy.min))
+    aFastK[numpy.isinf(aFastK)] = 0
+    aSlowK = aWindowLoop(aFastK, 3, numpy.mean)
+    aSlowD = aWindowLoop(aSlowK, 3, numpy.mean)
+    aSlowK[:8] = numpy.nan
+    aActualK, aActualD = indicators.STOCH(aHigh, aLow, aClose)
+    vAssertClose(aActualK, aSlowK)
+    vAssertClose(aActualD, aSlowD)
+    aTypical = (aHigh + aLow + aClose) / 3
+    vAssertClose(indicators.CCI(aHigh, aLow, aClose, 14),
+                 aWindowLoop(aTypical, 14, lambda a: (a[-1] - a.mean()) /
+                             (0.015 * numpy.abs(a - a.mean()).mean())))
+    aDown, aUp = indicators.AROON(aHigh, aLow, 14)
+    vAssertClose(aUp, aWindowLoop(aHigh, 15, lambda a: 100.0 *
+                                  (14 - (14 - numpy.flatnonzero(a == a.max())[-1])) / 14))
+    vAssertClose(aDown, aWindowLoop(aLow, 15, lambda a: 100.0 *
+                                    (14 - (14 - numpy.flatnonzero(a == a.min())[-1])) / 14))
+
+def test_volatility_and_volume():
+    dBars = dRandomOhlcv()
+    aHigh, aLow, aClose, aVolume = dBars['high'], dBars['low'], dBars['close'], dBars['volume']
+    aRange = numpy.r_[numpy.nan, numpy.maximum(aHigh[1:], aClose[:-1]) -
+                      numpy.minimum(aLow[1:], aClose[:-1])]
+    vAssertClose(indicators.TRANGE(aHigh, aLow, aClose), aRange)
+    aAtr = numpy.empty(len(aClose))
+    aAtr[:] = numpy.nan
+    aAtr[14] = aRange[1:15].mean()
+    for i in range(15, len(aClose)):
+        aAtr[i] = (aAtr[i - 1] * 13 + aRange[i]) / 14
+    vAssertClose(indicators.ATR(aHigh, aLow, aClose, 14), aAtr)
+    vAssertClose(indicators.STDDEV(aClose, 5, 2.), 2 * aWindowLoop(aClose, 5, numpy.std))
+    aObv = numpy.cumsum(numpy.r_[aVolume[0], numpy.sign(numpy.diff(aClose)) * aVolume[1:]])
+    vAssertClose(indicators.OBV(aClose, aVolume), aObv)
+    aHL = aHigh - aLow
+    aHL[aHL == 0] = numpy.inf
+    aAd = numpy.cumsum(((aClose - aLow) - (aHigh - aClose)) / aHL * aVolume)
+    vAssertClose(indicators.AD(aHigh, aLow, aClose, aVolume), aAd)
+    lEmas = []
+    for iPeriod in (3, 10):
+        aEma = aAd.copy()
+        for i in range(1, len(aAd)):
+            aEma[i] = (aAd[i] - aEma[i - 1]) * 2.0 / (iPeriod + 1) + aEma[i - 1]
+        lEmas.append(aEma)
+    aAdosc = lEmas[0] - lEmas[1]
+    aAdosc[:9] = numpy.nan
+    vAssertClose(indicators.ADOSC(aHigh, aLow, aClose, aVolume), aAdosc, atol=1e-6)
+
+def test_oGetFunction():
+    assert indicators.oGetFunction('SMA', 'numpy') is indicators.SMA
+    if indicators.talib is None:
+        assert indicators.oGetFunction('SMA') is indicators.SMA
+        with pytest.raises(AssertionError):
+            indicators.oBackend('talib')
+
+def tCall(oModule, sName, dBars):
+    if sName in ('MA', 'SMA', 'EMA', 'WMA', 'DEMA', 'TEMA', 'TRIMA', 'BBANDS',
+                 'MIDPOINT', 'RSI', 'CMO', 'MOM', 'ROC', 'ROCP', 'ROCR', 'ROCR100',
+                 'MACD', 'APO', 'PPO', 'VAR', 'STDDEV', 'MAX', 'MIN', 'SUM'):
+        gRetval = getattr(oModule, sName)(dBars['close'])
+    elif sName in ('MIDPRICE', 'AROON', 'AROONOSC', 'MEDPRICE'):
+        gRetval = getattr(oModule, sName)(dBars['high'], dBars['low'])
+    elif sName == 'OBV':
+        gRetval = oModule.OBV(dBars['close'], dBars['volume'])
+    elif sName in ('AD', 'ADOSC'):
+        gRetval = getattr(oModule, sName)(dBars['high'], dBars['low'], dBars['close'],
+                                          dBars['volume'])
+    elif sName == 'AVGPRICE':
+        gRetval = oModule.AVGPRICE(dBars['open'], dBars['high'], dBars['low'], dBars['close'])
+    else:
+        gRetval = getattr(oModule, sName)(dBars['high'], dBars['low'], dBars['close'])
+    if not isinstance(gRetval, tuple):
+        gRetval = (gRetval,)
+    return gRetval
+
+@pytest.mark.parametrize('sName', indicators.lFUNCTIONS)
+def test_against_talib(sName):
+    talib = pytest.importorskip('talib')
+    dBars = dRandomOhlcv()
+    for aActual, aExpected in zip(tCall(indicators, sName, dBars), tCall(talib, sName, dBars)):
+        vAssertClose(aActual, aExpected, rtol=1e-6, atol=1e-6)